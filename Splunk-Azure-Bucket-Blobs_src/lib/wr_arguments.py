@@ -39,7 +39,7 @@ def Arguments():
 	parser.add_argument('--file', type=open, action=LoadFromFile)
 	parser.add_argument("-do", "--detailed_output", type=str2bool, nargs='?', const=True, default=False, required=False, help="True to out more verbose console messages. Doesn't affect logging verbosity.")
 	parser.add_argument("-lco", "--list_create_output", type=str2bool, nargs='?', const=True, default=True, required=False, help="True to out more verbose info during the list creation portion which can take a long time.")
-	parser.add_argument("-cs", "--connect_string", nargs='?', default='', required=True, help="Full connection string to blob storage")
+	parser.add_argument("-cs", "--connect_string", nargs='+', default=[], required=True, help="Full connection string to blob storage. Several (space separated, each in quotes) to restore from more than one storage account at once.")
 	parser.add_argument("-dl", "--dest_download_loc_root", nargs='?', default='./blob_downloads/', required=False, help="Full path to root location to download all the blobs. Blobs will retain THEIR file structure on top of this root. Default: ./blob_downloads")
 	parser.add_argument("-tc", "--thread_count", type=checkPositive, nargs='?', default=10, required=False, help="Amount of download threads to run simultaneously.")
 	parser.add_argument("-sa", "--standalone", type=str2bool, nargs='?', const=True, default=False,  required=False, help="True is standalone Splunk, False for idx cluster.")
@@ -60,6 +60,41 @@ def Arguments():
 	parser.add_argument("-dm", "--debug_modules", type=str2bool, nargs='?', const=True, default=False,  required=False, help="Will enable deep level debug on all the modules that make up the script. Enable if getting errors, to help dev pinpoint.")
 	parser.add_argument("-woflo", "--write_out_full_list_only", type=str2bool, nargs='?', const=True, default=False,  required=False, help="True will write out the entire list for all peers to a single CSV and do nothing else.")
 	parser.add_argument("-scsv", "--skip_to_csv_load", type=str2bool, nargs='?', const=True, default=False,  required=False, help="If True, it won't attempt to download latest. Will resume from CSV directly.")
+	parser.add_argument("-dwt", "--disk_write_threads", type=checkPositive, nargs='?', default=2, required=False, help="Writer threads PER destination disk/device. Download threads hand filled buffers to these, so -tc can go up without more writers thrashing the disk. 0 writes inline on the download thread.")
+	parser.add_argument("-mbm", "--memory_budget_mb", type=checkPositive, nargs='?', default=512, required=False, help="Global cap (MB) on downloaded-but-not-yet-written data shared by ALL download threads. Threads wait when it's spent. 0 for unlimited.")
+	parser.add_argument("-wm", "--write_mode", nargs='?', default='buffered', choices=['buffered', 'dontneed', 'direct'], required=False, help="buffered = normal writes. dontneed = sync and drop written pages from page cache as we go so splunkd's cached tsidx/journal pages aren't evicted (use on live indexers). direct = O_DIRECT where aligned, dontneed for the rest.")
+	parser.add_argument("-bw", "--bandwidth_limit_mbps", type=checkPositive, nargs='?', default=0, required=False, help="Cap on combined download rate in MB/s across all threads. 0 for unlimited.")
+	parser.add_argument("-slt", "--splunk_load_throttle", type=str2bool, nargs='?', const=True, default=False,  required=False, help="True to poll the LOCAL splunkd's cpu and indexing queues and scale download threads/bandwidth down when it's busy, back up when idle. Uses -spu/-spw.")
+	parser.add_argument("-lsp", "--local_splunk_port", type=checkPositive, nargs='?', default=8089, required=False, help="Management port of the local splunkd, used by -slt.")
+	parser.add_argument("-slti", "--splunk_load_poll_sec", type=checkPositive, nargs='?', default=30, required=False, help="Seconds between local splunkd load checks for -slt.")
+	parser.add_argument("-sltc", "--splunk_load_cpu_pct", type=checkPositive, nargs='?', default=80, required=False, help="Host cpu percent (per splunkd) at which -slt backs downloads off. Scales back up under half of this.")
+	parser.add_argument("-sltq", "--splunk_load_queue_pct", type=checkPositive, nargs='?', default=70, required=False, help="Fullest indexing queue percent at which -slt backs downloads off. Scales back up under half of this.")
+	parser.add_argument("-sw", "--stall_window_sec", type=checkPositive, nargs='?', default=300, required=False, help="Seconds a download can go without receiving a single byte before it's cancelled and requeued (resumes where it got to). 0 to disable.")
+	parser.add_argument("-tsm", "--tail_split_mb", type=checkPositive, nargs='?', default=64, required=False, help="Once nothing is left waiting to download, idle threads help in-flight downloads with at least this many MB left by pulling ranges of the same blob. 0 to disable.")
+	parser.add_argument("-rw", "--range_window", type=checkPositive, nargs='?', default=4, required=False, help="Ranged GETs (4MB each) in flight per download, so one big blob isn't fetched a range at a time. Each download thread can have this many connections open. 1 for one at a time.")
+	parser.add_argument("-dd", "--dedupe", type=str2bool, nargs='?', const=True, default=False,  required=False, help="True downloads each distinct blob content (content_md5 + size) once and reflinks the other copies to it (copies it where the filesystem can't reflink - never hard links, so a rebuild / fsck of one bucket can't change its copies). Blobs without an md5 are always downloaded.")
+	parser.add_argument("-apc", "--account_concurrency", type=checkPositive, nargs='?', default=0, required=False, help="Max concurrent GETs against any ONE storage account (per -cs). Keeps one account at its throughput limit from tying up every thread. 0 for no cap beyond -tc.")
+	parser.add_argument("-srs", "--secondary_read_share", type=checkPositive, nargs='?', default=0, required=False, help="RA-GRS accounts only: percent (0-100) of downloads to read from the <account>-secondary endpoint, spreading load off the primary. Falls back to primary on errors or replication lag. 0 for off.")
+	parser.add_argument("-srl", "--secondary_max_lag_sec", type=checkPositive, nargs='?', default=900, required=False, help="Stop reading from the secondary while geo replication is more than this many seconds behind (last sync time).")
+	parser.add_argument("-rht", "--rehydrate_tier", nargs='?', default='Hot', choices=['Hot', 'Cool', 'Off'], required=False, help="Blobs listed in the Archive tier get a bulk rehydration request to this tier and are downloaded as each one comes back, while the rest download. Off to leave them alone (they'll fail to download).")
+	parser.add_argument("-rhp", "--rehydrate_priority", nargs='?', default='Standard', choices=['Standard', 'High'], required=False, help="Rehydration priority - Standard can take up to 15 hours, High is faster and costs more.")
+	parser.add_argument("-ct", "--copy_to", nargs='?', default='', required=False, help="Connection string of another storage account. Listed blobs are copied there server side (same container / name) instead of downloaded. Listing, filters and Bucketeer distribution work the same and the CSV report gets the copy status. Blank to download.")
+	parser.add_argument("-th", "--thaw", type=str2bool, nargs='?', const=True, default=False, required=False, help="True moves each bucket into its index's thaweddb (-thp) and rebuilds it (-trc) as soon as all its files are downloaded, while the rest keep downloading.")
+	parser.add_argument("-thp", "--thaw_path", nargs='?', default='{splunk_home}var/lib/splunk/{index}/thaweddb/', required=False, help="Where thawed buckets go. Fields: {splunk_home} {index} {bucket_id}")
+	parser.add_argument("-trc", "--thaw_rebuild_cmd", nargs='?', default='{splunk_home}bin/splunk rebuild {bucket_path} {index}', required=False, help="Command run on each thawed bucket (no shell, non zero exit = failed). Fields: {splunk_home} {index} {bucket_id} {bucket_path}. Blank to only move buckets.")
+	parser.add_argument("-thc", "--thaw_concurrency", type=checkPositive, nargs='?', default=2, required=False, help="How many buckets to thaw / rebuild at once.")
+	parser.add_argument("-rc", "--reconcile", type=str2bool, nargs='?', const=True, default=False, required=False, help="True scans the download location at startup and marks files that are already there (same path and size) SUCCESS instead of downloading them again - for a lost CSV or one from another peer. Size only unless -rcm, so a truncated or stale file of the right size is trusted - off by default.")
+	parser.add_argument("-rcm", "--reconcile_md5", type=str2bool, nargs='?', const=True, default=False, required=False, help="True also checks the md5 of files found by -rc against azure's content_md5 (reads every one of them, slower).")
+	parser.add_argument('-pi', '--priority_indexes', nargs='*', default=[], required=False, help="Index names (space separated) whose buckets are downloaded before everything else, in the order given, i.e: cisco firewall")
+	parser.add_argument("-pas", "--priority_aging_sec", type=checkPositive, nargs='?', default=0, required=False, help="With -pi, each step down the -pi list is worth this many seconds of waiting, so the other indexes still get slots. 0 for strict order.")
+	parser.add_argument("-tpl", "--throughput_log_sec", type=checkPositive, nargs='?', default=60, required=False, help="Every this many seconds the smoothed download rate (MB/s), bytes done / remaining and ETA go to the log. 0 for off (still on the console).")
+	parser.add_argument("-dds", "--drain_deadline_sec", type=checkPositive, nargs='?', default=120, required=False, help="On Ctrl-C / SIGTERM no new downloads start and running ones get this long to finish, then they're checkpointed (resume point saved) so the next start picks them up.")
+	parser.add_argument("-sp", "--stream_pipeline", type=str2bool, nargs='?', const=True, default=False, required=False, help="Standalone only. True lists, filters, plans and queues each blob as it comes back from azure (list -> filter -> plan -> download) so downloads start on the first page of the listing instead of after the whole plan is built. -dd and -th aren't used with it (they need the whole list).")
+	parser.add_argument("-spb", "--stream_pipeline_buffer", type=checkPositive, nargs='?', default=1000, required=False, help="With -sp, the most blobs waiting between any two stages and in the download queue. The listing waits when they're full, so memory stays flat however many blobs there are.")
+	parser.add_argument("-ctl", "--control_port", type=checkPositive, nargs='?', default=0, required=False, help="Port (on 127.0.0.1 only) for live control of the run with sabbctl.py - status, threads, bandwidth, index priority, pause / resume / drain. 0 for off.")
+	parser.add_argument("-fs", "--fair_share", nargs='?', default='Off', choices=['index', 'container', 'Off'], required=False, help="index = downloads take turns between splunk indexes (deficit round robin on bytes), container = between containers, so one huge index can't hold every download slot. -pi indexes and retries still go first.")
+	parser.add_argument('-fsw', '--fair_share_weights', nargs='*', default=[], required=False, help="With -fs, index (or container) weights as name=weight (space separated), everything else is 1, i.e: cisco=4 _internal=0.5")
+	parser.add_argument("-sdb", "--status_db", type=str2bool, nargs='?', const=True, default=True, required=False, help="True keeps the report's download status in sqlite (<report csv>.db) and writes the CSV out from it at exit and on sabbctl.py export - no rewrite of the whole CSV on every update. False updates the CSV itself (slow on big reports).")
 	parser.add_argument("-ta", "--test_amount", type=checkPositive, nargs='?', default=0, required=False, help="Throw a number in here and azure scrape will stop in each container at this number (lets you test quickly before running on full amount) 0 for real run.")
 ############## RUNTIME
 Arguments()
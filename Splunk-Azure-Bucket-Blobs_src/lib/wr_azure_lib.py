@@ -8,16 +8,397 @@
 ##############################################################################################################
 
 ### IMPORTS ###########################################
-import os, datetime, sys, re
-from time import time
+import os, datetime, sys, re, threading
+from time import time, sleep
 
 from . import wr_logging as log
+from . import wr_transfer_progress as wrtp
 
 from pathlib import Path
 from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient, __version__
+from azure.storage.blob import generate_blob_sas, BlobSasPermissions
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError
+
+### FUNCTIONS ###########################################
+
+class BlobChanged(Exception):
+	'''
+	Raised by a ranged download when the blob was overwritten (etag) or resized after it was listed / its resume point was saved
+	'''
+	pass
+
+# pull the account name out of a connection string
+def accountNameFromConnectString(connect_str:str) -> str:
+	'''
+	AccountName=xxx if it's there, otherwise the host of BlobEndpoint=, otherwise '' (SAS only strings etc)
+	'''
+	for part in str(connect_str).split(';'):
+		if part.lower().startswith('accountname='):
+			return(part.split('=', 1)[1])
+	for part in str(connect_str).split(';'):
+		if part.lower().startswith('blobendpoint='):
+			return(part.split('=', 1)[1].split('//')[-1].split('.')[0].strip('/'))
+	return('')
+
+# kwargs for a service client with a connection pool big enough for all the threads that share it
+def pooledTransportKwargs(max_connections:int) -> dict:
+	'''
+	requests defaults to 10 pooled connections per host - more threads than that on one account just open and drop sockets
+	Returns {} (SDK default transport) if the requests transport isn't available
+	'''
+	try:
+		import requests
+		from azure.core.pipeline.transport import RequestsTransport
+		session = requests.Session()
+		adapter = requests.adapters.HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+		session.mount('https://', adapter)
+		session.mount('http://', adapter)
+		return({'transport': RequestsTransport(session=session, session_owner=False)})
+	except Exception:
+		return({})
 
 ### CLASSES ###########################################
 
+class StorageAccount():
+	'''
+	One storage account (connection string) the restore reads from.
+	Holds its own service client - and with it its own connection pool - plus an optional cap on concurrent GETs against it,
+	so one account hitting its throughput limit doesn't hold up the others.
+
+	Optional: secondary_share=0-100 sends that percent of downloads to the RA-GRS <account>-secondary endpoint.
+		The secondary is dropped (back to primary only) for secondary_cooldown_sec after secondary_max_errors errors in a row,
+		or while checkReplication() sees geo replication not live / lagging more than secondary_max_lag_sec.
+	'''
+	def __init__(self, connect_str:str, index=0, max_connections=20, max_concurrent=0, secondary_share=0, secondary_max_lag_sec=900, secondary_max_errors=3, secondary_cooldown_sec=300):
+		self.connect_str = connect_str
+		self.name = accountNameFromConnectString(connect_str) or 'account_' + str(index)
+		self.max_concurrent = max_concurrent # 0 = no cap beyond the download thread count
+		self.limiter = None
+		if max_concurrent > 0:
+			self.limiter = threading.BoundedSemaphore(max_concurrent)
+		self.active = 0 # GETs in flight against this account right now
+		self.active_lock = threading.Lock()
+		self.service_client = BlobServiceClient.from_connection_string(connect_str, **pooledTransportKwargs(max(max_connections, max_concurrent)))
+		# RA-GRS secondary
+		self.secondary_share = max(0, min(100, secondary_share))
+		self.secondary_max_lag_sec = secondary_max_lag_sec
+		self.secondary_max_errors = secondary_max_errors
+		self.secondary_cooldown_sec = secondary_cooldown_sec
+		self.secondary_lock = threading.Lock()
+		self.secondary_credit = 0 # weighted round robin - every pick adds secondary_share, 100 of it buys a secondary read
+		self.secondary_errors = 0 # in a row
+		self.secondary_down_until = 0.0 # time() the secondary can be tried again after errors
+		self.secondary_lagging = self.secondary_share > 0 # replication not live or too far behind - unknown (so not used) until checkReplication()
+		self.replication_lag_sec = -1 # last measured, -1 unknown
+		self.secondary_reads = 0
+		self.secondary_failovers = 0 # reads that failed on the secondary and went to primary
+
+	def blobClient(self, container_name:str, blob_name:str) -> 'BlobClient':
+		'''
+		Blob client sharing this account's connection pool
+		'''
+		return(self.service_client.get_blob_client(container=container_name, blob=blob_name))
+
+	def sourceUrl(self, container_name:str, blob_name:str, expiry_hours=24) -> str:
+		'''
+		URL another account can copy the blob from - a read only blob SAS when this account has a key,
+		otherwise the connection string's own SharedAccessSignature (or none, for public containers)
+		'''
+		blob_url = self.blobClient(container_name, blob_name).url
+		account_key = getattr(self.service_client.credential, 'account_key', None)
+		if account_key:
+			sas_token = generate_blob_sas(self.service_client.account_name, container_name, blob_name, account_key=account_key,
+										permission=BlobSasPermissions(read=True), expiry=datetime.datetime.utcnow() + datetime.timedelta(hours=expiry_hours))
+			return(blob_url + '?' + sas_token)
+		if not '?' in blob_url:
+			for part in str(self.connect_str).split(';'):
+				if part.lower().startswith('sharedaccesssignature='):
+					return(blob_url + '?' + part.split('=', 1)[1].lstrip('?'))
+		return(blob_url) # SAS connection strings already carry the token on the client url
+
+	def secondaryUsable(self) -> bool:
+		return(self.secondary_share > 0 and not self.secondary_lagging and time() >= self.secondary_down_until)
+
+	def pickLocation(self) -> str:
+		'''
+		'primary' or 'secondary' for the next download, secondary_share percent of the time while the secondary is healthy
+		'''
+		if not self.secondaryUsable():
+			return('primary')
+		with self.secondary_lock:
+			self.secondary_credit += self.secondary_share
+			if self.secondary_credit >= 100:
+				self.secondary_credit -= 100
+				return('secondary')
+		return('primary')
+
+	def secondaryRead(self, ok:bool, error=None):
+		'''
+		Record how a read against the secondary went - too many failures in a row take it out for secondary_cooldown_sec
+		'''
+		with self.secondary_lock:
+			if ok:
+				self.secondary_errors = 0
+				self.secondary_reads += 1
+				return
+			self.secondary_errors += 1
+			self.secondary_failovers += 1
+			if self.secondary_errors >= self.secondary_max_errors:
+				self.secondary_errors = 0
+				self.secondary_down_until = time() + self.secondary_cooldown_sec
+				print("- WAZURE(" + str(sys._getframe().f_lineno) +"): " + self.name + " secondary failing, primary only for " + str(self.secondary_cooldown_sec) + " sec - " + str(error) + " -")
+
+	def checkReplication(self) -> int:
+		'''
+		Geo replication status from the secondary (get_service_stats). Stops secondary reads while it isn't live or
+		last_sync_time is more than secondary_max_lag_sec behind. Returns the lag in seconds, -1 if it couldn't be read.
+		'''
+		try:
+			stats = self.service_client.get_service_stats()
+			geo_replication = stats['geo_replication']
+			last_sync_time = geo_replication['last_sync_time']
+			if last_sync_time:
+				if last_sync_time.tzinfo:
+					self.replication_lag_sec = int((datetime.datetime.now(last_sync_time.tzinfo) - last_sync_time).total_seconds())
+				else:
+					self.replication_lag_sec = int((datetime.datetime.utcnow() - last_sync_time).total_seconds())
+			self.secondary_lagging = not (str(geo_replication['status']).lower() == 'live' and last_sync_time and self.replication_lag_sec <= self.secondary_max_lag_sec)
+		except Exception as ex:
+			print("- WAZURE(" + str(sys._getframe().f_lineno) +"): " + self.name + " couldn't read geo replication stats, primary only until it can - " + str(ex) + " -")
+			self.replication_lag_sec = -1
+			self.secondary_lagging = True
+		return(self.replication_lag_sec)
+
+	def secondaryStatus(self) -> str:
+		if self.secondary_lagging:
+			state = 'lagging'
+		elif time() < self.secondary_down_until:
+			state = 'failed over'
+		else:
+			state = 'healthy'
+		return(self.name + " " + str(self.secondary_share) + "% " + state + " lag(s) " + str(self.replication_lag_sec) + " reads " + str(self.secondary_reads) + " failovers " + str(self.secondary_failovers))
+
+	def acquire(self):
+		if self.limiter:
+			self.limiter.acquire()
+		with self.active_lock:
+			self.active += 1
+
+	def release(self):
+		with self.active_lock:
+			self.active -= 1
+		if self.limiter:
+			self.limiter.release()
+
+class ReplicationMonitor():
+	'''
+	Re-checks geo replication on every account reading from its RA-GRS secondary every interval_sec,
+	so secondary reads stop while replication isn't live or lags too far behind and start again once it catches up.
+
+	e.g.
+		replication_monitor = wazure.ReplicationMonitor('ragrs', blob_service, 60)
+		threading.Thread(target=replication_monitor.start, name='replication_monitor', daemon=True).start()
+	'''
+	def __init__(self, name:str, blob_service:'BlobService', interval_sec=60):
+		self.name = name
+		self.blob_service = blob_service
+		self.interval_sec = interval_sec
+		self.stopped = False
+
+	def start(self):
+		'''
+		Run in its own thread - loops until stop()
+		'''
+		while not self.stopped:
+			self.blob_service.checkReplication()
+			slept = 0
+			while slept < self.interval_sec and not self.stopped:
+				sleep(1)
+				slept += 1
+
+	def stop(self):
+		self.stopped = True
+
+def tierIsArchive(tier) -> bool:
+	'''
+	blob_tier from a listing / properties can be a StandardBlobTier enum or a plain string
+	'''
+	return(str(getattr(tier, 'value', tier)).lower() == 'archive')
+
+class ArchiveRehydrator():
+	'''
+	Rehydration stage for blobs sitting in the Archive tier (they can't be read until they're moved back to Hot/Cool).
+	add() takes download job items [ <blob_name>, <blob_size>, <container_name>, <download_dest> ], requestRehydration() asks
+	for the tier change in batches of up to batch_size per container (one batch request instead of a call per blob),
+	then each blob is polled with get_blob_properties - every poll_min_sec at first, backing off x2 to poll_max_sec -
+	and handed to ready_callback(item) the moment it's readable. So downloads start on the first blobs back while the rest
+	are still rehydrating (standard priority can take up to 15 hours, high priority under 1 hour for most blobs).
+
+	keep_alive_queue (a wrq.Queue) has its inactive timeout held off while anything is still rehydrating.
+	A tier change request that fails (the batch call or a blob's own sub-response) is asked for again with the same x2 back off,
+	up to request_attempts times, after which failed_callback(item) is called (if given) and the blob is left in the Archive tier.
+
+	e.g.
+		archive_rehydrator = wazure.ArchiveRehydrator('rehydrate', blob_service, requeueDownload, target_tier='Hot')
+		archive_rehydrator.add(archived_download_list)
+		threading.Thread(target=archive_rehydrator.start, name='archive_rehydrator', daemon=True).start()
+	'''
+	def __init__(self, name:str, blob_service:'BlobService', ready_callback, target_tier='Hot', priority='Standard', batch_size=256,
+				poll_min_sec=60, poll_max_sec=1800, keep_alive_queue=None, failed_callback=None, request_attempts=5, debug=False):
+		self.name = name
+		self.debug = debug
+		self.blob_service = blob_service
+		self.ready_callback = ready_callback
+		self.failed_callback = failed_callback
+		self.request_attempts = max(1, request_attempts)
+		self.target_tier = target_tier
+		self.priority = priority
+		self.batch_size = max(1, min(256, batch_size)) # 256 is the most a blob batch request takes
+		self.poll_min_sec = poll_min_sec
+		self.poll_max_sec = max(poll_min_sec, poll_max_sec)
+		self.keep_alive_queue = keep_alive_queue
+		self.pending_lock = threading.Lock()
+		self.to_request = [] # items not asked for yet
+		self.pending = {} # (container, blob_name) -> [item, next_check, interval]
+		self.retrying = {} # (container, blob_name) -> [item, next_request, attempts] - tier change requests that failed
+		self.requested_count = 0
+		self.ready_count = 0
+		self.failed_count = 0
+		self.stopped = False
+		self.expecting_more = False # set while blobs are still being listed / added - start() keeps going with nothing waiting
+		self.log_file = log.LogFile('wazure_rehydrate.log', log_folder='./logs/', remove_old_logs=True, log_level=3, log_retention_days=10)
+
+	def add(self, items:list, already_requested=False):
+		'''
+		already_requested=True for blobs whose listing shows an archive_status (rehydrate-pending-to-*) - they're only polled
+		'''
+		with self.pending_lock:
+			for item in items:
+				if already_requested:
+					self.pending[(str(item[2]), str(item[0]))] = [item, time() + self.poll_min_sec, self.poll_min_sec]
+				else:
+					self.to_request.append(item)
+
+	def requestRehydration(self):
+		'''
+		Sends the set tier requests for everything added since the last call, batched per container
+		'''
+		now = time()
+		with self.pending_lock:
+			to_request = self.to_request
+			self.to_request = []
+			for key in [k for k, v in self.retrying.items() if v[1] <= now]:
+				to_request.append(self.retrying[key][0])
+		by_container = {}
+		for item in to_request:
+			account = self.blob_service.accountFor(str(item[2]), str(item[0]))
+			by_container.setdefault((account, str(item[2])), []).append(item)
+		for (account, container_name), items in by_container.items():
+			container_client = account.service_client.get_container_client(container_name)
+			for batch_start in range(0, len(items), self.batch_size):
+				batch = items[batch_start:batch_start + self.batch_size]
+				try:
+					responses = list(container_client.set_standard_blob_tier_blobs(self.target_tier, *[str(i[0]) for i in batch], rehydrate_priority=self.priority, raise_on_any_failure=False))
+				except Exception as ex:
+					print("- WAZURE(" + str(sys._getframe().f_lineno) +"): " + self.name + " Exception: rehydration batch failed for container " + container_name + " -")
+					print(ex)
+					self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " rehydration batch of " + str(len(batch)) + " failed for container " + container_name + " - " + str(ex)])
+					for item in batch:
+						self.requestFailed(item, str(ex))
+					continue
+				for item, response in zip(batch, responses):
+					# 202 accepted, 200 already there, 409 already rehydrating - all of them just need polling now
+					if response.status_code in (200, 202, 409):
+						self.requested_count += 1
+						with self.pending_lock:
+							self.retrying.pop((container_name, str(item[0])), None)
+							self.pending[(container_name, str(item[0]))] = [item, time() + self.poll_min_sec, self.poll_min_sec]
+					else:
+						self.requestFailed(item, 'status ' + str(response.status_code))
+				print("- WAZURE(" + str(sys._getframe().f_lineno) +"): " + self.name + " requested rehydration to " + str(self.target_tier) + " (" + str(self.priority) + ") for " + str(len(batch)) + " blobs in " + container_name + " -")
+				self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " requested rehydration to " + str(self.target_tier) + " (" + str(self.priority) + ") for " + str(len(batch)) + " blobs in " + container_name])
+
+	def requestFailed(self, item:list, reason:str):
+		'''
+		Schedules the tier change request for item again (x2 back off from poll_min_sec), or gives up on it after request_attempts
+		'''
+		key = (str(item[2]), str(item[0]))
+		with self.pending_lock:
+			attempts = self.retrying.pop(key, [None, 0, 0])[2] + 1
+			if attempts < self.request_attempts:
+				retry_in = min(self.poll_max_sec, self.poll_min_sec * (2 ** (attempts - 1)))
+				self.retrying[key] = [item, time() + retry_in, attempts]
+		if attempts < self.request_attempts:
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " rehydration request failed (" + reason + "), retrying in " + str(retry_in) + " sec: " + key[0] + "/" + key[1]])
+			return
+		self.failed_count += 1
+		print("- WAZURE(" + str(sys._getframe().f_lineno) +"): " + self.name + " rehydration request FAILED " + str(attempts) + " times, giving up on: " + key[0] + "/" + key[1] + " -")
+		self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " rehydration request FAILED " + str(attempts) + " times (" + reason + "), giving up on: " + key[0] + "/" + key[1]])
+		if self.failed_callback:
+			self.failed_callback(item)
+
+	def checkOnce(self) -> int:
+		'''
+		Polls every pending blob that's due. Returns how many were handed to ready_callback
+		'''
+		now = time()
+		with self.pending_lock:
+			due = [(k, v) for k, v in self.pending.items() if v[1] <= now]
+		ready = 0
+		for key, entry in due:
+			if self.stopped:
+				break
+			item = entry[0]
+			try:
+				properties = self.blob_service.accountFor(key[0], key[1]).blobClient(key[0], key[1]).get_blob_properties()
+			except Exception as ex:
+				properties = None
+				self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " couldn't poll " + key[0] + "/" + key[1] + " - " + str(ex)])
+			if properties is not None and not properties.archive_status and not tierIsArchive(properties.blob_tier):
+				with self.pending_lock:
+					self.pending.pop(key, None)
+				self.ready_count += 1
+				ready += 1
+				self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " rehydrated, queueing download: " + key[0] + "/" + key[1]])
+				self.ready_callback(item)
+				continue
+			entry[2] = min(self.poll_max_sec, entry[2] * 2)
+			entry[1] = time() + entry[2]
+			if self.debug:
+				print("- WAZURE(" + str(sys._getframe().f_lineno) +"): " + self.name + " still rehydrating " + key[0] + "/" + key[1] + ", next check in " + str(entry[2]) + " sec -")
+		return(ready)
+
+	def waiting(self) -> int:
+		with self.pending_lock:
+			return(len(self.to_request) + len(self.retrying) + len(self.pending))
+
+	def status(self) -> str:
+		with self.pending_lock:
+			rehydrating = len(self.pending)
+			retrying = len(self.retrying)
+		return(str(rehydrating) + " rehydrating | " + str(retrying) + " retrying request | " + str(self.ready_count) + " ready | " + str(self.failed_count) + " failed")
+
+	def start(self):
+		'''
+		Run in its own thread - requests anything added, polls, and loops until stop() or nothing is left (and expecting_more is off)
+		'''
+		while not self.stopped and (self.waiting() > 0 or self.expecting_more):
+			if self.to_request or self.retrying:
+				self.requestRehydration()
+			self.checkOnce()
+			slept = 0
+			while slept < 10 and not self.stopped:
+				if self.keep_alive_queue and self.waiting() > 0:
+					self.keep_alive_queue.inactive_timeout_counter = self.keep_alive_queue.inactive_queue_timeout_sec
+				sleep(1)
+				slept += 1
+		print("- WAZURE(" + str(sys._getframe().f_lineno) +"): " + self.name + " finished: " + self.status() + " -")
+		self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " finished: " + self.status()])
+
+	def stop(self):
+		self.stopped = True
+
 class BlobService():
 	'''
 	Wrapper class to call Azure Blobs and Containers
@@ -27,21 +408,136 @@ class BlobService():
 		from lib import wr_azure_lib as wazure
 		blob_service = wazure.BlobService('DefaultEndpointsProtocol=https;AccountName=splunkcloudblobdownload;AccountKey=YuAaifdfsdfsdfsdfsfsfsdfsHeyZ+jXfKc2zeDu/tTvUE1mDh9dfwf3f323f23r2f2f23f2f2f2m80sA2BwBDXA==;EndpointSuffix=core.windows.net')
 
+	connect_str can also be a LIST of connection strings for an archive split over several storage accounts.
+	Containers are listed from all of them (in parallel) into one plan, and every download goes through the account that
+	holds its container - with a client (connection pool) per account and max_concurrent_per_account GETs at most against each.
+
+	Optional: copy_to=<connection string> - copyBlobByName copies blobs server side to that account instead of downloading them.
+	Optional: secondary_share=0-100 - RA-GRS accounts only. That percent of ranged downloads read from <account>-secondary,
+		falling back to primary on errors or when replication lags more than secondary_max_lag_sec (see ReplicationMonitor).
+
 	From there you can call the various functions in here, e.g. 
 		container_name_list = blob_service.getContainers()
 
+	Optional: disk_writer=wr_disk_writer.DiskWriter(...) switches downloads to ranged GETs of chunk_size_mb each,
+		with the disk writes handed to the writer's per-device pool instead of being done on the download thread.
+		range_window of those GETs are in flight per download (like download_blob's max_concurrency), 1 for one at a time.
+	Optional: bandwidth_limiter=wr_transfer_limits.BandwidthLimiter(...) caps the combined rate of those ranged GETs
+	Optional: progress_tracker=wr_transfer_progress.ProgressTracker(...) tracks bytes per in-flight ranged download so a
+		wr_transfer_progress.StallWatchdog can cancel stuck ones. Cancelled downloads requeue and resume from the last range handed to disk.
+		read_timeout_sec is the socket read timeout per ranged GET so a half-open connection gives up well before timeout.
+		The same tracker lets a wr_transfer_progress.TailAccelerator split what's left of big downloads across idle slots (helpDownload).
+
 	'''
 
-	def __init__(self, connect_str: str):
-		global blob_service_client
-		self.connect_str = connect_str
-		try:
-			print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Azure Blob Storage v" + __version__ + "-")
-			blob_service_client = BlobServiceClient.from_connection_string(self.connect_str)
-		except Exception as ex:
-			print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Exception: -")
-			print(ex)
+	def __init__(self, connect_str, disk_writer=None, chunk_size_mb=4, bandwidth_limiter=None, progress_tracker=None, read_timeout_sec=60, max_connections_per_account=20, max_concurrent_per_account=0,
+				secondary_share=0, secondary_max_lag_sec=900, copy_to='', copy_poll_max_sec=30, range_window=4):
+		if isinstance(connect_str, str):
+			connect_str = [connect_str]
+		self.connect_str = connect_str[0]
+		self.accounts = [] # StorageAccount per connection string
+		self.container_accounts = {} # container name -> [StorageAccount, ...] that have it
+		self.blob_accounts = {} # (container name, blob name) -> StorageAccount it was listed from - only kept with several accounts (one entry per listed blob)
+		self.blob_accounts_lock = threading.Lock() # accounts are listed on their own threads
+		self.disk_writer = disk_writer
+		self.bandwidth_limiter = bandwidth_limiter # optional wr_transfer_limits.BandwidthLimiter shared by all ranged downloads
+		self.progress_tracker = progress_tracker # optional wr_transfer_progress.ProgressTracker for stall detection / resume
+		self.read_timeout_sec = read_timeout_sec
+		self.chunk_size = int(chunk_size_mb * 1024 * 1024) # keep at 4MB or under if validate_content is wanted per range
+		self.range_window = max(1, range_window) # ranged GETs in flight per download - the owning thread plus range_window - 1 window threads
+		print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Azure Blob Storage v" + __version__ + "-")
+		for index, account_connect_str in enumerate(connect_str):
+			try:
+				self.accounts.append( StorageAccount(account_connect_str, index, max_connections_per_account, max_concurrent_per_account, secondary_share, secondary_max_lag_sec) )
+			except Exception as ex:
+				print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Exception: connection string " + str(index + 1) + " couldn't be used -")
+				print(ex)
 		self.log_file = log.LogFile('wazure.log', log_folder='./logs/', remove_old_logs=True, log_level=3, log_retention_days=10)
+		# server side copy mode
+		self.copy_to_client = None
+		self.copy_poll_max_sec = copy_poll_max_sec
+		self.copy_containers = set() # destination containers known to exist
+		self.copy_lock = threading.Lock()
+		if copy_to:
+			self.copy_to_client = BlobServiceClient.from_connection_string(copy_to, **pooledTransportKwargs(max_connections_per_account))
+			print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Copy mode - blobs are copied server side to account: " + str(self.copy_to_client.account_name) + " -")
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Copy mode - blobs are copied server side to account: " + str(self.copy_to_client.account_name)])
+
+	def accountForContainer(self, container_name:str) -> 'StorageAccount':
+		'''
+		First account known to have the container. Probes each account once if it wasn't seen in a listing (csv resume etc)
+		'''
+		if container_name not in self.container_accounts:
+			found_accounts = []
+			if len(self.accounts) > 1:
+				for account in self.accounts:
+					try:
+						if account.service_client.get_container_client(container_name).exists():
+							found_accounts.append(account)
+					except Exception as ex:
+						self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Couldn't check " + account.name + " for container " + container_name + " - " + str(ex)])
+			self.container_accounts[container_name] = found_accounts or self.accounts[:1]
+		return(self.container_accounts[container_name][0])
+
+	def accountFor(self, container_name:str, blob_name:str) -> 'StorageAccount':
+		'''
+		The account a blob was listed from, falling back to whichever account has the container
+		'''
+		account = self.blob_accounts.get((container_name, blob_name))
+		if account:
+			return(account)
+		return(self.accountForContainer(container_name))
+
+	def claimBlob(self, container_name:str, blob_name:str, account:'StorageAccount') -> bool:
+		'''
+		Records which account a listed blob comes from. False if the same container / blob name was already listed from
+		another account - both would land on the same local path and csv row, so only the first listed is downloaded.
+		Nothing is kept with one account - no duplicates possible, and accountFor() falls back to the only account
+		'''
+		if len(self.accounts) <= 1:
+			return(True)
+		with self.blob_accounts_lock:
+			first_account = self.blob_accounts.setdefault((str(container_name), str(blob_name)), account)
+		if first_account is account:
+			return(True)
+		print("- WAZURE(" + str(sys._getframe().f_lineno) +"): BLOB: " + str(container_name) + "/" + str(blob_name) + " in " + account.name + " was already listed from " + first_account.name + ", skipping. -")
+		self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") BLOB: " + str(container_name) + "/" + str(blob_name) + " in " + account.name + " was already listed from " + first_account.name + " (same container / blob name), skipping." ] )
+		return(False)
+
+	def interleaveByAccount(self, download_list:list) -> list:
+		'''
+		Round robins a download list ([blob_name, size, container, ...] items) across accounts so the download
+		threads are spread over every account at once instead of working through them one after the other
+		'''
+		if len(self.accounts) <= 1:
+			return(download_list)
+		by_account = {}
+		for item in download_list:
+			by_account.setdefault(self.accountFor(str(item[2]), str(item[0])).name, []).append(item)
+		interleaved = []
+		account_lists = list(by_account.values())
+		for x in range(max(len(l) for l in account_lists)):
+			for account_list in account_lists:
+				if x < len(account_list):
+					interleaved.append(account_list[x])
+		return(interleaved)
+
+	def checkReplication(self):
+		'''
+		Refresh replication lag / health on every account that reads from its secondary
+		'''
+		for account in self.accounts:
+			if account.secondary_share > 0:
+				account.checkReplication()
+
+	def secondaryStatus(self) -> str:
+		return(" | ".join(a.secondaryStatus() for a in self.accounts if a.secondary_share > 0))
+
+	def accountStatus(self) -> str:
+		'''
+		Active GETs per account - for dashboards
+		'''
+		return(" | ".join(a.name + " " + str(a.active) for a in self.accounts))
 
 	def isInList(self, string_to_test:str, list_to_check_against:list, equals_or_contains=True, string_in_list_or_items_in_list_in_string=True) -> bool:
 		'''
@@ -92,21 +588,32 @@ class BlobService():
 			v = v.strftime("%Y-%m-%d_T%H-%M-%S")
 			return(True, v)
 		elif k == 'content_md5':
-			v = v.hex()
+			if v:
+				v = v.hex()
 			return(True, v)
 		else:
 			return(False, v)
 
-	def getContainers(self, names_only=False, container_search_list=[]) -> list:
+	def getContainers(self, names_only=False, container_search_list=[], account=None) -> list:
 		'''
-		Get a list of containers that the specified connection string has access too.
-		Default is a list of dicts, each containing all info of a container.
+		Get a list of containers that the specified connection string(s) have access too.
+		Default is a list of dicts, each containing all info of a container plus 'account_name' it lives in.
 		Optional names_only=True will return a simple list of container names.
+		Optional account=StorageAccount to only look in that one
 		'''
 		try:
 			tmp_container_list = []
-			containers = list( blob_service_client.list_containers() )
-			for container in containers:
+			containers = []
+			if account:
+				accounts = [account]
+			else:
+				accounts = self.accounts
+			for container_account in accounts:
+				for container in container_account.service_client.list_containers():
+					if container_account not in self.container_accounts.setdefault(container['name'], []):
+						self.container_accounts[container['name']].append(container_account)
+					containers.append( (container_account, container) )
+			for container_account, container in containers:
 				if names_only:
 					tmp_container_list.append( container['name'] )
 				else:
@@ -142,21 +649,47 @@ class BlobService():
 							if need_parse[0]:
 								v = need_parse[1]
 						tmp_dict[k] = v
+					tmp_dict['account_name'] = container_account.name
 					tmp_container_list.append(tmp_dict)
 			return(tmp_container_list)
 		except Exception as ex:
 			print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Exception: -")
 			print(ex)
 
-	def getBlobsByContainer(self, container_name, blob_search_list=[], break_at_amount=0, names_only=False) -> list:
+	def blobDict(self, blob) -> dict:
+		'''
+		A listed BlobProperties as a plain dict - azure leaves datetime native objects in raw data, converted to formats json can understand
+		'''
+		tmp_dict = {}
+		for k,v in dict(blob).items():
+			try:
+				tmp_sub_dict = {}
+				for sub_k, sub_v in v.items():
+					need_parse = self.formatAzureSpecialChars(sub_k, sub_v)
+					if need_parse[0]:
+						tmp_sub_dict[sub_k] = need_parse[1]
+					else:
+						tmp_sub_dict[sub_k] = sub_v
+				v = tmp_sub_dict
+			except:
+				need_parse = self.formatAzureSpecialChars(k, v)
+				if need_parse[0]:
+					v = need_parse[1]
+			tmp_dict[k] = v
+		return(tmp_dict)
+
+	def getBlobsByContainer(self, container_name, blob_search_list=[], break_at_amount=0, names_only=False, account=None) -> list:
 		'''
 		Get all blobs in a specified container. Returns a list contianing dicts.
 		Default is one dict per blob with all info for that blob file.
 		Optional names_only=True will return a simple list of blob file names.
+		Optional account=StorageAccount the container is in, otherwise the first account that has it
 		'''
 		try:
 			tmp_blob_list = []
-			container_client = blob_service_client.get_container_client( (container_name) )
+			if not account:
+				account = self.accountForContainer(container_name)
+			container_client = account.service_client.get_container_client( (container_name) )
 			blob_list = container_client.list_blobs()
 #			tmp_blist = list(tmp_blist)
 #			print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Amount of BLOBS: " + str(len(tmp_blist)) + " -")
@@ -191,41 +724,48 @@ class BlobService():
 						print("- WAZURE(" + str(sys._getframe().f_lineno) +"): BLOB: " + str(blob['name']) + " Not in search list, skipping. -")
 						self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + "): BLOB: " + str(blob['name']) + " Not in search list, skipping." ] )
 						continue
+					if not self.claimBlob(container_name, blob['name'], account):
+						continue
 					print("- WAZURE(" + str(sys._getframe().f_lineno) +"): BLOB: " + str(blob['name']) + " ADDED. -")
 					self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") BLOB: " + str(blob['name']) + " ADDED." ] )						
-					d_blob = dict(blob)
-					tmp_dict = {}
-					for k,v in d_blob.items():
-						try:
-							tmp_sub_dict = {}
-							for sub_k, sub_v in v.items():
-								need_parse = self.formatAzureSpecialChars(sub_k, sub_v)
-								if need_parse[0]:
-									tmp_sub_dict[sub_k] = need_parse[1]
-								else:
-									tmp_sub_dict[sub_k] = sub_v
-							v = tmp_sub_dict
-						except:
-							need_parse = self.formatAzureSpecialChars(k, v)
-							if need_parse[0]:
-								v = need_parse[1]
-						tmp_dict[k] = v
-					tmp_blob_list.append( dict(tmp_dict) )
+					tmp_blob_list.append( self.blobDict(blob) )
 			return(tmp_blob_list)
 		except Exception as ex:
 			print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Exception: " + str(blob['name'] + " -"))
 			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Exception: " + str(blob['name']) ] ) 
 			print(ex)
 
-	def getAllBlobsByContainers(self, container_search_list=[], blob_search_list=[], break_at_amount=0) -> list:
+	def getAllBlobsByContainers(self, container_search_list=[], blob_search_list=[], break_at_amount=0, account=None) -> list:
 		'''
 		Probes all available containers to the provided connectionstring (access to) and gets all container names.
 		Probes each container for blobs contained and writes all out to a list of dicts. One dict per container
 		containing container info plus an embedded list of dicts continaing all blobs info
+		With several accounts, each one is listed on its own thread and the results are joined in connection string order.
 		'''
+		if not account and len(self.accounts) > 1:
+			account_results = [None] * len(self.accounts)
+			def listAccount(index, list_account):
+				account_results[index] = self.getAllBlobsByContainers(container_search_list, blob_search_list, break_at_amount, account=list_account)
+			list_threads = []
+			for index, list_account in enumerate(self.accounts):
+				print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Listing storage account: " + list_account.name + " -")
+				self.log_file.writeLinesToFile( ["(" + str(sys._getframe().f_lineno) + ") Listing storage account: " + list_account.name] )
+				t = threading.Thread(target=listAccount, name='list_' + list_account.name, args=(index, list_account), daemon=True)
+				t.start()
+				list_threads.append(t)
+			for t in list_threads:
+				t.join()
+			tmp_container_blob_dict_list = []
+			for index, result in enumerate(account_results):
+				if result is None:
+					print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Listing FAILED for storage account: " + self.accounts[index].name + " -")
+					self.log_file.writeLinesToFile( ["(" + str(sys._getframe().f_lineno) + ") Listing FAILED for storage account: " + self.accounts[index].name] )
+					continue
+				tmp_container_blob_dict_list += result
+			return(tmp_container_blob_dict_list)
 		try:
 			tmp_container_blob_dict_list = []
-			all_containers_dict_list = self.getContainers(container_search_list=container_search_list)
+			all_containers_dict_list = self.getContainers(container_search_list=container_search_list, account=account)
 			for container in all_containers_dict_list:
 				print("\n\n\n- WAZURE(" + str(sys._getframe().f_lineno) +"): Processing CONTAINER: " + container['name'] + " -")
 				found = True
@@ -244,7 +784,7 @@ class BlobService():
 				else:
 					print("- WAZURE(" + str(sys._getframe().f_lineno) +"): " + str(container['name']) + " Added -")
 					self.log_file.writeLinesToFile( ["(" + str(sys._getframe().f_lineno) + ") " + str(container['name']) + " Added." ] )
-				tmp_blobs_dict_list = self.getBlobsByContainer(container['name'], blob_search_list, break_at_amount)
+				tmp_blobs_dict_list = self.getBlobsByContainer(container['name'], blob_search_list, break_at_amount, account=account)
 				tmp_container_dict = container
 				tmp_container_dict['blobs'] = (tmp_blobs_dict_list)
 				tmp_container_blob_dict_list.append(tmp_container_dict)
@@ -253,6 +793,42 @@ class BlobService():
 			print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Exception: -")
 			print(ex)
 	
+	def iterBlobsByContainers(self, container_search_list=[], blob_search_list=[], break_at_amount=0, account=None):
+		'''
+		Streaming version of getAllBlobsByContainers - a generator of (container_name, blob dict) yielded as each page of the
+		listing comes back, so nothing waits for the whole account to be listed and it's never all in memory.
+		One account, or every account one after the other - for them in parallel give each its own (see wr_pipeline.Pipeline).
+		Same container / blob search list (contains) and break_at_amount handling as getBlobsByContainer.
+		'''
+		if account:
+			accounts = [account]
+		else:
+			accounts = self.accounts
+		for list_account in accounts:
+			for container in self.getContainers(container_search_list=container_search_list, account=list_account) or []:
+				print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Listing CONTAINER: " + list_account.name + "/" + container['name'] + " -")
+				self.log_file.writeLinesToFile( ["(" + str(sys._getframe().f_lineno) + ") Listing container: " + list_account.name + "/" + container['name']] )
+				container_client = list_account.service_client.get_container_client(container['name'])
+				counter = 0
+				try:
+					for blob in container_client.list_blobs():
+						if break_at_amount > 0:
+							counter += 1
+							if counter > break_at_amount:
+								self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Test Run Breaking at: " + str(counter) ] )
+								break
+						if not len(str(blob['name']).rsplit('.', 1)) > 1:
+							continue # just a path, no file
+						if blob_search_list and not any(i in blob['name'] for i in blob_search_list):
+							continue
+						if not self.claimBlob(container['name'], blob['name'], list_account):
+							continue
+						yield(container['name'], self.blobDict(blob))
+				except Exception as ex:
+					print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Exception: listing stopped part way through container " + container['name'] + " -")
+					print(ex)
+					self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Exception: listing stopped part way through container " + container['name'] + " after " + str(counter) + " - " + str(ex)] )
+
 	def downloadBlobByName(self, blob_name:str, expected_blob_size:int, container_name:str, dest_download_loc_root='./blob_downloads/', replace_file_name="", bypass_size_compare=False, timeout=5000) -> list:
 		'''
 		Downloads a specified blob file from a container locally to wherever this script (by default)
@@ -264,7 +840,8 @@ class BlobService():
 
 		Checks the expected blob size (grabbed from the RAW file info data)
 		against the actual downloaded size to confirm completed succesfully.
-		Returns list (bool, int) = (success, size)
+		Returns list (bool, int) = (success, bytes written) - the wrq job's result, so the status report needn't stat the file again
+			(False, 0, 'requeued') if it was cancelled (stalled) and put back on the queue to resume
 		Optional: bypass_size_compare=True will return true and just assume download completed ok
 		Optional: timeout=50000 can be set to lesser if desired. Azure docs doesn't actually say if this is a kill switch
 			for active downloads or a fail after no transfer is done... would hate to kill a legit large download in progress
@@ -298,17 +875,302 @@ class BlobService():
 			print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Exception: Error making/accessing download dir -")
 			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Exception: Error making/accessing download dir." ])
 			print(ex)
-		blob = BlobClient.from_connection_string(conn_str=(self.connect_str), container_name=(container_name), blob_name=(blob_name))
-		with open( (filename_full), "wb") as my_blob:
-			blob_data = blob.download_blob(validate_content=True, max_concurrency=5, timeout=(timeout))
-			downloaded_blob_size = (blob_data.readinto(my_blob))
-			if bypass_size_compare:
-				return(True, downloaded_blob_size * 1000000, '(MB)')
+		account = self.accountFor(container_name, blob_name)
+		blob = account.blobClient(container_name, blob_name)
+		if self.disk_writer:
+			try:
+				downloaded_blob_size = self.downloadBlobRanges(blob, filename_full, int(expected_blob_size), timeout, job_key=(container_name, blob_name), job_args=[blob_name, expected_blob_size, container_name, dest_download_loc_root], account=account)
+			except wrtp.DownloadCancelled:
+				print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Download cancelled (stalled) and requeued: " + str(blob_name) + " -")
+				self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Download cancelled (stalled) and requeued: " + str(blob_name)])
+				return(False, 0, 'requeued')
+			except BlobChanged as ex:
+				print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Download FAILED, the blob changed while downloading: " + str(blob_name) + " - " + str(ex) + " -")
+				self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Download FAILED, the blob changed while downloading: " + container_name + "/" + str(blob_name) + " - " + str(ex)])
+				return(False, 0)
+		else:
+			account.acquire()
+			try:
+				with open( (filename_full), "wb") as my_blob:
+					blob_data = blob.download_blob(validate_content=True, max_concurrency=5, timeout=(timeout))
+					downloaded_blob_size = (blob_data.readinto(my_blob))
+			finally:
+				account.release()
+		if bypass_size_compare:
+			return(True, downloaded_blob_size)
+		else:
+			if int(downloaded_blob_size) == int(expected_blob_size):
+				return(True, downloaded_blob_size)
 			else:
-				if (downloaded_blob_size) == (expected_blob_size):
-					return(True, downloaded_blob_size * 1000000, '(MB)')
+				return(False, downloaded_blob_size)
+
+	def copyDestRoot(self) -> str:
+		'''
+		What goes in the Downloaded_To column in copy mode - azure://<destination account>/
+		'''
+		return('azure://' + str(self.copy_to_client.account_name) + '/')
+
+	def copyContainerReady(self, container_name:str):
+		with self.copy_lock:
+			if container_name in self.copy_containers:
+				return
+			container_client = self.copy_to_client.get_container_client(container_name)
+			if not container_client.exists():
+				try:
+					container_client.create_container()
+				except Exception as ex:
+					if not 'ContainerAlreadyExists' in str(ex):
+						raise
+			self.copy_containers.add(container_name)
+
+	def copyBlobByName(self, blob_name:str, expected_blob_size:int, container_name:str, dest_download_loc_root='', timeout=5000) -> list:
+		'''
+		Copy mode stand in for downloadBlobByName (same job args, so it drops into the same queue, Bucketeer list and report).
+		Starts a server side start_copy_from_url of the blob into the same container / name on the copy_to account - no bytes
+		pass through this host - then polls the copy status (1 sec, backing off x2 to copy_poll_max_sec) until it's done.
+		If polling fails part way the pending copy is aborted, so it can't finish (or leave a half written blob) after being reported FAILED.
+		Concurrency is the queue's thread count, each thread holds one copy until it finishes.
+		Returns list (bool, int) = (success, bytes at destination) - the wrq job's result the report is updated from
+		Azurite works for both ends to try it out, e.g. -cs "UseDevelopmentStorage=true" with -ct pointing at a second Azurite account
+		'''
+		account = self.accountFor(container_name, blob_name)
+		dest_blob = self.copy_to_client.get_blob_client(container=container_name, blob=blob_name)
+		copy_status = 'failed'
+		copied_size = 0
+		copy_id = None
+		try:
+			self.copyContainerReady(container_name)
+			copy = dest_blob.start_copy_from_url(account.sourceUrl(container_name, blob_name), timeout=timeout)
+			copy_id = copy.get('copy_id')
+			copy_status = str(copy.get('copy_status', 'pending'))
+			poll_sec = 1
+			while copy_status == 'pending':
+				sleep(poll_sec)
+				poll_sec = min(self.copy_poll_max_sec, poll_sec * 2)
+				copy_status = str(dest_blob.get_blob_properties().copy.status)
+			if copy_status == 'success':
+				copied_size = dest_blob.get_blob_properties().size
+		except Exception as ex:
+			print("- WAZURE(" + str(sys._getframe().f_lineno) +"): Exception: Copy FAILED - " + container_name + "/" + str(blob_name) + " -")
+			print(ex)
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Exception: Copy FAILED - " + container_name + "/" + str(blob_name) + " - " + str(ex)])
+			if copy_id and copy_status == 'pending':
+				# don't leave the server side copy running on with nothing watching it
+				try:
+					dest_blob.abort_copy(copy_id)
+					copy_status = 'aborted'
+				except Exception as abort_ex:
+					self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Couldn't abort copy " + str(copy_id) + " of " + container_name + "/" + str(blob_name) + " - " + str(abort_ex)])
+		self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Copy " + copy_status + ": " + container_name + "/" + str(blob_name) + " (" + str(copied_size) + " bytes)"])
+		return(copy_status == 'success' and int(copied_size) == int(expected_blob_size), copied_size)
+
+	def downloadBlobRanges(self, blob:'BlobClient', filename_full:str, expected_blob_size:int, timeout=5000, job_key=None, job_args=(), account=None) -> int:
+		'''
+		Pulls the blob down in chunk_size ranged GETs on THIS thread (network) and hands each filled buffer
+		to the disk writer pool for the file's device (disk). The network thread only waits on disk when
+		that device's hand-off queue is full, or the shared memory budget is spent.
+		Once the first range is in (and with it the etag), range_window - 1 window threads pull ranges of the same blob
+		alongside it (helpDownload), so one blob isn't a single GET at a time.
+		With a progress_tracker, bytes are reported as they come off the socket. If the job is cancelled (stalled)
+		it stops, flushes what it has, leaves a resume point and requeues itself, then raises wr_transfer_progress.DownloadCancelled
+		Ranges are claimed off the job (a JobProgress - untracked without a progress_tracker) so window threads and
+		tail helpers (helpDownload) can share the rest of the blob.
+		Every range after the first is pinned to the first one's etag (a resume to the etag saved with its resume point) and each
+		response's total size must be expected_blob_size - a blob overwritten or resized part way raises BlobChanged
+		instead of being stitched together from two versions.
+		Returns bytes written to disk
+		'''
+		job = None
+		tracked = bool(self.progress_tracker and job_key)
+		requeued = False
+		offset = 0
+		location = 'primary'
+		if account:
+			location = account.pickLocation() # RA-GRS read spreading, per download
+		if tracked:
+			job = self.progress_tracker.register(job_key, expected_blob_size, job_args)
+			offset = job.start_offset
+			job.onCancel(blob.close) # drops the connection of a standalone client - pooled account clients rely on read_timeout_sec instead
+			if offset > 0:
+				try:
+					blob_properties = blob.get_blob_properties(timeout=(timeout))
+					blob_unchanged = blob_properties.etag == job.etag and int(blob_properties.size) == int(expected_blob_size)
+				except Exception as ex:
+					self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Couldn't check " + filename_full + " before resuming, starting over - " + str(ex)])
+					blob_unchanged = False
+				if blob_unchanged:
+					self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Resuming " + filename_full + " at byte: " + str(offset) + " (etag " + str(job.etag) + ")"])
 				else:
-					return(False, downloaded_blob_size * 1000000, '(MB)')
+					self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + filename_full + " changed in azure since its resume point, starting over"])
+					offset = 0
+		else:
+			job = wrtp.JobProgress(job_key, expected_blob_size, job_args=job_args) # just the range cursor for the window, nothing watches it
+		if offset > 0 and os.path.exists(filename_full):
+			handle = self.disk_writer.open(filename_full, truncate=False)
+			resumed_bytes = offset
+		else:
+			handle = self.disk_writer.open(filename_full)
+			offset = 0
+			resumed_bytes = 0
+			job.start_offset = 0
+			job.next_offset = 0
+			job.bytes_done = 0
+			job.etag = None
+		try:
+			job.handle = handle
+			window_open = self.range_window <= 1
+			while True:
+				job.raiseIfCancelled()
+				next_range = job.claimRange(self.chunk_size)
+				if not next_range:
+					if job.waitHelpers(): # a helper gave ranges back - fetch them ourselves
+						continue
+					break
+				fetched, range_etag = self.fetchRange(blob, handle, next_range[0], next_range[1], timeout, job, account, location, job.etag, expected_blob_size)
+				if job.etag is None:
+					job.etag = range_etag # helpers can only join once this is known
+				job.rangeDone(next_range[0])
+				if fetched < next_range[1]:
+					break
+				if not window_open:
+					window_open = True
+					self.openRangeWindow(job, blob, account, location, timeout)
+			if expected_blob_size == 0 and int(blob.get_blob_properties(timeout=(timeout)).size) != 0:
+				raise BlobChanged("listed as 0 bytes, it isn't any more")
+		except wrtp.DownloadCancelled:
+			# everything handed to the writer below the safe offset is flushed by close(), so the next attempt starts there
+			requeued = True
+			job.waitHelpers(close=True)
+			try:
+				handle.close()
+				self.progress_tracker.requeue(job, job.safeOffset())
+			except Exception as ex:
+				self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Cancelled download couldn't flush, requeueing from the start: " + filename_full + " - " + str(ex)])
+				self.progress_tracker.requeue(job, 0)
+			raise
+		finally:
+			job.waitHelpers(close=True)
+			if tracked and not requeued:
+				self.progress_tracker.finish(job)
+			downloaded_blob_size = handle.close() + resumed_bytes
+		return(downloaded_blob_size)
+
+	def openRangeWindow(self, job:'wrtp.JobProgress', blob:'BlobClient', account=None, location='primary', timeout=5000) -> int:
+		'''
+		Starts up to range_window - 1 threads pulling ranges of the job's blob alongside its owner (helpDownload on the
+		owner's client, account and location). They attach as helpers, so the owner's waitHelpers() waits for them.
+		Returns how many were started
+		'''
+		started = 0
+		for x in range(self.range_window - 1):
+			if not job.addHelper():
+				break
+			threading.Thread(target=self.rangeWindowWorker, args=(job, blob, account, location, timeout), name='range_window', daemon=True).start()
+			started += 1
+		return(started)
+
+	def rangeWindowWorker(self, job:'wrtp.JobProgress', blob:'BlobClient', account, location:str, timeout:int):
+		try:
+			self.helpDownload(job, timeout=timeout, blob=blob, account=account, location=location)
+		except Exception as ex:
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Range window thread failed on " + str(blob.blob_name) + " - " + str(ex)])
+		finally:
+			job.helperDone()
+
+	def fetchRange(self, blob:'BlobClient', handle, offset:int, length:int, timeout=5000, job=None, account=None, location='primary', etag=None, expected_size=None) -> tuple:
+		'''
+		One ranged GET of length bytes at offset, handed to the disk writer for the file.
+		account is the StorageAccount the blob is in - the GET waits for a slot under that account's concurrency cap.
+		location='secondary' reads from the account's RA-GRS secondary (while it's healthy) and retries on primary if that fails.
+		etag pins the GET to that version of the blob (If-Match), expected_size is the total size the blob must still have -
+		either not holding raises BlobChanged.
+		Returns (bytes fetched, etag of the blob they came from)
+		'''
+		if self.bandwidth_limiter:
+			self.bandwidth_limiter.consume(length)
+		self.disk_writer.reserve(length)
+		if account:
+			account.acquire()
+		if job:
+			job.touch(offset) # waiting on our own limits above isn't a stall
+		if location == 'secondary' and not (account and account.secondaryUsable()):
+			location = 'primary'
+		try:
+			while True:
+				request_kwargs = {}
+				if location == 'secondary':
+					request_kwargs['use_location'] = 'secondary'
+				if job:
+					request_kwargs['read_timeout'] = self.read_timeout_sec
+					request_kwargs['progress_hook'] = job.rangeHook(offset)
+				if etag:
+					request_kwargs['etag'] = etag
+					request_kwargs['match_condition'] = MatchConditions.IfNotModified
+				try:
+					downloader = blob.download_blob(offset=offset, length=length, validate_content=True, timeout=(timeout), **request_kwargs)
+					data = downloader.readall()
+				except Exception as ex:
+					if location == 'secondary' and not (job and job.cancelled):
+						account.secondaryRead(False, ex)
+						self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Secondary read failed, retrying on primary: " + str(blob.blob_name) + " at byte " + str(offset) + " - " + str(ex)])
+						location = 'primary'
+						continue
+					if isinstance(ex, ResourceModifiedError):
+						raise BlobChanged("etag is no longer " + str(etag)) from ex
+					raise
+				if location == 'secondary':
+					account.secondaryRead(True)
+				break
+			range_etag = downloader.properties.etag
+			blob_size = int(str(downloader.properties.content_range).split('/')[-1])
+			if etag and range_etag != etag:
+				raise BlobChanged("etag " + str(range_etag) + " isn't " + str(etag))
+			if expected_size is not None and blob_size != int(expected_size):
+				raise BlobChanged("it's " + str(blob_size) + " bytes now, expected " + str(expected_size))
+		except:
+			self.disk_writer.unreserve(length)
+			if job and job.cancelled:
+				raise wrtp.DownloadCancelled(str(job.key))
+			raise
+		finally:
+			if account:
+				account.release()
+		self.disk_writer.unreserve(length - len(data))
+		if data:
+			handle.write(offset, data)
+		return(len(data), range_etag)
+
+	def helpDownload(self, job:'wrtp.JobProgress', keep_going=None, timeout=5000, blob=None, account=None, location=None) -> int:
+		'''
+		Tail helper - claims ranges of ANOTHER thread's in-flight download (job) and pulls them on its own connection
+		into the same file. The caller must hold a helper slot on the job (job.addHelper()) and release it afterwards.
+		A range that fails is given back to the job so the owner (or another helper) fetches it.
+		keep_going() is checked before each range - False stops the helper, i.e. when the slot it's on is wanted back.
+		blob / account / location default to a client of the job's own and a pickLocation() per range - a download's window
+		threads (openRangeWindow) pass the owner's instead.
+		Returns bytes this helper fetched
+		'''
+		if blob is None:
+			container_name, blob_name = job.key
+			account = self.accountFor(container_name, blob_name)
+			blob = account.blobClient(container_name, blob_name)
+		helped = 0
+		while keep_going is None or keep_going():
+			next_range = job.claimRange(self.chunk_size)
+			if not next_range:
+				break
+			try:
+				fetched, range_etag = self.fetchRange(blob, job.handle, next_range[0], next_range[1], timeout, job, account, location or account.pickLocation(), job.etag, job.total_bytes)
+			except Exception as ex:
+				job.returnRange(next_range[0])
+				if not isinstance(ex, wrtp.DownloadCancelled):
+					self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Tail helper range failed, handing it back: " + str(job.key) + " at byte " + str(next_range[0]) + " - " + str(ex)])
+				break
+			job.rangeDone(next_range[0])
+			helped += fetched
+			if fetched < next_range[1]:
+				break
+		return(helped)
 
 	def downloadAllBlobsFromContainers(self, container_names_list=[], blob_name_ignore_list=[], ignore_list_equals_or_contains=False):
 		'''
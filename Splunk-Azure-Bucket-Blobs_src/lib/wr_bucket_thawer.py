@@ -0,0 +1,174 @@
+##############################################################################################################
+# Contact: Will Rivendell
+# 	E1: wrivendell@splunk.com
+# 	E2: contact@willrivendell.com
+#
+#   Moves each bucket into its index's thaweddb as soon as its last file is downloaded and rebuilds it, alongside the downloads
+##############################################################################################################
+
+### Imports
+import os, re, sys, time, shlex, shutil, subprocess, threading
+
+from pathlib import Path
+from . import wr_logging as log
+from . import wr_thread_queue as wrq
+
+### Classes ###########################################
+
+class BucketThawer():
+	'''
+	Tracks which files of each bucket ( .../<index>/<db folder>/db_<latest>_<earliest>_<id>[_<guid>]/... or rb_ ) are still
+	downloading. fileDone() is called for every verified file, and once a bucket has none left it goes on this class's own
+	wrq queue (thaw_concurrency at once) to be:
+		1. moved from the download location to thaw_path_template, e.g. '{splunk_home}var/lib/splunk/{index}/thaweddb/'
+		2. rebuilt with rebuild_command_template, e.g. '{splunk_home}bin/splunk rebuild {bucket_path} {index}'
+	Template fields: {splunk_home} {index} {bucket_id} {bucket_path} (the thawed bucket dir). rebuild_command_template='' only moves.
+	The command is run without a shell and a non zero exit is a failed rebuild, so any local script can stand in for splunk.
+
+	e.g.
+		from lib import wr_bucket_thawer as wrbt
+		bucket_thawer = wrbt.BucketThawer('thaw', '/opt/splunk/', thaw_concurrency=2, result_callback=thawResult)
+		bucket_thawer.addBuckets(master_bucket_download_list) # [ <blob_name>, <blob_size>, <container_name>, <download_dest> ] items
+		threading.Thread(target=bucket_thawer.start, name='bucket_thawer', daemon=True).start()
+		... bucket_thawer.fileDone(container_name, blob_name) for each verified download ...
+
+	result_callback(bucket_files, status) gets the [ item, ... ] of the bucket and 'REBUILT', 'THAWED', 'THAW_FAILED' or 'REBUILD_FAILED'
+	'''
+	def __init__(self, name:str, splunk_home:str, thaw_path_template='{splunk_home}var/lib/splunk/{index}/thaweddb/',
+				rebuild_command_template='{splunk_home}bin/splunk rebuild {bucket_path} {index}', thaw_concurrency=2,
+				rebuild_timeout_sec=21600, result_callback=None, debug=False):
+		self.name = name
+		self.debug = debug
+		self.splunk_home = splunk_home
+		if self.splunk_home and not self.splunk_home.endswith('/'):
+			self.splunk_home = self.splunk_home + '/'
+		self.thaw_path_template = thaw_path_template
+		self.rebuild_command_template = rebuild_command_template
+		self.rebuild_timeout_sec = rebuild_timeout_sec
+		self.result_callback = result_callback
+		self.bucket_lock = threading.Lock()
+		self.buckets = {} # local bucket dir -> {'index', 'bucket_id', 'files' [items], 'pending' set of (container, blob_name)}
+		self.file_buckets = {} # (container, blob_name) -> local bucket dir
+		self.thaws_outstanding = 0 # buckets with every file down whose thaw / rebuild hasn't finished (queued or not yet)
+		self.thawed_count = 0
+		self.rebuilt_count = 0
+		self.failed_count = 0
+		self.stopped = False
+		self.thaw_queue = wrq.Queue(self.name, thaw_concurrency, debug=debug)
+		self.log_file = log.LogFile('wrbt_' + self.name + '.log', log_folder='./logs/', remove_old_logs=True, log_level=3, log_retention_days=10)
+
+	def bucketOf(self, item:list) -> tuple:
+		'''
+		(local bucket dir, index, bucket id) for a download item, or None if the blob isn't in a bucket folder
+		'''
+		bucket_search = re.search('^((?:.*[/\\\\])?)((?:db|rb)_[^/\\\\]+)[/\\\\]', str(item[0]))
+		if not bucket_search:
+			return(None)
+		parent_parts = Path(bucket_search.group(1)).parts
+		if len(parent_parts) < 2:
+			return(None)
+		root = str(item[3])
+		if not root.endswith('/'):
+			root = root + '/'
+		return(root + str(item[2]) + '/' + bucket_search.group(1) + bucket_search.group(2), parent_parts[-2], bucket_search.group(2))
+
+	def addBuckets(self, items:list):
+		with self.bucket_lock:
+			for item in items:
+				bucket = self.bucketOf(item)
+				if not bucket:
+					continue
+				bucket_info = self.buckets.setdefault(bucket[0], {'index': bucket[1], 'bucket_id': bucket[2], 'files': [], 'pending': set()})
+				bucket_info['files'].append(item)
+				bucket_info['pending'].add((str(item[2]), str(item[0])))
+				self.file_buckets[(str(item[2]), str(item[0]))] = bucket[0]
+
+	def fileDone(self, container_name:str, blob_name:str):
+		'''
+		A file is downloaded and verified - queues its bucket for thawing if it was the last one
+		'''
+		with self.bucket_lock:
+			bucket_dir = self.file_buckets.pop((container_name, blob_name), None)
+			if not bucket_dir:
+				return
+			bucket_info = self.buckets[bucket_dir]
+			bucket_info['pending'].discard((container_name, blob_name))
+			if bucket_info['pending']:
+				return
+			self.thaws_outstanding += 1
+		self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " bucket complete, queued to thaw: " + bucket_dir])
+		self.thaw_queue.add(self.thawBucket, [[bucket_dir]])
+
+	def thawBucket(self, bucket_dir:str) -> str:
+		'''
+		Moves the bucket into its thaweddb and runs the rebuild command on it. Returns the status given to result_callback
+		'''
+		bucket_info = self.buckets.get(bucket_dir)
+		fields = {'splunk_home': self.splunk_home, 'index': bucket_info['index'], 'bucket_id': bucket_info['bucket_id']}
+		thaw_dir = self.thaw_path_template.format(**fields)
+		if not thaw_dir.endswith('/'):
+			thaw_dir = thaw_dir + '/'
+		fields['bucket_path'] = thaw_dir + bucket_info['bucket_id']
+		status = 'THAW_FAILED'
+		try:
+			if os.path.exists(fields['bucket_path']):
+				raise FileExistsError("already in thaweddb: " + fields['bucket_path'])
+			os.makedirs(thaw_dir, exist_ok=True)
+			shutil.move(bucket_dir, fields['bucket_path']) # a rename when it's the same filesystem
+			self.thawed_count += 1
+			status = 'THAWED'
+			if self.rebuild_command_template:
+				rebuild_command = [part.format(**fields) for part in shlex.split(self.rebuild_command_template)]
+				rebuild = subprocess.run(rebuild_command, capture_output=True, text=True, timeout=self.rebuild_timeout_sec)
+				if rebuild.returncode == 0:
+					self.rebuilt_count += 1
+					status = 'REBUILT'
+				else:
+					status = 'REBUILD_FAILED'
+					self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " rebuild exited " + str(rebuild.returncode) + ": " + " ".join(rebuild_command) + " - " + str(rebuild.stderr).strip()[-500:]])
+		except Exception as ex:
+			if status == 'THAWED':
+				status = 'REBUILD_FAILED'
+			print("- WRBT(" + str(sys._getframe().f_lineno) +"): " + self.name + " Exception: " + status + " - " + bucket_dir + " -")
+			print(ex)
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " " + status + " - " + bucket_dir + " - " + str(ex)])
+		if not status in ('REBUILT', 'THAWED'):
+			self.failed_count += 1
+		print("- WRBT(" + str(sys._getframe().f_lineno) +"): " + self.name + " " + status + ": " + fields['bucket_path'] + " -")
+		self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " " + status + ": " + bucket_dir + " -> " + fields['bucket_path']])
+		if self.result_callback:
+			self.result_callback(bucket_info['files'], status)
+		with self.bucket_lock:
+			self.thaws_outstanding -= 1
+		return(status)
+
+	def busy(self) -> bool:
+		'''
+		True while any bucket has all its files down but isn't through thaw / rebuild yet - counted from fileDone() on,
+		so one on its way onto the queue (or between waiting and active) still counts
+		'''
+		with self.bucket_lock:
+			return(self.thaws_outstanding > 0)
+
+	def status(self) -> str:
+		waiting = len([b for b in list(self.buckets.values()) if b['pending']])
+		return(str(waiting) + " downloading | " + str(self.thaws_outstanding) + " thawing | " + str(self.thawed_count) + " thawed | " + str(self.rebuilt_count) + " rebuilt | " + str(self.failed_count) + " failed")
+
+	def start(self):
+		'''
+		Run in its own thread - runs the thaw queue and keeps it from timing out while buckets are still downloading, until stop()
+		'''
+		print("- WRBT(" + str(sys._getframe().f_lineno) +"): " + self.name + " started, " + str(len(self.buckets)) + " buckets to thaw into: " + self.thaw_path_template + " -")
+		self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " started, " + str(len(self.buckets)) + " buckets to thaw into: " + self.thaw_path_template + " rebuild: " + self.rebuild_command_template])
+		thread_thaw_queue = threading.Thread(target=self.thaw_queue.start, name=self.name + '_queue', daemon=True)
+		thread_thaw_queue.start()
+		while not self.stopped:
+			self.thaw_queue.inactive_timeout_counter = self.thaw_queue.inactive_queue_timeout_sec
+			time.sleep(1)
+
+	def stop(self):
+		'''
+		Lets the queue finish what's already thawing, nothing new is started
+		'''
+		self.stopped = True
+		self.thaw_queue.stop()
@@ -5,7 +5,7 @@
 ##############################################################################################################
 
 ### Imports ###########################################
-import time, sys, os, shutil
+import time, sys, os, shutil, threading, hashlib, queue, json
 
 from . import wr_logging as log
 
@@ -399,4 +399,108 @@ def renameFolder(orig:str, new:str, create_backup=False, backup_to='', test_run=
 		print(ex)
 		log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + "): Renaming " + orig + " FAILED. Are you using full paths?"] )
 		log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + "): " + str(ex)] )
-		return(False)
\ No newline at end of file
+		return(False)
+# make dst the same content as src without copying the bytes where the filesystem allows it
+def cloneFile(src:str, dst:str, allow_hardlink=True) -> str:
+	'''
+	Tries, in order:
+		reflink - copy-on-write clone (FICLONE on linux - xfs with reflink=1, btrfs etc). dst is its own file that just shares blocks
+		hardlink - dst is another name for src (same inode). Only if allow_hardlink
+		copy - plain byte copy, e.g. src and dst on different filesystems
+	Any existing dst is replaced. Creates dst's parent dirs.
+	Returns which one worked: 'reflink', 'hardlink' or 'copy' - raises if even the copy fails
+	'''
+	os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+	if os.path.lexists(dst):
+		os.remove(dst)
+	if 'linux' in sys.platform:
+		try:
+			import fcntl
+			ficlone = 0x40049409 # _IOW(0x94, 9, int) from linux/fs.h
+			with open(src, 'rb') as src_file:
+				with open(dst, 'wb') as dst_file:
+					fcntl.ioctl(dst_file.fileno(), ficlone, src_file.fileno())
+			return('reflink')
+		except Exception:
+			if os.path.lexists(dst):
+				os.remove(dst)
+	if allow_hardlink:
+		try:
+			os.link(src, dst)
+			return('hardlink')
+		except Exception as ex:
+			log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + "): Hard link " + src + " -> " + dst + " failed, copying instead - " + str(ex)] )
+	shutil.copyfile(src, dst)
+	return('copy')
+
+# walk a directory tree with several threads - one os.scandir per directory at a time
+def scanTree(root:str, threads=8) -> dict:
+	'''
+	Returns { <path relative to root, / separated>: (size bytes, allocated bytes) } for every file under root.
+	allocated is st_blocks * 512 where the OS has it (size otherwise) - less than size means the file has holes,
+	e.g. a download cut short after ranges further in were already written.
+	A missing root returns {}. Directories that can't be read are logged and skipped.
+	'''
+	found = {}
+	if not os.path.isdir(root):
+		return(found)
+	dirs = queue.Queue()
+	dirs.put('')
+	def scanDirs():
+		while True:
+			rel_dir = dirs.get()
+			if rel_dir is None:
+				dirs.task_done()
+				return
+			try:
+				with os.scandir(os.path.join(root, rel_dir)) as entries:
+					for entry in entries:
+						rel_path = rel_dir + entry.name
+						if entry.is_dir(follow_symlinks=False):
+							dirs.put(rel_path + '/')
+						elif entry.is_file(follow_symlinks=False):
+							entry_stat = entry.stat(follow_symlinks=False)
+							allocated = entry_stat.st_size
+							if hasattr(entry_stat, 'st_blocks'):
+								allocated = entry_stat.st_blocks * 512
+							found[rel_path] = (entry_stat.st_size, allocated)
+			except OSError as ex:
+				log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + "): Couldn't scan " + os.path.join(root, rel_dir) + " - " + str(ex)] )
+			dirs.task_done()
+	scan_threads = []
+	for i in range(max(1, threads)):
+		t = threading.Thread(target=scanDirs, name='scan_tree_' + str(i), daemon=True)
+		t.start()
+		scan_threads.append(t)
+	dirs.join()
+	for t in scan_threads:
+		dirs.put(None)
+	for t in scan_threads:
+		t.join()
+	return(found)
+
+# md5 of a file's content as hex - same as azure's content_md5 once that's .hex()'d
+def fileMD5(file_path:str, chunk_size=4194304) -> str:
+	file_md5 = hashlib.md5()
+	with open(file_path, 'rb') as f:
+		for chunk in iter(lambda: f.read(chunk_size), b''):
+			file_md5.update(chunk)
+	return(file_md5.hexdigest())
+
+# write a json file so it's either the old one or the new one, never half of each
+def writeJSONAtomic(file_path:str, data) -> bool:
+	'''
+	Writes to <file_path>.tmp, syncs it and renames it over file_path. Returns False (and logs) if it couldn't
+	'''
+	tmp_path = file_path + '.tmp'
+	try:
+		os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+		with open(tmp_path, 'w') as tmp_file:
+			json.dump(data, tmp_file, indent=1)
+			tmp_file.flush()
+			os.fsync(tmp_file.fileno())
+		os.replace(tmp_path, file_path)
+		return(True)
+	except Exception as ex:
+		log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + "): Couldn't write " + file_path + " - " + str(ex)] )
+		return(False)
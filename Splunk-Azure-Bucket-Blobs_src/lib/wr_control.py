@@ -0,0 +1,126 @@
+##############################################################################################################
+# Contact: Will Rivendell
+# 	E1: wrivendell@splunk.com
+# 	E2: contact@willrivendell.com
+#
+#   Localhost HTTP control endpoint for a running script - status and live changes (threads, bandwidth, priorities,
+#   pause / resume / drain) without a restart. sabbctl.py is the client
+##############################################################################################################
+
+### Imports
+import os, sys, json, secrets, threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from . import wr_logging as log
+
+### Classes ###########################################
+
+class ControlServer():
+	'''
+	Serves commands on http://127.0.0.1:<port>/<command> - nothing but localhost can reach it. GET or POST, a POST body is json.
+	commands is { <command name>: function(body dict) -> json-able dict }. An exception in one comes back as a 400 with its message.
+	Every request needs the X-Control-Token header - a random token written (owner read only) to control_file along with the
+	port when the server starts, and removed on stop(). So only a user who can read that file can change the run.
+
+	e.g.
+		from lib import wr_control as wrctl
+		control_server = wrctl.ControlServer('sabb_control', 8765, {'status': controlStatus, 'threads': controlThreads})
+		control_server.start()
+		... sabbctl.py status / sabbctl.py threads 40 ...
+		control_server.stop()
+	'''
+	def __init__(self, name:str, port:int, commands:dict, control_file='./logs/sabb_control.json', debug=False):
+		self.name = name
+		self.debug = debug
+		self.port = port
+		self.commands = commands
+		self.control_file = control_file
+		self.token = secrets.token_hex(16)
+		self.request_count = 0
+		self.http_server = None
+		self.log_file = log.LogFile('wrctl_' + self.name + '.log', log_folder='./logs/', remove_old_logs=True, log_level=3, log_retention_days=10)
+
+	def runCommand(self, command:str, body:dict) -> tuple:
+		'''
+		(http status, response dict) for one request
+		'''
+		if not command in self.commands:
+			return(404, {'error': 'unknown command: ' + command, 'commands': sorted(self.commands.keys())})
+		try:
+			result = self.commands[command](body)
+		except Exception as ex:
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " command " + command + " " + str(body) + " failed: " + str(ex)])
+			return(400, {'error': str(ex)})
+		self.request_count += 1
+		if not command == 'status':
+			print("- WRCTL(" + str(sys._getframe().f_lineno) +"): " + self.name + " " + command + " " + json.dumps(body) + " -> " + json.dumps(result, default=str) + " -")
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " " + command + " " + json.dumps(body) + " -> " + json.dumps(result, default=str)])
+		return(200, result)
+
+	def handlerClass(self):
+		control_server = self
+		class ControlRequestHandler(BaseHTTPRequestHandler):
+			def respond(self, status:int, response:dict):
+				response_bytes = json.dumps(response, default=str).encode('utf-8')
+				self.send_response(status)
+				self.send_header('Content-Type', 'application/json')
+				self.send_header('Content-Length', str(len(response_bytes)))
+				self.end_headers()
+				self.wfile.write(response_bytes)
+
+			def handle_request(self):
+				if not secrets.compare_digest(self.headers.get('X-Control-Token', ''), control_server.token):
+					self.respond(403, {'error': 'bad or missing X-Control-Token'})
+					return
+				body = {}
+				content_length = int(self.headers.get('Content-Length') or 0)
+				if content_length > 0:
+					try:
+						body = json.loads(self.rfile.read(content_length).decode('utf-8'))
+					except ValueError:
+						self.respond(400, {'error': 'body is not json'})
+						return
+				self.respond(*control_server.runCommand(self.path.strip('/').split('?')[0], body))
+
+			def do_GET(self):
+				self.handle_request()
+
+			def do_POST(self):
+				self.handle_request()
+
+			def log_message(self, format, *args):
+				if control_server.debug:
+					control_server.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + control_server.name + " " + (format % args)])
+		return(ControlRequestHandler)
+
+	def start(self) -> bool:
+		'''
+		Starts serving on its own thread. False if the port couldn't be bound - the run carries on without it
+		'''
+		try:
+			self.http_server = ThreadingHTTPServer(('127.0.0.1', self.port), self.handlerClass())
+		except OSError as ex:
+			print("- WRCTL(" + str(sys._getframe().f_lineno) +"): " + self.name + " Exception: couldn't listen on 127.0.0.1:" + str(self.port) + ", running WITHOUT live control. -")
+			print(ex)
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " couldn't listen on 127.0.0.1:" + str(self.port) + " - " + str(ex)])
+			return(False)
+		self.http_server.daemon_threads = True
+		self.port = self.http_server.server_address[1] # port 0 picks a free one
+		os.makedirs(os.path.dirname(self.control_file) or '.', exist_ok=True)
+		control_fd = os.open(self.control_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+		with os.fdopen(control_fd, 'w') as control_file:
+			json.dump({'pid': os.getpid(), 'port': self.port, 'token': self.token}, control_file)
+		threading.Thread(target=self.http_server.serve_forever, name=self.name, daemon=True).start()
+		print("- WRCTL(" + str(sys._getframe().f_lineno) +"): " + self.name + " listening on 127.0.0.1:" + str(self.port) + " (token in " + self.control_file + ") -")
+		self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " listening on 127.0.0.1:" + str(self.port) + " commands: " + ", ".join(sorted(self.commands.keys()))])
+		return(True)
+
+	def stop(self):
+		if self.http_server:
+			self.http_server.shutdown()
+			self.http_server.server_close()
+			self.http_server = None
+		try:
+			os.remove(self.control_file)
+		except OSError:
+			pass
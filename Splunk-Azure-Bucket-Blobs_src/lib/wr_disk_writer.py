@@ -0,0 +1,295 @@
+##############################################################################################################
+# Contact: Will Rivendell
+# 	E1: wrivendell@splunk.com
+# 	E2: contact@willrivendell.com
+#
+#   Per-device disk writer pools - network threads hand filled buffers over here and go back to downloading
+##############################################################################################################
+
+### Imports
+import os, sys, threading, queue, mmap
+
+from . import wr_logging as log
+
+### Globals ###########################################
+log_file = log.LogFile('wrdw.log', log_folder='./logs/', remove_old_logs=True, log_level=3, log_retention_days=10)
+
+# write modes
+write_modes = ('buffered', 'dontneed', 'direct')
+direct_io_alignment = 4096 # O_DIRECT offsets, lengths and buffer addresses must all be multiples of this
+dontneed_flush_bytes = 32 * 1024 * 1024 # how much a file can write before we sync it and drop it from page cache
+
+### FUNCTIONS ###########################################
+
+# check what this OS can actually do for a requested write mode and step down if needed
+def supportedWriteMode(write_mode:str) -> str:
+	'''
+	direct needs os.O_DIRECT (linux), dontneed needs os.posix_fadvise (linux/bsd). Anything else gets buffered.
+	direct also uses fadvise for the unaligned tail of each file, so it steps down to dontneed then buffered.
+	'''
+	if write_mode not in write_modes:
+		return('buffered')
+	if write_mode == 'direct' and not hasattr(os, 'O_DIRECT'):
+		write_mode = 'dontneed'
+	if write_mode in ('direct', 'dontneed') and not hasattr(os, 'posix_fadvise'):
+		write_mode = 'buffered'
+	return(write_mode)
+
+# positional write that works on windows too (no os.pwrite there)
+def positionalWrite(fd:int, data, offset:int, fd_lock=None) -> int:
+	'''
+	Writes ALL of data to fd at offset, looping on short writes.
+	fd_lock is only needed on platforms without os.pwrite (windows) where seek + write must not interleave
+	Returns bytes written
+	'''
+	view = memoryview(data)
+	total = len(view)
+	written = 0
+	if hasattr(os, 'pwrite'):
+		while written < total:
+			written += os.pwrite(fd, view[written:], offset + written)
+	else:
+		with fd_lock:
+			os.lseek(fd, offset, os.SEEK_SET)
+			while written < total:
+				written += os.write(fd, view[written:])
+	return(written)
+
+### Classes ###########################################
+
+class FileWriteHandle():
+	'''
+	One open destination file. Download threads call write(offset, data) and move on,
+	the device writer threads do the actual disk work.
+	close() blocks until every buffer handed in for this file is on disk (or failed) and raises the first write error seen.
+	'''
+	def __init__(self, disk_writer, file_path:str, truncate=True):
+		self.disk_writer = disk_writer
+		self.file_path = file_path
+		self.write_mode = disk_writer.write_mode
+		flags = os.O_WRONLY | os.O_CREAT
+		if truncate:
+			flags = flags | os.O_TRUNC
+		if hasattr(os, 'O_BINARY'):
+			flags = flags | os.O_BINARY
+		self.fd = os.open(file_path, flags, 0o644)
+		self.fd_lock = threading.Lock()
+		# page cache friendly modes
+		self.direct_fd = None # second fd opened O_DIRECT for the aligned bulk of the file
+		self.cache_lock = threading.Lock()
+		self.unflushed_bytes = 0 # buffered bytes written since the last sync + drop
+		self.dropped_upto = 0 # everything before this offset has been synced and dropped from page cache
+		self.high_water = 0 # furthest offset written so far - the write cursor
+		if self.write_mode == 'direct':
+			try:
+				self.direct_fd = os.open(file_path, os.O_WRONLY | os.O_DIRECT)
+			except Exception as ex:
+				# tmpfs, some network filesystems etc don't do O_DIRECT
+				log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") O_DIRECT not available for " + file_path + ", using dontneed instead - " + str(ex)])
+				self.write_mode = 'dontneed'
+		self.device = disk_writer.deviceOf(file_path)
+		self.pending = 0 # buffers handed over but not yet written
+		self.bytes_written = 0
+		self.error = None
+		self.closed = False
+		self.done_condition = threading.Condition()
+
+	def write(self, offset:int, data):
+		'''
+		Hand a filled buffer over to this file's device writer pool.
+		If the writer has a memory budget, len(data) bytes must already be reserved - they're released once written.
+		'''
+		if self.error:
+			self.disk_writer.unreserve(len(data))
+			raise self.error
+		with self.done_condition:
+			self.pending += 1
+		self.disk_writer.submit(self, offset, data)
+
+	def writeNow(self, offset:int, data) -> int:
+		'''
+		Called by the writer threads (or inline when the pool is 0 threads)
+		buffered - plain write through page cache
+		dontneed - write through page cache, then every dontneed_flush_bytes sync and POSIX_FADV_DONTNEED everything behind the write cursor
+		direct - aligned chunks go straight to disk with O_DIRECT, the unaligned tail is handled like dontneed
+		'''
+		length = len(data)
+		if self.direct_fd is not None and offset % direct_io_alignment == 0 and length % direct_io_alignment == 0 and length > 0:
+			aligned_buffer = mmap.mmap(-1, length) # anonymous mmap is page aligned
+			try:
+				aligned_buffer.write(data)
+				written = positionalWrite(self.direct_fd, aligned_buffer, offset)
+			finally:
+				aligned_buffer.close()
+			self.advanceCursor(offset + length, 0)
+			return(written)
+		written = positionalWrite(self.fd, data, offset, self.fd_lock)
+		if self.write_mode != 'buffered':
+			self.advanceCursor(offset + length, length)
+		return(written)
+
+	def advanceCursor(self, end_offset:int, buffered_bytes:int, force_drop=False):
+		'''
+		Tracks the write cursor and drops synced pages behind it from page cache so restores don't evict
+		the tsidx/journal pages splunkd is serving searches from.
+		'''
+		with self.cache_lock:
+			if end_offset > self.high_water:
+				self.high_water = end_offset
+			self.unflushed_bytes += buffered_bytes
+			if not force_drop and self.unflushed_bytes < dontneed_flush_bytes:
+				return
+			drop_from = self.dropped_upto
+			drop_to = self.high_water
+			self.unflushed_bytes = 0
+			self.dropped_upto = drop_to
+		if drop_to <= drop_from:
+			return
+		try:
+			os.fdatasync(self.fd) # dirty pages can't be dropped, get them to disk first
+			os.posix_fadvise(self.fd, drop_from, drop_to - drop_from, os.POSIX_FADV_DONTNEED)
+		except Exception as ex:
+			log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") fadvise DONTNEED failed on " + self.file_path + " - " + str(ex)])
+
+	def writeFinished(self, length:int, error=None):
+		with self.done_condition:
+			self.pending -= 1
+			if error:
+				if not self.error:
+					self.error = error
+			else:
+				self.bytes_written += length
+			self.done_condition.notify_all()
+
+	def wait(self):
+		'''
+		Block until all pending buffers for this file are written
+		'''
+		with self.done_condition:
+			while self.pending > 0:
+				self.done_condition.wait()
+
+	def close(self) -> int:
+		'''
+		Waits on outstanding writes, closes the file and returns the bytes written
+		'''
+		if self.closed:
+			return(self.bytes_written)
+		try:
+			self.wait()
+			if self.write_mode != 'buffered' and not self.error:
+				self.advanceCursor(self.high_water, 0, force_drop=True)
+		finally:
+			self.closed = True
+			os.close(self.fd)
+			if self.direct_fd is not None:
+				os.close(self.direct_fd)
+		if self.error:
+			raise self.error
+		return(self.bytes_written)
+
+class DiskWriter():
+	'''
+	Decouples disk writes from network reads.
+	Each physical device (by st_dev of the destination dir) gets its OWN small pool of writer threads and
+	a bounded hand-off queue, so raising the download thread count doesn't add more writers thrashing one spindle.
+	When the hand-off queue is full, the network thread waits (backpressure) rather than piling buffers up in memory.
+
+	e.g.
+		from lib import wr_disk_writer as wrdw
+		disk_writer = wrdw.DiskWriter('blob_writer', threads_per_device=2)
+		handle = disk_writer.open('/data/restore/container/file.gz')
+		handle.write(0, first_4mb)
+		handle.write(4194304, next_4mb)
+		handle.close()
+
+	threads_per_device=0 writes inline on the calling thread (the old behaviour).
+
+	Optional: memory_budget=wr_transfer_limits.MemoryBudget(...) - callers reserve() bytes before fetching a buffer and
+		the writer hands them back once the buffer is on disk, capping buffered-but-unwritten data across ALL download threads.
+
+	Optional: write_mode for running next to a live splunkd (see FileWriteHandle.writeNow)
+		buffered (default) | dontneed (sync + POSIX_FADV_DONTNEED behind the write cursor) | direct (O_DIRECT where aligned)
+		Unsupported modes step down automatically, e.g. direct -> dontneed -> buffered
+	'''
+	def __init__(self, name: str, threads_per_device=2, queue_depth_per_thread=4, memory_budget=None, write_mode='buffered', debug=False):
+		self.name = name
+		self.memory_budget = memory_budget
+		self.write_mode = supportedWriteMode(write_mode)
+		if not self.write_mode == write_mode:
+			print("- WRDW(" + str(sys._getframe().f_lineno) +"): Write mode " + str(write_mode) + " not supported here, using: " + self.write_mode + " -")
+			log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Write mode " + str(write_mode) + " not supported here, using: " + self.write_mode])
+		self.threads_per_device = threads_per_device
+		self.queue_depth_per_thread = queue_depth_per_thread
+		self.debug = debug
+		self.devices = {} # st_dev -> bounded hand-off queue for that device
+		self.devices_lock = threading.Lock()
+
+	def deviceOf(self, file_path:str):
+		'''
+		Returns the device id the file lives on. Windows returns 0 for st_dev on some versions, which is fine - one pool.
+		'''
+		try:
+			return(os.stat(os.path.dirname(os.path.abspath(file_path))).st_dev)
+		except Exception:
+			return(0)
+
+	def reserve(self, nbytes:int):
+		'''
+		Reserve buffer memory before fetching nbytes from the network - blocks while the shared budget is spent
+		'''
+		if self.memory_budget:
+			self.memory_budget.acquire(nbytes)
+
+	def unreserve(self, nbytes:int):
+		'''
+		Give back a reservation that never became a write (short read or failed fetch)
+		'''
+		if self.memory_budget and nbytes > 0:
+			self.memory_budget.release(nbytes)
+
+	def open(self, file_path:str, truncate=True) -> 'FileWriteHandle':
+		return(FileWriteHandle(self, file_path, truncate=truncate))
+
+	def deviceQueue(self, device) -> 'queue.Queue':
+		with self.devices_lock:
+			if device not in self.devices:
+				device_queue = queue.Queue(maxsize=self.threads_per_device * self.queue_depth_per_thread)
+				self.devices[device] = device_queue
+				for x in range(self.threads_per_device):
+					t = threading.Thread(target=self.writerLoop, name=self.name + '_dev' + str(device) + '_w' + str(x), args=(device_queue,), daemon=True)
+					t.start()
+				if self.debug:
+					print("- WRDW(" + str(sys._getframe().f_lineno) +"): " + self.name + " started " + str(self.threads_per_device) + " writers for device: " + str(device) + " -")
+				log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " started " + str(self.threads_per_device) + " writers for device: " + str(device)])
+			return(self.devices[device])
+
+	def submit(self, handle:'FileWriteHandle', offset:int, data):
+		if self.threads_per_device <= 0:
+			self.writeJob(handle, offset, data)
+		else:
+			self.deviceQueue(handle.device).put((handle, offset, data))
+
+	def writeJob(self, handle:'FileWriteHandle', offset:int, data):
+		try:
+			written = handle.writeNow(offset, data)
+			handle.writeFinished(written)
+		except Exception as ex:
+			print("- WRDW(" + str(sys._getframe().f_lineno) +"): Exception: Write failed on " + handle.file_path + " -")
+			print(ex)
+			log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") Exception: Write failed on " + handle.file_path + " - " + str(ex)])
+			handle.writeFinished(0, ex)
+		finally:
+			self.unreserve(len(data))
+
+	def writerLoop(self, device_queue:'queue.Queue'):
+		while True:
+			handle, offset, data = device_queue.get()
+			self.writeJob(handle, offset, data)
+			device_queue.task_done()
+
+	def pendingBuffers(self) -> int:
+		'''
+		Total buffers waiting on all device queues - for dashboards
+		'''
+		return(sum(q.qsize() for q in list(self.devices.values())))
@@ -6,7 +6,7 @@
 ##############################################################################################################
 
 ### IMPORTS ###########################################
-import os, time, datetime, csv, pandas, sys
+import os, time, datetime, csv, pandas, sys, sqlite3, threading
 
 from pathlib import Path
 
@@ -231,6 +231,18 @@ class CSVFile():
 				else:
 					print("Could not write to log file, check permissions of " + (self.log_folder) )
 
+	def replaceWithDataFrame(self, df:'pandas.DataFrame'):
+		'''
+		Writes df to a temp file next to the csv, syncs it and renames it over the csv. A kill or crash mid write
+		leaves the old csv whole instead of half rewritten.
+		'''
+		tmp_path = self.log_path + '.tmp'
+		with open(tmp_path, 'w', newline='') as tmp_file:
+			df.to_csv(tmp_file, index=False)
+			tmp_file.flush()
+			os.fsync(tmp_file.fileno())
+		os.replace(tmp_path, self.log_path)
+
 	def updateCellsByHeader(self, parameter_list:list):
 		'''
 		Search by header for a string to find the row.
@@ -238,21 +250,33 @@ class CSVFile():
 		You can do batch updates (less open and close of file) by sending in a list of modificaions.
 		Single mods should be in list format as well. eg
 		['header_to_search_under', 'value_to_search', 'header_to_update', 'value_to_write']
+		To pin the row down by two columns (e.g. the same File_Name in two containers) send 6 instead. eg
+		['header_to_search_under', 'value_to_search', 'second_header_to_search_under', 'second_value_to_search', 'header_to_update', 'value_to_write']
+		If the csv has no second_header_to_search_under column, only the first is used.
+		header_to_update is added as a new column if the csv doesn't have it yet.
 		'''
 		if os.path.exists(self.log_path):
 			try:
-				df = pandas.read_csv(self.log_path)
+				df = pandas.read_csv(self.log_path, dtype=str, keep_default_na=False) # all text - empty status cells would otherwise come back as float NaN columns
 				for i in parameter_list:
-					if not len(i) == 4:
-						print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.name + "): - updateCellsByHeader takes strictly 4 parameters more or less given. Skipping: " + str(i) +" -")
+					if len(i) == 6:
+						row_match = df[str(i[0])]==str(i[1])
+						if str(i[2]) in df.columns:
+							row_match = row_match & (df[str(i[2])]==str(i[3]))
+						i = i[4:]
+					elif len(i) == 4:
+						row_match = df[str(i[0])]==str(i[1])
+						i = i[2:]
+					else:
+						print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.name + "): - updateCellsByHeader takes strictly 4 (or 6) parameters more or less given. Skipping: " + str(i) +" -")
 						continue
-					header_to_search_under = str(i[0])
-					value_to_search = str(i[1])
-					header_to_update = str(i[2])
-					value_to_write = str(i[3])
-					i = df[ df[header_to_search_under]==value_to_search ].index.values[0] # get row index of the value we search for
+					header_to_update = str(i[0])
+					value_to_write = str(i[1])
+					i = df[ row_match ].index.values[0] # get row index of the value we search for
+					if header_to_update not in df.columns:
+						df[header_to_update] = ''
 					df.loc[i,header_to_update]=value_to_write
-				df.to_csv(self.log_path, index=False)
+				self.replaceWithDataFrame(df)
 				#df.loc[df [ (header_to_search_under) ] == (value_to_search), (header_to_update)] = (value_to_write) #broken
 				return(True)
 			except:
@@ -261,6 +285,45 @@ class CSVFile():
 			print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.name + "): - Could not read csv specified. -")
 			return(False)
 
+	def updateRowsByKeys(self, key_headers:list, updates:dict) -> int:
+		'''
+		Bulk version of updateCellsByHeader - one read, one pass over the rows and one write for any number of rows.
+		key_headers e.g. ['File_Name', 'Container'] and updates e.g. { (<file_name>, <container>): {'Download_Complete': 'SUCCESS', ...}, ... }
+		Key headers the csv doesn't have are left out of the match (like the 6 value form of updateCellsByHeader).
+		Columns being updated are added if the csv doesn't have them yet. Keys not in the csv are skipped.
+		Returns how many rows were updated, -1 if the csv couldn't be read / written
+		'''
+		if not os.path.exists(self.log_path):
+			print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.name + "): - Could not read csv specified. -")
+			return(-1)
+		try:
+			df = pandas.read_csv(self.log_path, dtype=str, keep_default_na=False)
+			key_positions = [n for n, h in enumerate(key_headers) if h in df.columns]
+			lookup = {}
+			for key, cells in updates.items():
+				lookup[tuple(str(key[n]) for n in key_positions)] = cells
+			column_updates = {}
+			updated = 0
+			for row_position, row_key in enumerate(zip(*[df[key_headers[n]].tolist() for n in key_positions])):
+				cells = lookup.get(row_key)
+				if not cells:
+					continue
+				updated += 1
+				for header_to_update, value_to_write in cells.items():
+					column_updates.setdefault(header_to_update, {})[row_position] = str(value_to_write)
+			for header_to_update, row_values in column_updates.items():
+				if header_to_update not in df.columns:
+					df[header_to_update] = ''
+				column_values = df[header_to_update].tolist()
+				for row_position, value_to_write in row_values.items():
+					column_values[row_position] = value_to_write
+				df[header_to_update] = column_values
+			self.replaceWithDataFrame(df)
+			return(updated)
+		except Exception as ex:
+			print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.name + "): - updateRowsByKeys failed: " + str(ex) + " -")
+			return(-1)
+
 	def getValueByHeaders(self, first_header_to_search_under: str, value_under_first_header_to_search:str, second_header_to_search_under:str) -> list:
 		'''
 		Search by header for a string to find the row.
@@ -310,6 +373,286 @@ class CSVFile():
 		else:
 			print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.log_path + "): - Could not read csv specified. -")
 			return(False, False)
+
+	def readDataFrame(self, columns=None) -> 'pandas.DataFrame':
+		'''
+		The whole csv (or just columns) as a dataframe
+		'''
+		return(pandas.read_csv(self.log_path, engine='python', usecols=columns))
 	
 	def doesLogFileExist(self):
-		return(verifyLogFileExist(self.log_path))
\ No newline at end of file
+		return(verifyLogFileExist(self.log_path))
+
+class StatusStore(CSVFile):
+	'''
+	CSVFile's report kept in sqlite (WAL journal) instead - <csv>.db next to the csv. Same methods as CSVFile so it drops in
+	for it, but an update is an indexed UPDATE (File_Name) and each batch is one transaction, instead of reading and rewriting
+	the whole csv per batch. A crash mid batch rolls back rather than leaving half a file.
+	The csv - same columns in the same order - is only written by exportCSV(), on demand and at exit. A csv that changed
+	since the last export is only imported on its own while the table is still empty (a report from before the db). Once the
+	db has rows, an outside change to the csv is warned about and the db kept - it has the newer status and exportCSV()
+	writes it back out. importCSV() takes the csv anyway (Bucketeer just wrote this peer's list), and deleting the .db
+	goes back to whatever the csv says.
+	'''
+	KEY_COLUMNS = ('File_Name', 'Container') # what rows are looked up by - always text
+
+	def __init__(self, name: str, log_folder='./logs/', remove_old_logs=False, log_retention_days=7, prefix_date=True, debug=False):
+		CSVFile.__init__(self, name, log_folder, remove_old_logs, log_retention_days, prefix_date, debug)
+		self.db_path = self.log_path + '.db'
+		self.db_lock = threading.RLock()
+		self.db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=60)
+		self.db.execute('PRAGMA journal_mode=WAL')
+		self.db.execute('PRAGMA synchronous=NORMAL') # WAL + NORMAL - a committed batch survives a crash of this process, only an OS crash can lose the last few
+		with self.db:
+			self.db.execute('CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)')
+		self.columns = self.tableColumns()
+		self.textKeyColumns()
+		self.csv_ignored = '' # modified time of the csv last warned about and not imported
+
+	def quoteName(self, name) -> str:
+		return('"' + str(name).replace('"', '""') + '"')
+
+	def tableColumns(self) -> list:
+		return([c[1] for c in self.db.execute('PRAGMA table_info(report)').fetchall()])
+
+	def metaValue(self, key:str, default=''):
+		row = self.db.execute('SELECT value FROM store_meta WHERE key=?', (key,)).fetchone()
+		return(row[0] if row else default)
+
+	def setMetaValue(self, key:str, value):
+		self.db.execute('INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+	def csvModified(self) -> str:
+		try:
+			return(str(os.stat(self.log_path).st_mtime_ns))
+		except OSError:
+			return('')
+
+	def createTable(self, columns:list):
+		'''
+		Columns have no type so values keep theirs (sizes come back as numbers, like pandas reading the csv) - except the
+		KEY_COLUMNS rows are matched on, which are TEXT so an all digit name (container 2023) still matches the str it's looked up by
+		'''
+		self.db.execute('DROP TABLE IF EXISTS report')
+		self.db.execute('CREATE TABLE report (' + ', '.join(self.quoteName(c) + (' TEXT' if c in self.KEY_COLUMNS else '') for c in columns) + ')')
+		if 'File_Name' in columns:
+			self.db.execute('CREATE INDEX report_file_name ON report ("File_Name")')
+		self.columns = list(columns)
+
+	def textKeyColumns(self):
+		'''
+		A db from before the key columns were TEXT can hold all digit names as numbers - turns them back into text
+		'''
+		key_columns = [c for c in self.KEY_COLUMNS if c in self.columns]
+		if key_columns:
+			with self.db:
+				for column in key_columns:
+					self.db.execute('UPDATE report SET ' + self.quoteName(column) + '=CAST(' + self.quoteName(column) + ' AS TEXT) WHERE typeof(' + self.quoteName(column) + ") IN ('integer', 'real')")
+
+	def addColumns(self, columns:list):
+		for column in columns:
+			if not column in self.columns:
+				self.db.execute('ALTER TABLE report ADD COLUMN ' + self.quoteName(column) + " DEFAULT ''")
+				self.columns.append(column)
+
+	def hasRows(self) -> bool:
+		return(len(self.columns) > 0 and self.db.execute('SELECT 1 FROM report LIMIT 1').fetchone() is not None)
+
+	def syncFromCSV(self, force=False):
+		'''
+		Imports the csv over the table if it isn't the one exportCSV() last wrote - only into an empty table unless force=True.
+		A forced import keeps the table's value for any cell the csv left blank (same File_Name / Container), so status
+		recorded since the last export isn't lost
+		'''
+		csv_modified = self.csvModified()
+		if not csv_modified or csv_modified == self.metaValue('csv_modified'):
+			return
+		if not force and self.hasRows():
+			if csv_modified != self.csv_ignored:
+				self.csv_ignored = csv_modified
+				print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.name + "): - WARNING: " + self.log_path + " was changed outside of this run, keeping " + self.db_path + " (it's written back out at exit). Delete the .db to use the csv instead. -")
+			return
+		print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.name + "): - csv changed since the last export, importing it to " + self.db_path + " -")
+		df = pandas.read_csv(self.log_path, engine='python', keep_default_na=False, dtype={c: str for c in self.KEY_COLUMNS}) # names as written - container 0012 stays 0012
+		df = df.astype(object).where(df.notna(), '') # short rows still come back NaN
+		columns = [str(c) for c in df.columns]
+		rows = df.values.tolist()
+		key_columns = [c for c in ('File_Name', 'Container') if c in columns and c in self.columns]
+		if force and 'File_Name' in key_columns and self.hasRows():
+			current = {}
+			for row in self.db.execute('SELECT ' + ', '.join(self.quoteName(c) for c in self.columns) + ' FROM report'):
+				row_cells = dict(zip(self.columns, row))
+				current.setdefault(tuple(str(row_cells[c]) for c in key_columns), row_cells)
+			for row in rows:
+				row_cells = current.get(tuple(str(row[columns.index(c)]) for c in key_columns))
+				if not row_cells:
+					continue
+				for n, column in enumerate(columns):
+					if row[n] == '' and row_cells.get(column, '') not in ('', None):
+						row[n] = row_cells[column]
+		with self.db:
+			self.createTable(columns)
+			self.db.executemany('INSERT INTO report VALUES (' + ', '.join(['?'] * len(self.columns)) + ')', rows)
+			self.setMetaValue('csv_modified', csv_modified)
+
+	def importCSV(self):
+		'''
+		Takes the csv into the db even though the db already has rows - for a csv this run wrote on purpose (Bucketeer's peer list)
+		'''
+		with self.db_lock:
+			try:
+				self.syncFromCSV(force=True)
+			except Exception as ex:
+				print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.name + "): - Couldn't import " + self.log_path + ": " + str(ex) + " -")
+
+	def writeLinesToCSV(self, csv_rows: list, header_row=[]):
+		with self.db_lock:
+			try:
+				self.syncFromCSV()
+				with self.db:
+					if not self.columns:
+						self.createTable(header_row or ['Column_' + str(n + 1) for n in range(max([len(r) for r in csv_rows] or [0]))])
+					width = max([len(r) for r in csv_rows] or [0])
+					if width > len(self.columns):
+						self.addColumns(['Unnamed: ' + str(n) for n in range(len(self.columns), width)])
+					self.db.executemany('INSERT INTO report VALUES (' + ', '.join(['?'] * len(self.columns)) + ')',
+										[list(r) + [''] * (len(self.columns) - len(r)) for r in csv_rows])
+			except Exception as ex:
+				print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.name + ") : Exception: -")
+				print(ex)
+
+	def updateCellsByHeader(self, parameter_list:list):
+		'''
+		Same tuples as CSVFile.updateCellsByHeader, all of them in one transaction. A row that isn't found is skipped
+		instead of failing the batch
+		'''
+		with self.db_lock:
+			try:
+				self.syncFromCSV()
+				if not self.columns:
+					print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.name + "): - Could not read csv specified. -")
+					return(False)
+				with self.db:
+					for i in parameter_list:
+						if len(i) == 6 and str(i[2]) in self.columns:
+							match, match_values = self.quoteName(i[0]) + '=? AND ' + self.quoteName(i[2]) + '=?', [str(i[1]), str(i[3])]
+						elif len(i) in (4, 6):
+							match, match_values = self.quoteName(i[0]) + '=?', [str(i[1])]
+						else:
+							print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.name + "): - updateCellsByHeader takes strictly 4 (or 6) parameters more or less given. Skipping: " + str(i) +" -")
+							continue
+						self.addColumns([str(i[-2])])
+						self.db.execute('UPDATE report SET ' + self.quoteName(i[-2]) + '=? WHERE rowid=(SELECT rowid FROM report WHERE ' + match + ' ORDER BY rowid LIMIT 1)',
+										[str(i[-1])] + match_values)
+				return(True)
+			except Exception as ex:
+				print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.name + "): - updateCellsByHeader failed: " + str(ex) + " -")
+				return(False)
+
+	def updateRowsByKeys(self, key_headers:list, updates:dict) -> int:
+		'''
+		Same as CSVFile.updateRowsByKeys, one transaction for the lot
+		'''
+		with self.db_lock:
+			try:
+				self.syncFromCSV()
+				if not self.columns:
+					print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.name + "): - Could not read csv specified. -")
+					return(-1)
+				key_positions = [n for n, h in enumerate(key_headers) if h in self.columns]
+				match = ' AND '.join(self.quoteName(key_headers[n]) + '=?' for n in key_positions)
+				updated = 0
+				with self.db:
+					for key, cells in updates.items():
+						if not cells:
+							continue
+						self.addColumns([str(h) for h in cells.keys()])
+						cursor = self.db.execute('UPDATE report SET ' + ', '.join(self.quoteName(h) + '=?' for h in cells.keys()) + ' WHERE ' + match,
+												[str(v) for v in cells.values()] + [str(key[n]) for n in key_positions])
+						updated += cursor.rowcount
+				return(updated)
+			except Exception as ex:
+				print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.name + "): - updateRowsByKeys failed: " + str(ex) + " -")
+				return(-1)
+
+	def getValueByHeaders(self, first_header_to_search_under: str, value_under_first_header_to_search:str, second_header_to_search_under:str) -> list:
+		with self.db_lock:
+			try:
+				self.syncFromCSV()
+				if not self.columns:
+					return(False, False)
+				rows = self.db.execute('SELECT ' + self.quoteName(second_header_to_search_under) + ' FROM report WHERE ' + self.quoteName(first_header_to_search_under) + '=? ORDER BY rowid',
+									(str(value_under_first_header_to_search),)).fetchall()
+				return(True, [r[0] for r in rows])
+			except Exception:
+				return(False, "")
+
+	def valueExistsInColumn(self, first_header_to_search_under:str, value_under_first_header_to_search:str) -> list:
+		'''
+		If found, will return True, <list of rows found in> - an exact match, not the csv version's contains
+		'''
+		with self.db_lock:
+			try:
+				self.syncFromCSV()
+				if not self.columns:
+					return(False, False)
+				rows = self.db.execute('SELECT * FROM report WHERE ' + self.quoteName(first_header_to_search_under) + '=? ORDER BY rowid', (str(value_under_first_header_to_search),)).fetchall()
+				return(len(rows) > 0, [list(r) for r in rows])
+			except Exception:
+				return(False, [])
+
+	def readAllRowsToList(self, remove_rows_header_equals_value_pairs=[]) -> list:
+		return(self.readDataFrame().values.tolist())
+
+	def readDataFrame(self, columns=None) -> 'pandas.DataFrame':
+		'''
+		The whole table (or just columns) as a dataframe, in csv row order
+		'''
+		with self.db_lock:
+			self.syncFromCSV()
+			select_columns = [c for c in (columns or self.columns) if c in self.columns]
+			if not select_columns:
+				return(pandas.DataFrame(columns=columns or []))
+			return(pandas.read_sql_query('SELECT ' + ', '.join(self.quoteName(c) for c in select_columns) + ' FROM report ORDER BY rowid', self.db))
+
+	def exportCSV(self) -> int:
+		'''
+		Writes the table out to the csv (temp file, sync, rename - like replaceWithDataFrame) and returns how many rows.
+		Reads on its own connection, so with WAL it's a consistent snapshot and updates carry on while it writes
+		'''
+		with self.db_lock:
+			self.syncFromCSV()
+			if not self.columns:
+				return(0)
+		export_db = sqlite3.connect(self.db_path, timeout=60)
+		row_count = 0
+		try:
+			tmp_path = self.log_path + '.tmp'
+			with open(tmp_path, 'w', newline='') as tmp_file:
+				writer = csv.writer(tmp_file)
+				cursor = export_db.execute('SELECT * FROM report ORDER BY rowid')
+				writer.writerow([c[0] for c in cursor.description])
+				for row in cursor:
+					writer.writerow(['' if v is None else v for v in row])
+					row_count += 1
+				tmp_file.flush()
+				os.fsync(tmp_file.fileno())
+		finally:
+			export_db.close()
+		with self.db_lock:
+			os.replace(tmp_path, self.log_path)
+			with self.db:
+				self.setMetaValue('csv_modified', self.csvModified())
+		return(row_count)
+
+	def doesLogFileExist(self):
+		with self.db_lock:
+			try:
+				self.syncFromCSV()
+			except Exception as ex:
+				print("- WRLog(" + str(sys._getframe().f_lineno) +") (" + self.name + "): - Couldn't import " + self.log_path + ": " + str(ex) + " -")
+			return(len(self.columns) > 0)
+
+	def close(self):
+		with self.db_lock:
+			self.db.close()
\ No newline at end of file
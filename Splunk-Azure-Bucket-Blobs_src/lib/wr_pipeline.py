@@ -0,0 +1,214 @@
+##############################################################################################################
+# Contact: Will Rivendell
+# 	E1: wrivendell@splunk.com
+# 	E2: contact@willrivendell.com
+#
+#   Stages joined by bounded queues - each item flows list -> ... -> download as soon as it's listed, a slow stage
+#   holds back the ones in front of it instead of the whole plan piling up in memory
+##############################################################################################################
+
+### Imports
+import time, sys, queue, threading
+
+from . import wr_logging as log
+
+END_OF_INPUT = object() # put once per worker when everything before a stage has finished
+
+### Classes ###########################################
+
+class Stage():
+	'''
+	One step of a Pipeline. threads workers take items off a bounded inbox (max_waiting) and run function on them.
+	function(item) returns a list of items for the next stage - empty / None drops it, more than one fans it out.
+	With batch_size > 1 function is given a list instead - up to batch_size items, or what turned up within batch_wait_sec -
+	and returns the list to pass on. For stages that are cheaper per batch, i.e. one csv write for 500 rows.
+	A full inbox blocks whoever is putting into it (backpressure), all the way back to the listing.
+	'''
+	def __init__(self, name:str, function, threads=1, max_waiting=1000, batch_size=1, batch_wait_sec=2, log_file=None):
+		self.name = name
+		self.function = function
+		self.threads = max(1, threads)
+		self.batch_size = max(1, batch_size)
+		self.batch_wait_sec = batch_wait_sec
+		self.inbox = queue.Queue(maxsize=max(1, max_waiting))
+		self.next_stage = None
+		self.log_file = log_file
+		self.count_lock = threading.Lock()
+		self.in_count = 0
+		self.out_count = 0
+		self.failed_count = 0
+		self.workers_running = 0
+		self.stopped = False
+
+	def put(self, item) -> bool:
+		'''
+		Blocks while the inbox is full. False if the pipeline was stopped before there was room
+		'''
+		while not self.stopped:
+			try:
+				self.inbox.put(item, timeout=1)
+				return(True)
+			except queue.Full:
+				continue
+		return(False)
+
+	def endInput(self):
+		for x in range(self.threads):
+			self.put(END_OF_INPUT)
+
+	def run(self, items):
+		try:
+			outputs = self.function(items) or []
+		except Exception as ex:
+			with self.count_lock:
+				self.failed_count += len(items) if self.batch_size > 1 else 1
+			print("- WRP(" + str(sys._getframe().f_lineno) +"): " + self.name + " Exception: -")
+			print(ex)
+			if self.log_file:
+				self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " failed on: " + str(items)[:500] + " - " + str(ex)])
+			return
+		with self.count_lock:
+			self.out_count += len(outputs)
+		if self.next_stage:
+			for output in outputs:
+				if not self.next_stage.put(output):
+					return
+
+	def worker(self):
+		batch = []
+		batch_due = 0
+		while True:
+			if batch:
+				wait_sec = max(0, batch_due - time.monotonic())
+			else:
+				wait_sec = 1
+			try:
+				item = self.inbox.get(timeout=wait_sec)
+			except queue.Empty:
+				if batch and not self.stopped:
+					self.run(batch)
+				batch = []
+				if self.stopped:
+					break
+				continue
+			if item is END_OF_INPUT:
+				if batch and not self.stopped:
+					self.run(batch)
+				break
+			if self.stopped:
+				continue # empty the inbox so nothing stays blocked putting into it
+			with self.count_lock:
+				self.in_count += 1
+			if self.batch_size <= 1:
+				self.run(item)
+				continue
+			if not batch:
+				batch_due = time.monotonic() + self.batch_wait_sec
+			batch.append(item)
+			if len(batch) >= self.batch_size:
+				self.run(batch)
+				batch = []
+		with self.count_lock:
+			self.workers_running -= 1
+			last_worker = self.workers_running <= 0
+		if last_worker and self.next_stage and not self.stopped:
+			self.next_stage.endInput()
+
+	def start(self):
+		with self.count_lock:
+			self.workers_running = self.threads
+		for x in range(self.threads):
+			threading.Thread(target=self.worker, name=self.name + '_' + str(x), daemon=True).start()
+
+	def status(self) -> str:
+		return(self.name + " " + str(self.in_count) + " in / " + str(self.inbox.qsize()) + " waiting / " + str(self.out_count) + " out" + (" / " + str(self.failed_count) + " failed" if self.failed_count else ""))
+
+class Pipeline():
+	'''
+	Sources (iterators, i.e. a blob listing per storage account - each read on its own thread) feed the first stage,
+	each stage feeds the next. Nothing waits for a previous stage to finish, memory is capped at max_waiting per stage.
+	When every source is used up each stage finishes what it has and then ends the next one, so running() goes False
+	once the last item is through.
+
+	e.g.
+		from lib import wr_pipeline as wrp
+		download_pipeline = wrp.Pipeline('download_plan')
+		download_pipeline.addStage('filter', filterBlob, threads=2)
+		download_pipeline.addStage('plan', planBatch, batch_size=500)
+		download_pipeline.addStage('download', queueDownload)
+		download_pipeline.start([blob_service.iterBlobsByContainers(account=a) for a in blob_service.accounts])
+		while download_pipeline.running():
+			print(download_pipeline.status())
+	'''
+	def __init__(self, name:str, debug=False):
+		self.name = name
+		self.debug = debug
+		self.stages = []
+		self.source_lock = threading.Lock()
+		self.sources_running = 0
+		self.listed_count = 0
+		self.stopped = False
+		self.log_file = log.LogFile('wrp_' + self.name + '.log', log_folder='./logs/', remove_old_logs=True, log_level=3, log_retention_days=10)
+
+	def addStage(self, name:str, function, threads=1, max_waiting=1000, batch_size=1, batch_wait_sec=2) -> 'Stage':
+		stage = Stage(name, function, threads, max_waiting, batch_size, batch_wait_sec, log_file=self.log_file)
+		if self.stages:
+			self.stages[-1].next_stage = stage
+		self.stages.append(stage)
+		return(stage)
+
+	def feed(self, source):
+		try:
+			for item in source:
+				if not self.stages[0].put(item):
+					break
+				with self.source_lock:
+					self.listed_count += 1
+		except Exception as ex:
+			print("- WRP(" + str(sys._getframe().f_lineno) +"): " + self.name + " Exception: source failed, the items after it are missing. -")
+			print(ex)
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " source failed after " + str(self.listed_count) + " items - " + str(ex)])
+		with self.source_lock:
+			self.sources_running -= 1
+			last_source = self.sources_running <= 0
+		if last_source and not self.stopped:
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " all sources done, " + str(self.listed_count) + " items listed"])
+			self.stages[0].endInput()
+
+	def start(self, sources:list):
+		print("- WRP(" + str(sys._getframe().f_lineno) +"): " + self.name + " started: " + str(len(sources)) + " sources -> " + " -> ".join(s.name for s in self.stages) + " -")
+		self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " started: " + str(len(sources)) + " sources -> " + " -> ".join(s.name + " (" + str(s.threads) + " threads, " + str(s.inbox.maxsize) + " max waiting)" for s in self.stages)])
+		for stage in self.stages:
+			stage.start()
+		with self.source_lock:
+			self.sources_running = len(sources)
+		if not sources:
+			self.stages[0].endInput()
+		for index, source in enumerate(sources):
+			threading.Thread(target=self.feed, name=self.name + '_source_' + str(index), args=(source,), daemon=True).start()
+
+	def running(self) -> bool:
+		return(self.sources_running > 0 or any(s.workers_running > 0 for s in self.stages))
+
+	def wait(self, timeout_sec=None) -> bool:
+		'''
+		True once everything is through, False if timeout_sec ran out first
+		'''
+		deadline = None if timeout_sec is None else time.monotonic() + timeout_sec
+		while self.running():
+			if deadline is not None and time.monotonic() >= deadline:
+				return(False)
+			time.sleep(0.2)
+		return(True)
+
+	def stop(self):
+		'''
+		Sources stop being read and whatever is waiting between stages is dropped - items already passed on are left alone
+		'''
+		self.stopped = True
+		for stage in self.stages:
+			stage.stopped = True
+		self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " stopped: " + self.status()])
+
+	def status(self) -> str:
+		return("listed " + str(self.listed_count) + (" (listing)" if self.sources_running > 0 else "") + " | " + " | ".join(s.status() for s in self.stages))
@@ -839,7 +839,7 @@ class Bucketeer():
 								print("\n\n\n")
 								print("- BUCKETEER(" + str(sys._getframe().f_lineno) +"): Done. Creating dataframe, writing to CSV NOW." )
 								self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + "): Done. Creating dataframe, writing to CSV NOW." + str(idx) ])
-								df.to_csv(guid_csv.log_path, index=False)
+								guid_csv.replaceWithDataFrame(df)
 								print("- BUCKETEER(" + str(sys._getframe().f_lineno) +"): Done. Writing dataframe to CSV." )
 								self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + "): Done. Writing dataframe to CSV." + str(idx) ])	
 							except Exception as ex:
@@ -0,0 +1,145 @@
+##############################################################################################################
+# Contact: Will Rivendell
+# 	E1: wrivendell@splunk.com
+# 	E2: contact@willrivendell.com
+#
+#   Backs a wrq queue (and bandwidth limiter) off when the local splunkd is busy, brings it back up when it isn't
+##############################################################################################################
+
+### Imports
+import time, sys, requests
+
+from . import wr_logging as log
+
+### Classes ###########################################
+
+class SplunkLoadThrottle():
+	'''
+	Polls the local splunkd through a wr_splunk_wapi.SplunkService every poll_interval_sec for:
+		- hostwide cpu (system + user) from /services/server/status/resource-usage/hostwide
+		- the fullest indexing pipeline queue from /services/server/introspection/queues
+	Under pressure (cpu >= cpu_high_pct OR any queue >= queue_high_pct) the queue's threads and the bandwidth limit are halved.
+	When idle (cpu <= cpu_low_pct AND all queues <= queue_low_pct) they step back up towards their max.
+	In between, nothing changes.
+	Each poll gives splunkd request_timeout_sec to answer - one that doesn't is too busy to, so that counts as pressure.
+
+	e.g.
+		from lib import wr_splunk_wapi as wapi
+		from lib import wr_splunk_throttle as wrst
+		local_splunk = wapi.SplunkService('https://127.0.0.1', 8089, 'admin', 'MySecurePassword')
+		throttle = wrst.SplunkLoadThrottle('splunk_load', local_splunk, wrq_download, max_threads=20, bandwidth_limiter=bandwidth_limiter)
+		threading.Thread(target=throttle.start, name='splunk_load_throttle', daemon=True).start()
+
+	Any SplunkService pointed at a stub HTTP server works the same, e.g. wapi.SplunkService('http://127.0.0.1', 18089, 'u', 'p')
+	'''
+	def __init__(self, name: str, splunk_service, queue, max_threads:int, min_threads=1, bandwidth_limiter=None, max_bandwidth_mbps=0,
+				cpu_high_pct=80, cpu_low_pct=50, queue_high_pct=70, queue_low_pct=30, poll_interval_sec=30, request_timeout_sec=5, debug=False):
+		self.name = name
+		self.debug = debug
+		self.splunk_service = splunk_service
+		self.queue = queue # anything with threads_at_once and increaseThreadsTo(), i.e. wrq.Queue
+		self.max_threads = max_threads
+		self.min_threads = max(1, min_threads)
+		self.bandwidth_limiter = bandwidth_limiter
+		self.max_bandwidth_mbps = max_bandwidth_mbps # 0 = no cap when unthrottled
+		self.cpu_high_pct = cpu_high_pct
+		self.cpu_low_pct = cpu_low_pct
+		self.queue_high_pct = queue_high_pct
+		self.queue_low_pct = queue_low_pct
+		self.poll_interval_sec = poll_interval_sec
+		self.request_timeout_sec = request_timeout_sec
+		self.stopped = False
+		# last readings - for dashboards
+		self.last_cpu_pct = 0.0
+		self.last_queue_fill_pct = 0.0
+		self.last_state = 'unknown'
+		self.throttle_events = 0
+		self.log_file = log.LogFile('wrst_' + self.name + '.log', log_folder='./logs/', remove_old_logs=True, log_level=3, log_retention_days=10)
+
+	def checkPressure(self) -> str:
+		'''
+		Returns 'high' (busy, or didn't answer within request_timeout_sec), 'low', 'normal' or 'unknown' (couldn't reach splunkd)
+		'''
+		try:
+			usage = self.splunk_service.getResourceUsage(timeout=self.request_timeout_sec)
+			queue_fill_dict = self.splunk_service.getIndexingQueueFill(timeout=self.request_timeout_sec)
+		except requests.exceptions.Timeout as ex:
+			print("- WRST(" + str(sys._getframe().f_lineno) +"): " + self.name + " splunkd didn't answer within " + str(self.request_timeout_sec) + " sec, treating it as busy. -")
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + ": splunkd didn't answer within " + str(self.request_timeout_sec) + " sec, treating it as busy - " + str(ex)])
+			return('high')
+		except Exception as ex:
+			print("- WRST(" + str(sys._getframe().f_lineno) +"): " + self.name + " Exception: couldn't poll splunkd, leaving limits alone. -")
+			print(ex)
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + ": couldn't poll splunkd, leaving limits alone - " + str(ex)])
+			return('unknown')
+		if not usage and not queue_fill_dict:
+			return('unknown')
+		self.last_cpu_pct = usage.get('cpu_pct', 0.0)
+		if queue_fill_dict:
+			self.last_queue_fill_pct = max(queue_fill_dict.values())
+		else:
+			self.last_queue_fill_pct = 0.0
+		if self.last_cpu_pct >= self.cpu_high_pct or self.last_queue_fill_pct >= self.queue_high_pct:
+			return('high')
+		if self.last_cpu_pct <= self.cpu_low_pct and self.last_queue_fill_pct <= self.queue_low_pct:
+			return('low')
+		return('normal')
+
+	def adjust(self, state:str):
+		current_threads = self.queue.threads_at_once
+		if state == 'high':
+			new_threads = max(self.min_threads, int(current_threads / 2))
+			if self.bandwidth_limiter:
+				current_rate = self.bandwidth_limiter.rateMBps()
+				if current_rate <= 0:
+					current_rate = self.bandwidth_limiter.observedMBps() # unlimited so far, halve what we're actually doing
+				if current_rate > 0:
+					self.bandwidth_limiter.setRate(max(1, round(current_rate / 2, 2)))
+		elif state == 'low':
+			new_threads = min(self.max_threads, current_threads + max(1, int(self.max_threads / 4)))
+			if self.bandwidth_limiter:
+				current_rate = self.bandwidth_limiter.rateMBps()
+				if current_rate > 0:
+					new_rate = current_rate * 2
+					if self.max_bandwidth_mbps > 0 and new_rate >= self.max_bandwidth_mbps:
+						new_rate = self.max_bandwidth_mbps
+					elif self.max_bandwidth_mbps <= 0 and new_threads >= self.max_threads:
+						new_rate = 0 # back to unlimited
+					self.bandwidth_limiter.setRate(new_rate)
+		else:
+			return
+		if not new_threads == current_threads:
+			self.throttle_events += 1
+			self.queue.increaseThreadsTo(new_threads)
+			print("- WRST(" + str(sys._getframe().f_lineno) +"): " + self.name + " splunkd load " + state + " (cpu " + str(round(self.last_cpu_pct, 1)) + "%, queues " + str(round(self.last_queue_fill_pct, 1)) + "%). Threads: " + str(current_threads) + " -> " + str(new_threads) + " -")
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " splunkd load " + state + " (cpu " + str(round(self.last_cpu_pct, 1)) + "%, queues " + str(round(self.last_queue_fill_pct, 1)) + "%). Threads: " + str(current_threads) + " -> " + str(new_threads)])
+
+	def pollOnce(self) -> str:
+		state = self.checkPressure()
+		self.last_state = state
+		if self.debug:
+			print("- WRST(" + str(sys._getframe().f_lineno) +"): " + self.name + " state: " + state + " cpu: " + str(self.last_cpu_pct) + " queues: " + str(self.last_queue_fill_pct) + " -")
+		self.adjust(state)
+		return(state)
+
+	def status(self) -> str:
+		line = "cpu " + str(round(self.last_cpu_pct, 1)) + "% | queues " + str(round(self.last_queue_fill_pct, 1)) + "% | " + self.last_state + " | threads " + str(self.queue.threads_at_once)
+		if self.bandwidth_limiter:
+			line = line + " | limit(MB/s) " + str(self.bandwidth_limiter.rateMBps())
+		return(line)
+
+	def start(self):
+		'''
+		Run in its own thread - loops until stop()
+		'''
+		print("- WRST(" + str(sys._getframe().f_lineno) +"): " + self.name + " started, polling splunkd every " + str(self.poll_interval_sec) + " sec -")
+		self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " started, polling splunkd every " + str(self.poll_interval_sec) + " sec"])
+		while not self.stopped:
+			self.pollOnce()
+			slept = 0
+			while slept < self.poll_interval_sec and not self.stopped:
+				time.sleep(1)
+				slept += 1
+
+	def stop(self):
+		self.stopped = True
@@ -110,10 +110,11 @@ class SplunkService():
 		return(self.isInList(string_to_test, splunk_default_apps))
 
 	# make WEB api calls to a splunk instance - NOT using the Splunk SDK for this
-	def apiCall(self, api_call: str, output_mode = 'json', verify = False, method='get', add_data={}, count=20000) -> 'requests.models.Response':
+	def apiCall(self, api_call: str, output_mode = 'json', verify = False, method='get', add_data={}, count=20000, timeout=None) -> 'requests.models.Response':
 		'''
 		Functions in this class use this automatically, but you CAN call this directly from your main script by
 			using the splunk service class object. e.g:	splunk_service.apiCall('/services/data/inputs/all/')
+		Optional: timeout=<sec> raises requests.exceptions.Timeout instead of waiting forever on a wedged splunkd
 		'''
 		target = (self.sp_host) + ':' + str(self.sp_port) + (api_call) 
 		if '?' in target:
@@ -124,13 +125,13 @@ class SplunkService():
 		if method == 'get':
 			data = {'output_mode': (output_mode)}
 			data.update(add_data)
-			response = requests.get( (target), data=(data), auth=(self.sp_uname, self.sp_pword), verify=(verify))
+			response = requests.get( (target), data=(data), auth=(self.sp_uname, self.sp_pword), verify=(verify), timeout=(timeout))
 		elif method == 'post':
 			data = (add_data)
-			response = requests.post( (target), data=(data), auth=(self.sp_uname, self.sp_pword), verify=(verify))
+			response = requests.post( (target), data=(data), auth=(self.sp_uname, self.sp_pword), verify=(verify), timeout=(timeout))
 		elif method == 'delete':
 			data = (add_data)
-			response = requests.delete( (target), data=(data), auth=(self.sp_uname, self.sp_pword), verify=(verify))
+			response = requests.delete( (target), data=(data), auth=(self.sp_uname, self.sp_pword), verify=(verify), timeout=(timeout))
 		else:
 			response = "- WAPI: API request unknown, please use: get, post or delete. -"
 		return(response)
@@ -524,6 +525,57 @@ class SplunkService():
 				guid_list.append(peer['name'])
 			return(sorted(guid_list))
 
+#### SERVER LOAD ####
+	# return host cpu / mem use as splunkd sees it
+	def getResourceUsage(self, timeout=None) -> dict:
+		'''
+		Returns hostwide resource usage from /services/server/status/resource-usage/hostwide
+		{'cpu_pct': 37.5, 'cpu_system_pct': 12.1, 'cpu_user_pct': 25.4, 'mem_used_pct': 61.0}
+		Empty dict if the call fails
+		'''
+		response = self.apiCall('/services/server/status/resource-usage/hostwide', timeout=timeout)
+		if not response.status_code == 200:
+			print("- WAPI(" + str(sys._getframe().f_lineno) +"): resource-usage call failed, status: " + str(response.status_code) + " -")
+			self.log_file.writeLinesToFile([str(sys._getframe().f_lineno) + " resource-usage call failed, status: " + str(response.status_code)] )
+			return({})
+		j_data = json.loads(response.text)
+		content = j_data['entry'][0]['content']
+		usage = {}
+		usage['cpu_system_pct'] = float(content.get('cpu_system_pct', 0))
+		usage['cpu_user_pct'] = float(content.get('cpu_user_pct', 0))
+		usage['cpu_pct'] = usage['cpu_system_pct'] + usage['cpu_user_pct']
+		try:
+			usage['mem_used_pct'] = float(content['mem_used']) / float(content['mem']) * 100
+		except:
+			usage['mem_used_pct'] = 0.0
+		return(usage)
+
+	# return how full the indexing pipeline queues are
+	def getIndexingQueueFill(self, timeout=None) -> dict:
+		'''
+		Returns each splunkd queue's fill percent from /services/server/introspection/queues
+		{'parsingqueue': 4.2, 'indexqueue': 81.0, ...}
+		Empty dict if the call fails
+		'''
+		response = self.apiCall('/services/server/introspection/queues', timeout=timeout)
+		if not response.status_code == 200:
+			print("- WAPI(" + str(sys._getframe().f_lineno) +"): introspection/queues call failed, status: " + str(response.status_code) + " -")
+			self.log_file.writeLinesToFile([str(sys._getframe().f_lineno) + " introspection/queues call failed, status: " + str(response.status_code)] )
+			return({})
+		j_data = json.loads(response.text)
+		queue_fill_dict = {}
+		for q in j_data['entry']:
+			content = q['content']
+			try:
+				if 'max_size_bytes' in content and float(content['max_size_bytes']) > 0:
+					fill = float(content['current_size_bytes']) / float(content['max_size_bytes']) * 100
+				else:
+					fill = float(content['current_size']) / float(content['max_size']) * 100
+			except:
+				continue
+			queue_fill_dict[q['name']] = round(fill, 2)
+		return(queue_fill_dict)
+
 #https://10.7.16.97:8089/services/shcluster/captain/members
 #
 #/services/shcluster/status  
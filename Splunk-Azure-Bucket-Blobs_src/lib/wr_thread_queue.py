@@ -7,12 +7,315 @@
 ##############################################################################################################
 
 ### Imports
-import datetime, time, uuid, threading, sys
+import datetime, time, threading, sys, collections, heapq, math
 
 from . import wr_logging as log
 
 ### Classes ###########################################
 
+class Job():
+	'''
+	One queued call of function_to_run(*args). Just a descriptor - the queue's pool of worker threads runs it,
+	so a million queued jobs are a million of these, not a million Thread objects.
+	Lower priority runs sooner, seq (the order it was added) breaks ties.
+	Once run, result is what function_to_run returned, or error the exception it raised (result then stays None).
+	'''
+	__slots__ = ('function', 'args', 'name', 'priority', 'seq', 'enqueue_time', 'done', 'start_time', 'finish_time', 'result', 'error')
+
+	def __init__(self, function_to_run:'function', args, name:str, priority=0, seq=0):
+		self.function = function_to_run
+		self.args = args
+		self.name = name
+		self.priority = priority
+		self.seq = seq
+		self.enqueue_time = time.monotonic()
+		self.done = False
+		self.start_time = None
+		self.finish_time = None
+		self.result = None
+		self.error = None
+
+class CompletedJob():
+	'''
+	What's kept of a Job once it's finished - name, the args it ran with (as added), its result / error, start / finish
+	datetimes, seconds taken and bytes (from the queue's job_bytes_function, 0 without one). The function and Job itself are dropped.
+	'''
+	__slots__ = ('name', 'args', 'result', 'error', 'start_time', 'finish_time', 'seconds', 'bytes')
+
+	def __init__(self, job:'Job', seconds:float, job_bytes=0):
+		self.name = job.name
+		self.args = job.args
+		self.result = job.result
+		self.error = job.error
+		self.start_time = job.start_time
+		self.finish_time = job.finish_time
+		self.seconds = seconds
+		self.bytes = job_bytes
+
+class JobCursor():
+	'''
+	Hands each completion to one consumer exactly once, whether or not it's still in the history's ring buffer.
+	Only holds what the consumer hasn't read yet. Get one from JobHistory.cursor(), then call read() whenever - or wait() for
+	the next completion first, so the consumer runs as they come in instead of on a timer.
+	'''
+	def __init__(self, history:'JobHistory'):
+		self.history = history
+		self.unread = collections.deque()
+		self.has_unread = threading.Event() # set by JobHistory.append, cleared once read() empties unread
+
+	def read(self, max_records=0) -> list:
+		'''
+		Returns (and forgets) the CompletedJob()s finished since the last read, oldest first. max_records 0 = all of them
+		'''
+		records = []
+		with self.history.history_lock:
+			while self.unread and (max_records <= 0 or len(records) < max_records):
+				records.append(self.unread.popleft())
+			if not self.unread:
+				self.has_unread.clear()
+		return(records)
+
+	def wait(self, timeout=None) -> bool:
+		'''
+		Blocks until there's something to read (True) or timeout seconds pass (False)
+		'''
+		return(self.has_unread.wait(timeout))
+
+	def pending(self) -> int:
+		return(len(self.unread))
+
+	def close(self):
+		with self.history.history_lock:
+			if self in self.history.cursors:
+				self.history.cursors.remove(self)
+			self.unread.clear()
+			self.has_unread.clear()
+
+class JobHistory():
+	'''
+	A queue's jobs_completed. Keeps the last max_records CompletedJob()s in a ring buffer plus running totals of everything
+	that ever finished, so a long run doesn't grow without end.
+		len(history)      - total jobs ever completed
+		for c in history  - the recent CompletedJob()s still in the ring, oldest first
+		history.stats()   - count, bytes, mean seconds (all time) and p50 / p95 / p99 seconds (of the ring)
+		history.cursor()  - a JobCursor for consumers that need every completion exactly once
+
+	e.g.
+		download_cursor = wrq_download.jobs_completed.cursor()
+		for c in download_cursor.read():
+			print(c.name, c.args, c.seconds)
+	'''
+	def __init__(self, max_records=10000):
+		self.max_records = max_records
+		self.records = collections.deque(maxlen=max_records)
+		self.cursors = []
+		self.history_lock = threading.Lock()
+		self.count = 0
+		self.total_bytes = 0
+		self.total_seconds = 0.0
+
+	def append(self, record:'CompletedJob'):
+		with self.history_lock:
+			self.records.append(record)
+			self.count += 1
+			self.total_bytes += record.bytes
+			self.total_seconds += record.seconds
+			for cursor in self.cursors:
+				cursor.unread.append(record)
+				cursor.has_unread.set()
+
+	def cursor(self) -> 'JobCursor':
+		'''
+		New JobCursor - it gets completions from now on, use it before the queue starts to get them all
+		'''
+		new_cursor = JobCursor(self)
+		with self.history_lock:
+			self.cursors.append(new_cursor)
+		return(new_cursor)
+
+	def recent(self, last=0) -> list:
+		with self.history_lock:
+			records = list(self.records)
+		if last > 0:
+			return(records[-last:])
+		return(records)
+
+	def meanSeconds(self) -> float:
+		if self.count <= 0:
+			return(0.0)
+		return(self.total_seconds / self.count)
+
+	def percentileSeconds(self, percent:float) -> float:
+		'''
+		Nearest rank percentile of the job times still in the ring buffer
+		'''
+		with self.history_lock:
+			durations = sorted([r.seconds for r in self.records])
+		if not durations:
+			return(0.0)
+		rank = max(1, int(-(-percent * len(durations) // 100)))
+		return(durations[min(rank, len(durations)) - 1])
+
+	def stats(self) -> dict:
+		return({'count': self.count, 'bytes': self.total_bytes, 'mean_sec': round(self.meanSeconds(), 2),
+				'p50_sec': round(self.percentileSeconds(50), 2), 'p95_sec': round(self.percentileSeconds(95), 2), 'p99_sec': round(self.percentileSeconds(99), 2)})
+
+	def summary(self) -> str:
+		job_stats = self.stats()
+		return("mean " + str(job_stats['mean_sec']) + "s | p50 " + str(job_stats['p50_sec']) + "s | p95 " + str(job_stats['p95_sec']) + "s | p99 " + str(job_stats['p99_sec']) + "s | " + str(round(job_stats['bytes'] / 1024 / 1024, 2)) + " MB")
+
+	def clear(self):
+		with self.history_lock:
+			self.records.clear()
+			for cursor in self.cursors:
+				cursor.unread.clear()
+			self.count = 0
+			self.total_bytes = 0
+			self.total_seconds = 0.0
+
+	def __len__(self) -> int:
+		return(self.count)
+
+	def __iter__(self):
+		return(iter(self.recent()))
+
+class FairShare():
+	'''
+	Deficit round robin over a queue's waiting jobs split into shares, e.g. one share per splunk index - see Queue.setFairShare().
+	Each share has its own heap of (sort key, seq, Job). Shares with jobs waiting take turns: every turn a share earns
+	quantum x its weight of credit, and its next job runs once the credit covers the job's cost (cost_function(args), i.e. bytes.
+	1 per job without one, which is plain weighted round robin). So over time a weight 2 share gets twice the bytes of a
+	weight 1 share, however many jobs each has waiting or how big they are.
+	Priority still comes first - shares only take turns among the jobs at the best (lowest) priority waiting, so retries (-1)
+	and the like aren't held up. That's judged on the same sort key the heaps are in: with the queue's priority_aging_sec
+	(priority_window here) a share is in if its next job's key is less than one priority step behind the best one, so a
+	share whose next job has aged to the front isn't shut out by its raw priority.
+	Stands in for the jobs_waiting heap: len(), iterating (sort key, seq, Job) entries and clear() work the same.
+	'''
+	def __init__(self, share_function:'function', weights=None, default_weight=1, quantum=1, cost_function=None, priority_window=0):
+		self.share_function = share_function # share_function(args) -> share name
+		self.priority_window = priority_window # sort key distance still counted as the best priority - the queue's priority_aging_sec, 0 for strict priority
+		self.weights = dict(weights or {}) # share name -> weight, default_weight for the rest
+		self.default_weight = default_weight
+		self.quantum = quantum # credit per turn at weight 1, in cost_function units
+		self.cost_function = cost_function
+		self.share_heaps = {} # share -> heap of (sort key, seq, Job)
+		self.deficits = {} # share -> credit not spent yet
+		self.turns = collections.deque() # shares with jobs waiting, in turn order
+		self.served = {} # share -> [jobs taken, cost taken] all time
+		self.count = 0
+
+	def weight(self, share:str) -> float:
+		return(max(0.001, float(self.weights.get(share, self.default_weight))))
+
+	def setWeight(self, share:str, weight:float):
+		self.weights[share] = weight
+
+	def shareOf(self, job:'Job') -> str:
+		try:
+			return(str(self.share_function(job.args)))
+		except Exception:
+			return('')
+
+	def cost(self, job:'Job') -> float:
+		if not self.cost_function:
+			return(1)
+		try:
+			return(max(1, float(self.cost_function(job.args))))
+		except Exception:
+			return(1)
+
+	def push(self, entry:tuple):
+		share = self.shareOf(entry[2])
+		share_heap = self.share_heaps.get(share)
+		if share_heap is None:
+			share_heap = []
+			self.share_heaps[share] = share_heap
+			self.deficits[share] = 0
+			self.turns.append(share)
+		heapq.heappush(share_heap, entry)
+		self.count += 1
+
+	def pop(self) -> tuple:
+		'''
+		The next entry by deficit round robin. Works out which share's turn comes up first with enough credit instead of going
+		round turn by turn, so a huge job against a small quantum costs the same as any other
+		'''
+		best_key = min(self.share_heaps[share][0][0] for share in self.turns)
+		turn_count = len(self.turns)
+		eligible = []
+		chosen = None # (turn number it's served on, position, share, cost, credit)
+		for position, share in enumerate(self.turns):
+			sort_key, seq, job = self.share_heaps[share][0]
+			if not (sort_key == best_key or sort_key - best_key < self.priority_window):
+				continue
+			cost = self.cost(job)
+			credit = self.quantum * self.weight(share)
+			rounds = max(0, math.ceil((cost - self.deficits[share]) / credit))
+			served_on = rounds * turn_count + position
+			eligible.append((position, share, credit))
+			if chosen is None or served_on < chosen[0]:
+				chosen = (served_on, position, share, cost, credit)
+		served_on, chosen_position, chosen_share, cost, credit = chosen
+		# every share that had a turn before the chosen one was served earned its credit for each of those turns
+		for position, share, share_credit in eligible:
+			if served_on > position:
+				self.deficits[share] += math.ceil((served_on - position) / turn_count) * share_credit
+		self.deficits[chosen_share] -= cost
+		self.turns.rotate(-chosen_position) # it stays first - it keeps going while its credit lasts
+		entry = heapq.heappop(self.share_heaps[chosen_share])
+		if not self.share_heaps[chosen_share]:
+			del self.share_heaps[chosen_share]
+			del self.deficits[chosen_share]
+			self.turns.popleft()
+		served = self.served.setdefault(chosen_share, [0, 0])
+		served[0] += 1
+		served[1] += cost
+		self.count -= 1
+		return(entry)
+
+	def rebuild(self, entries:list):
+		'''
+		Re-sorts everything after sort keys changed (reprioritize()). Credit and turn order are kept for shares still waiting
+		'''
+		self.share_heaps = {}
+		self.count = 0
+		turns = self.turns
+		self.turns = collections.deque()
+		deficits = self.deficits
+		self.deficits = {}
+		for entry in entries:
+			self.push(entry)
+		self.turns = collections.deque([share for share in turns if share in self.share_heaps] + [share for share in self.turns if not share in turns])
+		for share in self.share_heaps:
+			self.deficits[share] = deficits.get(share, 0)
+
+	def clear(self):
+		self.share_heaps = {}
+		self.deficits = {}
+		self.turns.clear()
+		self.count = 0
+
+	def waitingByShare(self) -> dict:
+		return({share: len(share_heap) for share, share_heap in self.share_heaps.items()})
+
+	def status(self, top=8) -> str:
+		'''
+		The top shares by jobs waiting - "<share> (w<weight>) <waiting> waiting / <served> done"
+		'''
+		waiting = self.waitingByShare()
+		shares = sorted(waiting, key=lambda share: -waiting[share])[:top]
+		line = " | ".join(str(share or '-') + " (w" + str(self.weight(share)) + ") " + str(waiting[share]) + " waiting / " + str(self.served.get(share, [0, 0])[0]) + " done" for share in shares)
+		if len(waiting) > top:
+			line = line + " | +" + str(len(waiting) - top) + " more shares"
+		return(str(len(waiting)) + " shares waiting: " + line)
+
+	def __len__(self) -> int:
+		return(self.count)
+
+	def __iter__(self):
+		return(iter([entry for share_heap in list(self.share_heaps.values()) for entry in share_heap]))
+
 class Queue():
 	'''
 	Import this into any script where you want to run parallel jobs. This isn't POOLING from the multiprocessing
@@ -20,6 +323,8 @@ class Queue():
 	and can take awhile. Particularly (but not limited to) copy, move, delete, download, upload, cross server operations etc.
 	You can of course kill your resources still. 
 	
+	Jobs are run by a fixed pool of threads_at_once long lived worker threads (started by start()), not a thread per job.
+	Workers wait on one condition variable, so a finished job's slot is refilled straight away and an idle queue uses no CPU.
 	You can raise or lower threads_at_once on the fly by running: wrq_print.increaseThreadsTo(8)
 	If you're monitoring your HDD activity, Memory, Network and CPU, you could make this "smart" but auto adjusting based on
 		your specs.
@@ -109,13 +414,13 @@ class Queue():
 
 		check jobs completed list:
 
-			for jwrq_print.jobs_complete:
-				print(j)
+			for c in wrq_print.jobs_completed:
+				print(c.name, c.seconds)
 
 		# ... see function __init__ comments for more details on job lists
 	'''
 	# this is the startup script, init?
-	def __init__(self, name: str, threads_at_once: int, inactive_queue_timeout_sec=60, debug=False):
+	def __init__(self, name: str, threads_at_once: int, inactive_queue_timeout_sec=60, completed_history=10000, job_bytes_function=None, priority_aging_sec=0, debug=False):
 		self.debug = debug # enable debug printouts
 		self.name = name # unique thread name
 		self.threads_at_once = threads_at_once # how many max threads can run at one time
@@ -127,26 +432,40 @@ class Queue():
 		self.inactive_timeout_counter = 0 # the actual count down, not just the max
 		self.total_time_taken = 0 # sum of time taken for all jobs in minutes - accumulates
 		self.average_job_time = 0 # average time per job in minutes
-		self.estimated_finish_time = 0 # estimated time to copletion based on average
+		self.estimated_finish_time = 0 # estimated minutes to completion - waiting jobs x average job time / threads
+		self.job_counter = 0 # for job names and FIFO order within a priority
+		self.priority_aging_sec = priority_aging_sec # 0 = strict priority, otherwise each priority step is worth this many seconds of waiting so nothing starves
+		self.job_bytes_function = job_bytes_function # optional job_bytes_function(Job) -> bytes the job moved, for jobs_completed stats
+		self.job_condition = threading.Condition() # guards the job lists - notified on every add, finish, pause / resize
+		self.worker_count = 0 # the worker pool
+		self.workers_exit = False
+		self.holding = False # set by drain() - workers finish what they have but take nothing new
+		self.slots_lent = 0 # slots lent out with lendSlot() (i.e. tail helpers) - they count against threads_at_once like running jobs
 		self.log_file = log.LogFile('wrq_' + self.name + '.log', log_folder='./logs/', remove_old_logs=True, log_level=3, log_retention_days=10)
 
 		'''
-		The following tuples have two entries and are in the format of
-		(threading.Thread, str(args used in the command))
-		The job/thread details are at index 0 while the command it runs is index [1]
+		jobs_waiting (a heap of (sort key, seq, Job), see sortKey()) and jobs_active (a dict of job name -> Job) hold Job()s. Jobs from
+		a generator / iterator passed to add() aren't made until a slot frees up and nothing else is waiting, so they sit in job_sources
+		and aren't counted in len(jobs_waiting) - use hasWaiting().
+		jobs_completed is a JobHistory() - the last completed_history CompletedJob()s plus all time totals
 		i.e.
 
-			for j in wrq_print.jobs_completed:
-        		job_name = j[0].name
-        		job_id = j[0].ident
-        		job_command = j[1]
-				job_start_time = j[2]    - datetime.datetime
-				job_finish_time = j[3]   - datetime.datetime
-				job_time_taken = j[4]    - float in minutes
-		'''
-		self.jobs_waiting = [] # jobs waiting their turn to be processed when active frees up
-		self.jobs_active = [] # jobs currently being processed
-		self.jobs_completed = [] # jobs completed are moved here from active for record keeping
+			for c in wrq_print.jobs_completed:
+				job_name = c.name
+				job_args = c.args                - as added, not a str
+				job_result = c.result            - what the function returned
+				job_error = c.error              - the exception it raised, None if it didn't
+				job_start_time = c.start_time    - datetime.datetime
+				job_finish_time = c.finish_time  - datetime.datetime
+				job_time_taken = c.seconds       - seconds
+			len(wrq_print.jobs_completed)      - all jobs ever completed
+			wrq_print.jobs_completed.cursor()  - to read every completion exactly once, see JobCursor
+		'''
+		self.jobs_waiting = [] # heap of jobs waiting their turn to be processed when active frees up, lowest sort key first - a FairShare after setFairShare()
+		self.fair_share = None
+		self.jobs_active = {} # jobs currently being processed, by job name
+		self.job_sources = collections.deque() # [function_to_run, iterator of args, priority, priority_function] from add(), pulled one job at a time as slots free up
+		self.jobs_completed = JobHistory(completed_history) # jobs completed are recorded here from active for record keeping
 		
 	# increases threads at once
 	def increaseThreadsTo(self, new_threads_at_once: int):
@@ -158,86 +477,203 @@ class Queue():
 		if new_threads_at_once <= 0:
 			new_threads_at_once = 1
 		self.threads_at_once = new_threads_at_once
-
-	# calculate thread and queue timing info
-	def updateTimings(self, additional_time:float):
-		additional_time = additional_time / ( float(self.threads_at_once) / 3)
-		self.total_time_taken = self.total_time_taken + additional_time
-		self.average_job_time = self.total_time_taken / float(len(self.jobs_completed)) / 60
-		self.estimated_finish_time = len(self.jobs_waiting) * self.average_job_time
-
-	# check, finish, calculate time on active jobs
-	def activeJobsHandler(self):
-		if len(self.jobs_active) > 0:
-			for j in self.jobs_active:
-				time.sleep(0.5)
-				if j[0].is_alive():
-					pass
-				else:
-					j.append(datetime.datetime.now())
-					diff = j[3] - j[2]
-					diff = diff.seconds
-					j.append(diff)
-					self.jobs_completed.append(j)
-					self.updateTimings(diff)
-					self.jobs_active.remove(j)
-		if self.paused:
-			time.sleep(10)
+		if self.queue_started:
+			self.resizeWorkers()
+
+	# grow or shrink the worker pool to threads_at_once
+	def resizeWorkers(self):
+		with self.job_condition:
+			while self.worker_count < self.threads_at_once:
+				self.worker_count += 1
+				threading.Thread(target=self.worker, name=self.name + '_w_' + str(self.worker_count), daemon=True).start()
+			self.job_condition.notify_all() # extra workers exit as soon as they're idle
+
+	# one long lived worker of the pool - takes the next waiting job the moment it's free, until the pool shrinks or is cleared
+	def worker(self):
+		job = None
+		while True:
+			with self.job_condition:
+				if job:
+					self.jobFinished(job) # same lock as taking the next one, so active never dips to 0 in between
+				job = None
+				while not job:
+					if self.workers_exit or self.worker_count > self.threads_at_once:
+						self.worker_count -= 1
+						return
+					if self.hasWaiting() and not self.paused and not self.holding and len(self.jobs_active) + self.slots_lent < self.threads_at_once:
+						job = self.nextJob()
+					else:
+						self.job_condition.wait()
+				self.jobs_active[job.name] = job
+			job.start_time = datetime.datetime.now()
+			try:
+				job.result = job.function(*job.args)
+			except SystemExit:
+				pass
+			except Exception as ex:
+				job.error = ex
+				print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " Exception in job " + job.name + ": " + str(ex) + " -")
+				self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": Exception in job " + job.name + " " + str(job.args) + ": " + str(ex)] )
+			job.finish_time = datetime.datetime.now()
+			job.done = True
 			if self.debug:
-				print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " Queue is paused. -")
-				self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": Queue is paused."] )
+				print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " Finished " + job.name + ", still " + str(len(self.jobs_active) - 1) + " running. -")
+				self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": Finished " + job.name + ", still " + str(len(self.jobs_active) - 1) + " running."] )
+
+	# completion - moves the job to completed and wakes the next worker / the scheduler straight away. Call holding job_condition
+	def jobFinished(self, job:'Job'):
+		diff = (job.finish_time - job.start_time).total_seconds()
+		del self.jobs_active[job.name]
+		job_bytes = 0
+		if self.job_bytes_function:
+			try:
+				job_bytes = int(self.job_bytes_function(job))
+			except Exception:
+				job_bytes = 0
+		self.jobs_completed.append(CompletedJob(job, diff, job_bytes))
+		self.updateTimings(diff)
+		self.job_condition.notify_all()
+
+	# True while there are jobs_waiting or lazy job sources not yet used up
+	def hasWaiting(self) -> bool:
+		return(len(self.jobs_waiting) > 0 or len(self.job_sources) > 0)
+
+	# where a job sits in jobs_waiting - lower runs sooner
+	def sortKey(self, job:'Job') -> float:
+		if self.priority_aging_sec > 0:
+			return(job.priority * self.priority_aging_sec + job.enqueue_time)
+		return(job.priority)
+
+	# puts a job in jobs_waiting - its heap, or its share's with fair share on. Call holding job_condition
+	def pushWaiting(self, job:'Job'):
+		if self.fair_share is not None:
+			self.jobs_waiting.push((self.sortKey(job), job.seq, job))
 		else:
-			if self.debug:
-				print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " Still "+str(len(self.jobs_active))+" running. -")
-				self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": Still "+str(len(self.jobs_active))+" running."] )
+			heapq.heappush(self.jobs_waiting, (self.sortKey(job), job.seq, job))
+
+	# switch jobs_waiting to deficit round robin between shares of the jobs, see FairShare
+	def setFairShare(self, share_function:'function', weights=None, default_weight=1, quantum=1, cost_function=None) -> 'FairShare':
+		'''
+		e.g. the same bytes per index, cisco twice as fast, whatever the order they were added in:
+			wrq_download.setFairShare(lambda args: args[0].split('/')[0], weights={'cisco': 2}, quantum=64*1024**2, cost_function=lambda args: int(args[1]))
+		Jobs already waiting are moved over. Returns the FairShare (setWeight() on it changes a weight on the fly)
+		'''
+		with self.job_condition:
+			fair_share = FairShare(share_function, weights, default_weight, quantum, cost_function, priority_window=self.priority_aging_sec)
+			for entry in list(self.jobs_waiting):
+				fair_share.push(entry)
+			self.fair_share = fair_share
+			self.jobs_waiting = fair_share
+		print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " fair share on, weights: " + str(fair_share.weights) + " (others " + str(default_weight) + ") -")
+		self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": fair share on, weights: " + str(fair_share.weights) + " (others " + str(default_weight) + "), quantum: " + str(quantum)] )
+		return(fair_share)
+
+	# makes the Job for one set of args. Call holding job_condition
+	def makeJob(self, function_to_run:'function', args, priority=0, priority_function=None) -> 'Job':
+		if priority_function:
+			try:
+				priority = priority_function(args)
+			except Exception as ex:
+				self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": priority_function failed on " + str(args) + ", using " + str(priority) + ": " + str(ex)] )
+		self.job_counter += 1
+		return(Job(function_to_run, args, self.name + '_j_' + str(self.job_counter), priority, self.job_counter))
+
+	# pops the next waiting job, pulling one from the oldest job source when jobs_waiting is empty. Call holding job_condition
+	def nextJob(self):
+		if self.jobs_waiting:
+			if self.fair_share is not None:
+				return(self.jobs_waiting.pop()[2])
+			return(heapq.heappop(self.jobs_waiting)[2])
+		while self.job_sources:
+			function_to_run, source, priority, priority_function = self.job_sources[0]
+			try:
+				args = next(source)
+			except StopIteration:
+				self.job_sources.popleft()
+				continue
+			except Exception as ex:
+				print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " Exception reading job source, dropping it: " + str(ex) + " -")
+				self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": Exception reading job source, dropping it: " + str(ex)] )
+				self.job_sources.popleft()
+				continue
+			return(self.makeJob(function_to_run, args, priority, priority_function))
+		return(None)
+
+	def reprioritize(self, match_function:'function', new_priority) -> int:
+		'''
+		Changes the priority of already waiting jobs whose args match, e.g. to promote an index:
+			wrq_download.reprioritize(lambda args: '/cisco/' in args[0], -1)
+		Returns how many jobs were changed. Jobs still in a generator source keep the priority they were added with.
+		'''
+		changed = 0
+		with self.job_condition:
+			entries = []
+			for entry in self.jobs_waiting:
+				job = entry[2]
+				try:
+					matched = match_function(job.args)
+				except Exception:
+					matched = False
+				if matched and not job.priority == new_priority:
+					job.priority = new_priority
+					changed += 1
+					entry = (self.sortKey(job), job.seq, job)
+				entries.append(entry)
+			if changed > 0 and self.fair_share is not None:
+				self.jobs_waiting.rebuild(entries)
+			elif changed > 0:
+				heapq.heapify(entries)
+				self.jobs_waiting[:] = entries
+		print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " " + str(changed) + " waiting jobs set to priority " + str(new_priority) + " -")
+		self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": " + str(changed) + " waiting jobs set to priority " + str(new_priority)] )
+		return(changed)
+
+	# calculate thread and queue timing info - job count based, for jobs of very different sizes use a byte weighted estimate, i.e. wr_transfer_progress.ThroughputMeter
+	def updateTimings(self, additional_time:float):
+		self.total_time_taken = self.total_time_taken + additional_time / 60
+		self.average_job_time = self.jobs_completed.meanSeconds() / 60
+		self.estimated_finish_time = len(self.jobs_waiting) * self.average_job_time / max(1, self.threads_at_once)
+
+	# lend an idle slot to work outside the queue - False if nothing's free or jobs are waiting for it
+	def lendSlot(self) -> bool:
+		'''
+		Takes one of threads_at_once for work that isn't a job, i.e. a tail helper, so jobs added later (requeues etc)
+		can't take it as well and push the concurrency over threads_at_once. Give it back with returnSlot()
+		'''
+		with self.job_condition:
+			if self.hasWaiting() or self.paused or self.holding or len(self.jobs_active) + self.slots_lent >= self.threads_at_once:
+				return(False)
+			self.slots_lent += 1
+			return(True)
+
+	def returnSlot(self):
+		with self.job_condition:
+			self.slots_lent = max(0, self.slots_lent - 1)
+			self.job_condition.notify_all()
 
-	# checks to see how much room active jobs can hold and relays that to activateNextJobs()
+	# how many more jobs could run right now
 	def activeJobsRoom(self):
-		active_room = self.threads_at_once - len(self.jobs_active)
+		active_room = self.threads_at_once - len(self.jobs_active) - self.slots_lent
 		if active_room > 0:
 			return(int(active_room))
 		else:
-			return(1)
+			return(0)
 
-	# moves new jobs from waiting to active and starts if there's room
-	def activateNextJobs(self):
-		job_max = 1
-		if self.debug:
-			print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " " + str( len(self.jobs_active) )+" running, adding next. -")
-			self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ":" +  str( len(self.jobs_active) )+" running, adding next."] )
-		# add as many jobs as we have room and start them in the active queue
-		if len(self.jobs_waiting) > 0:
-			if not self.threads_at_once == 1:
-				if len(self.jobs_waiting) < self.activeJobsRoom():
-					job_max = len(self.jobs_waiting)
-				else:
-					job_max = self.activeJobsRoom()
-			# to active list from waiting
-			tmp_list = self.jobs_waiting[0:(job_max)]
-			for i in tmp_list:
-				self.jobs_active.append(i)
-				self.jobs_waiting.remove(i)
-			# start any newly added jobs
-			for j in self.jobs_active:
-				if j[0].is_alive():
-					continue
-				else:
-					try:
-						# add start time
-						j.append(datetime.datetime.now())
-						j[0].start()
-					except:
-						continue
-			if self.debug:
-				print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " Started "+str( job_max )+" new processes. -")
-				self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": Started " + str( job_max ) + " new processes."] )
-		else:
-			if self.debug:
-				print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " No more jobs waiting in the queue, only active left. -")
-				self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": No more jobs waiting in the queue, only active left."] )
-			while len(self.jobs_active) > 0:
-				time.sleep(10)
-				self.activeJobsHandler()
+	# backpressure for a producer adding jobs one at a time - blocks while jobs_waiting is full
+	def waitForRoom(self, max_waiting:int, timeout_sec=None) -> bool:
+		'''
+		Waits until fewer than max_waiting jobs are waiting (woken as jobs finish and the next ones are taken).
+		Returns False if timeout_sec ran out or the queue was stopped first.
+		'''
+		deadline = None if timeout_sec is None else time.monotonic() + timeout_sec
+		with self.job_condition:
+			while len(self.jobs_waiting) >= max_waiting:
+				if self.stopped or self.workers_exit:
+					return(False)
+				if deadline is not None and time.monotonic() >= deadline:
+					return(False)
+				self.job_condition.wait(timeout=1)
+		return(True)
 
 	# removes all jobs from the queues and joins them
 	def clearJobs(self, wait_for_complete=False):
@@ -245,21 +681,36 @@ class Queue():
 		Clears ALL lists of jobs, waits for completion of jobs unless forced
 		Runs at the end of queue timeout
 		'''
-		while len(self.jobs_active) > 0 or len(self.jobs_waiting) > 0 or len(self.jobs_completed) > 0:
-			list_of_job_lists = [(self.jobs_active), (self.jobs_waiting), (self.jobs_completed)]
-			for job_list in list_of_job_lists:
-				for j in job_list:
-					if j[0].is_alive():
-						if wait_for_complete:
-							continue
-						j[0].join()
-						job_list.remove(j)
-					else:
-						job_list.remove(j)
-		else:
-			return(True)
+		with self.job_condition:
+			self.jobs_waiting.clear()
+			self.job_sources.clear()
+			if not wait_for_complete:
+				while len(self.jobs_active) > 0:
+					self.job_condition.wait()
+			self.jobs_active.clear()
+			self.jobs_completed.clear()
+			self.workers_exit = True
+			self.job_condition.notify_all()
+		return(True)
 
 	# can be called from anywhere to return the current status processing threads
+	def drain(self, timeout_sec:float, finish_waiting=False) -> bool:
+		'''
+		For a clean shutdown. By default workers stop taking new jobs (they stay in jobs_waiting, add() still works) and this
+		waits up to timeout_sec for the active ones to finish. finish_waiting=True waits for the waiting jobs to run as well.
+		Returns True if the queue got there in time.
+		'''
+		deadline = time.monotonic() + timeout_sec
+		with self.job_condition:
+			if not finish_waiting:
+				self.holding = True
+			while len(self.jobs_active) > 0 or (finish_waiting and self.hasWaiting()):
+				remaining_sec = deadline - time.monotonic()
+				if remaining_sec <= 0 or (self.workers_exit and len(self.jobs_active) <= 0):
+					return(False)
+				self.job_condition.wait(timeout=remaining_sec)
+		return(True)
+
 	def status(self):
 		'''
 		returns QUEUE status
@@ -272,8 +723,8 @@ class Queue():
 			if self.paused:
 				return("paused")
 			active = False
-			for ja in self.jobs_active:
-				if ja[0].is_alive():
+			for ja in list(self.jobs_active.values()):
+				if not ja.done:
 					active = True
 					return('active')
 		else:
@@ -284,20 +735,26 @@ class Queue():
 			return("stalled")
 
 	# pauses processing of the active queue - toggles - check status function for paused status
-	def pause(self):
+	def pause(self, block=True):
 		'''
 		Toggles. If paused and called it unpauses.
+		block=True holds the caller while paused, and the queue is cleared if it's left paused longer than pause_timeout_sec.
+		block=False pauses and returns straight away with no timeout - for pausing from outside the script (wr_control), see resume()
 		'''
 		if self.paused:
 			if self.debug:
 				print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " Queue already paused, unpausing. -")
 				self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": Queue already paused, unpausing."] )
-			self.paused = False
+			with self.job_condition:
+				self.paused = False
+				self.job_condition.notify_all()
 			timeout = self.pause_timeout_sec
 		else:
 			print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " Queue will pause after current jobs finish. -")
 			self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": Queue will pause after current jobs finish."] )
 			self.paused = True
+			if not block:
+				return
 			timeout = self.pause_timeout_sec
 			while self.paused:
 				# If paused, start timeout timer
@@ -315,6 +772,17 @@ class Queue():
 						self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": - All jobs cleared after pause timeout."] )
 						sys.exit(1)
 
+	# unpauses if paused - waiting jobs start again straight away
+	def resume(self) -> bool:
+		if not self.paused:
+			return(False)
+		with self.job_condition:
+			self.paused = False
+			self.job_condition.notify_all()
+		print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " Queue resumed. -")
+		self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": Queue resumed."] )
+		return(True)
+
 	def stop(self):
 		'''
 		Clears all jobs and stops the queue when called
@@ -330,10 +798,12 @@ class Queue():
 				self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": - All jobs cleared after stop."] )
 				sys.exit(1)
 		else:
-			self.stopped = True
+			with self.job_condition:
+				self.stopped = True
+				self.job_condition.notify_all()
 
 	# adds a list of jobs to the self.jobs_waiting queue
-	def add(self, function_to_run: 'function', arg_list_to_process: list, start_after_add=False):
+	def add(self, function_to_run: 'function', arg_list_to_process: list, start_after_add=False, priority=0, priority_function=None):
 		'''
 		Function_to_run should be the function you want to spawn up workers to tackle in parallel.
 		TLDR: 
@@ -351,19 +821,35 @@ class Queue():
 
 		Once the queue is STARTED, it will process all jobs and then close the queue after a timeout.
 
+		arg_list_to_process can also be any iterator / generator of args (e.g. lines streamed from a plan file). It's pulled one
+			job at a time as slots free up, so it's never all in memory - those jobs aren't in len(jobs_waiting), see hasWaiting().
+
+		priority - lower runs sooner (default 0, e.g. -1 to jump ahead). Same priority jobs run in the order they were added.
+			priority_function(args) -> priority instead works it out per job. With priority_aging_sec on the queue, a job's
+			priority is traded against how long it's waited, so low priority jobs still get a turn. See reprioritize() to change it later.
+
 		start_after_add True will auto start the queue (and hold up the script that runs this until queue is completed).
 		Therefore if you want your main script to keep doing things after starting jobs in this queue 
 			use <wrq_name>.start() instead inside a simple thread (see start() for details)
 		'''
+		if not isinstance(arg_list_to_process, (list, tuple)):
+			with self.job_condition:
+				self.job_sources.append([function_to_run, iter(arg_list_to_process), priority, priority_function])
+				self.job_condition.notify_all()
+			if self.debug:
+				print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " job source added: " + str(arg_list_to_process) + " -")
+				self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": job source added: " + str(arg_list_to_process)] )
+			if start_after_add:
+				self.start()
+			return
 		for i in arg_list_to_process:
 			if self.debug:
 				print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " job added: " + str(i) + " -")
 				self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": job added: " + str(i)] )
-			job_name = str(self.name) + '_j_' + str(uuid.uuid4().hex)
-			t = threading.Thread( target=function_to_run, name=job_name, args=(i) )
-			t.daemon = True
-			tmp_job = [t, str(i)]
-			self.jobs_waiting.append(tmp_job)
+			with self.job_condition:
+				job = self.makeJob(function_to_run, i, priority, priority_function)
+				self.pushWaiting(job)
+				self.job_condition.notify_all() # not notify() - start()'s loop and drain() wait on it too and could take the only wake up
 		if start_after_add:
 			self.start()
 
@@ -383,35 +869,28 @@ class Queue():
 			return
 		self.inactive_timeout_counter = self.inactive_queue_timeout_sec
 		self.queue_started = True
-		self.inactive_timeout_counter = self.inactive_queue_timeout_sec
-		# Run this processing loop as long as there are items in the either job list
+		self.resizeWorkers()
+		# Workers pick jobs up themselves - this just sleeps on the job condition (woken by adds / finishes) and counts down the inactive timeout
 		counter = -1
 		while self.inactive_timeout_counter > 0:
+			if self.stopped:
+				self.stop()
+			with self.job_condition:
+				if self.hasWaiting() or len(self.jobs_active) > 0:
+					self.inactive_timeout_counter = self.inactive_queue_timeout_sec
+					self.job_condition.wait(timeout=1)
+					continue
+				self.job_condition.wait(timeout=1)
+				if self.hasWaiting() or self.stopped:
+					continue
+			# Should only get here when all jobs are processed
 			counter += 1
-			while len(self.jobs_waiting) > 0 or len(self.jobs_active) > 0 and not self.stopped:
-				self.inactive_timeout_counter = self.inactive_queue_timeout_sec
+			self.inactive_timeout_counter -= 1
+			notify = self.inactive_queue_timeout_sec / 10
+			if counter % notify == 0:
 				if self.debug:
-					print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + ": Still actively looking for and processing jobs... -")
-					self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": Still actively looking for and processing jobs..."] )
-				# Wait until a job finishes before starting another or stay in loop while paused
-				while len(self.jobs_active) >= (self.threads_at_once) or self.paused:
-					if self.stopped:
-						self.stop()
-					self.activeJobsHandler() # will remove any finished and break the while loop if so
-				else:
-					# Start the newly added jobs in active list
-					self.activateNextJobs()
-			else:
-				# Should only enter the below code when all jobs are processed
-				time.sleep(1)
-				if self.stopped:
-					self.stop()
-				self.inactive_timeout_counter -= 1
-				notify = self.inactive_queue_timeout_sec / 10
-				if counter % notify == 0:
-					if self.debug:
-						print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + ": Inactive timeout in: " + str(self.inactive_timeout_counter) + " seconds -")
-						self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": Inactive timeout in: " + str(self.inactive_timeout_counter) + " seconds"] )
+					print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + ": Inactive timeout in: " + str(self.inactive_timeout_counter) + " seconds -")
+					self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": Inactive timeout in: " + str(self.inactive_timeout_counter) + " seconds"] )
 		else:
 			print("- WRQ(" + str(sys._getframe().f_lineno) +") " + self.name + " " + self.name + " is exiting due to no new jobs added. -")
 			self.log_file.writeLinesToFile([ "(" + str(sys._getframe().f_lineno) + ") - " + self.name + ": is exiting due to no new jobs added."] )
@@ -0,0 +1,135 @@
+##############################################################################################################
+# Contact: Will Rivendell
+# 	E1: wrivendell@splunk.com
+# 	E2: contact@willrivendell.com
+#
+#   Shared limits for download threads - memory held in flight and network bandwidth
+##############################################################################################################
+
+### Imports
+import sys, time, threading
+
+from . import wr_logging as log
+
+### Globals ###########################################
+log_file = log.LogFile('wrtl.log', log_folder='./logs/', remove_old_logs=True, log_level=3, log_retention_days=10)
+
+### Classes ###########################################
+
+class MemoryBudget():
+	'''
+	A global byte budget for data that has been pulled off the network but not yet written to disk.
+	Every download thread reserves the bytes of a chunk BEFORE fetching it and the writer releases them once it hits disk.
+	If the budget is spent, the download thread blocks until writers catch up.
+
+	e.g.
+		from lib import wr_transfer_limits as wrtl
+		memory_budget = wrtl.MemoryBudget('download_buffers', 512)
+		memory_budget.acquire(4194304)
+		... fetch and write ...
+		memory_budget.release(4194304)
+
+	budget_mb=0 means unlimited (still counts usage for the dashboard).
+	A single reservation bigger than the whole budget is let through when nothing else is held so it can't deadlock.
+	'''
+	def __init__(self, name: str, budget_mb=512, debug=False):
+		self.name = name
+		self.debug = debug
+		self.budget_bytes = int(budget_mb * 1024 * 1024)
+		self.used_bytes = 0
+		self.peak_bytes = 0
+		self.waits = 0 # how many times a thread had to block on the budget
+		self.budget_condition = threading.Condition()
+
+	def acquire(self, nbytes:int):
+		with self.budget_condition:
+			if self.budget_bytes > 0:
+				waited = False
+				while self.used_bytes > 0 and self.used_bytes + nbytes > self.budget_bytes:
+					if not waited:
+						waited = True
+						self.waits += 1
+						if self.debug:
+							print("- WRTL(" + str(sys._getframe().f_lineno) +"): " + self.name + " budget full, waiting to reserve " + str(nbytes) + " bytes -")
+					self.budget_condition.wait()
+			self.used_bytes += nbytes
+			if self.used_bytes > self.peak_bytes:
+				self.peak_bytes = self.used_bytes
+
+	def release(self, nbytes:int):
+		with self.budget_condition:
+			self.used_bytes -= nbytes
+			if self.used_bytes < 0:
+				log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " released more than was reserved, resetting to 0."])
+				self.used_bytes = 0
+			self.budget_condition.notify_all()
+
+	def usedMB(self) -> float:
+		return(round(self.used_bytes / 1024.0**2, 2))
+
+	def peakMB(self) -> float:
+		return(round(self.peak_bytes / 1024.0**2, 2))
+
+	def budgetMB(self) -> float:
+		return(round(self.budget_bytes / 1024.0**2, 2))
+
+class BandwidthLimiter():
+	'''
+	Token bucket shared by all download threads. Each thread calls consume(nbytes) before pulling a chunk
+	and is held back if the combined rate would go over rate_mbps (megabytes per second).
+	rate_mbps=0 means unlimited. The rate can be changed on the fly with setRate() (throttles, control socket etc).
+
+	e.g.
+		from lib import wr_transfer_limits as wrtl
+		bandwidth_limiter = wrtl.BandwidthLimiter('download_bandwidth', 100)
+		bandwidth_limiter.consume(4194304)
+
+	observedMBps() returns the rate actually consumed over the last few seconds, limited or not.
+	'''
+	def __init__(self, name: str, rate_mbps=0, burst_sec=1, debug=False):
+		self.name = name
+		self.debug = debug
+		self.burst_sec = burst_sec
+		self.rate_lock = threading.Lock()
+		self.rate_bytes = 0
+		self.tokens = 0.0
+		self.last_refill = time.monotonic()
+		self.observed_window_start = time.monotonic()
+		self.observed_window_bytes = 0
+		self.observed_mbps = 0.0
+		self.setRate(rate_mbps)
+
+	def setRate(self, rate_mbps:float):
+		with self.rate_lock:
+			if rate_mbps < 0:
+				rate_mbps = 0
+			self.rate_bytes = float(rate_mbps) * 1024 * 1024
+			self.tokens = min(self.tokens, self.rate_bytes * self.burst_sec)
+		log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " rate set to (MB/s, 0 unlimited): " + str(rate_mbps)])
+
+	def rateMBps(self) -> float:
+		return(round(self.rate_bytes / 1024.0**2, 2))
+
+	def observedMBps(self) -> float:
+		return(round(self.observed_mbps, 2))
+
+	def consume(self, nbytes:int):
+		while True:
+			with self.rate_lock:
+				now = time.monotonic()
+				# track the real rate regardless of limit - 5 sec windows
+				if now - self.observed_window_start >= 5:
+					self.observed_mbps = self.observed_window_bytes / (now - self.observed_window_start) / 1024.0**2
+					self.observed_window_start = now
+					self.observed_window_bytes = 0
+				if self.rate_bytes <= 0:
+					self.observed_window_bytes += nbytes
+					return
+				self.tokens = min(self.tokens + (now - self.last_refill) * self.rate_bytes, max(self.rate_bytes * self.burst_sec, nbytes))
+				self.last_refill = now
+				if self.tokens >= nbytes:
+					self.tokens -= nbytes
+					self.observed_window_bytes += nbytes
+					return
+				wait_sec = (nbytes - self.tokens) / self.rate_bytes
+			time.sleep(min(wait_sec, 1))
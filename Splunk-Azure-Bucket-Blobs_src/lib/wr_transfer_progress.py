@@ -0,0 +1,482 @@
+##############################################################################################################
+# Contact: Will Rivendell
+# 	E1: wrivendell@splunk.com
+# 	E2: contact@willrivendell.com
+#
+#   Per-job byte progress for in-flight downloads, a watchdog that cancels and requeues stalled ones
+#   a tail accelerator that lends idle download slots to the biggest downloads still running
+#   and a byte weighted throughput / ETA meter
+##############################################################################################################
+
+### Imports
+import time, sys, threading, math, datetime
+
+from . import wr_logging as log
+
+### Classes ###########################################
+
+class DownloadCancelled(Exception):
+	'''
+	Raised inside a download thread when its job was cancelled (stalled etc) - caught by the downloader itself
+	'''
+	pass
+
+class JobProgress():
+	'''
+	Byte progress of ONE in-flight download. Touched by the SDK progress hook on every chunk read off the socket.
+	Also the range cursor for the download - the owning thread and any tail helpers claimRange() chunks off it
+	and write them into the same file handle.
+	'''
+	def __init__(self, key, total_bytes:int, start_offset=0, job_args=(), etag=None):
+		self.key = key
+		self.total_bytes = total_bytes
+		self.start_offset = start_offset # where this attempt started (resume point)
+		self.etag = etag # version of the blob the bytes on disk are from - every range is pinned to it
+		self.bytes_done = start_offset # furthest byte received
+		self.job_args = job_args # args to requeue the job with
+		self.last_progress = time.monotonic()
+		self.cancelled = False
+		self.cancel_callbacks = []
+		# ranges
+		self.next_offset = start_offset # first byte nobody has claimed yet
+		self.claimed = {} # offset -> length of ranges being fetched right now
+		self.returned = [] # (offset, length) claimed ranges a helper gave back, handed out again first
+		self.handle = None # the owner's wr_disk_writer.FileWriteHandle - helpers write into it too
+		self.helpers = 0 # helper threads attached right now
+		self.closing = False # owner is done, no new claims
+		self.range_condition = threading.Condition()
+
+	def touch(self, bytes_done:int):
+		if bytes_done > self.bytes_done:
+			self.bytes_done = bytes_done
+		self.last_progress = time.monotonic()
+
+	def rangeHook(self, range_offset:int):
+		'''
+		Returns a progress_hook(current, total) for an SDK download_blob call starting at range_offset
+		'''
+		def hook(current, total):
+			self.touch(range_offset + current)
+		return(hook)
+
+	def idleSeconds(self) -> float:
+		return(time.monotonic() - self.last_progress)
+
+	def onCancel(self, callback):
+		self.cancel_callbacks.append(callback)
+
+	def cancel(self):
+		self.cancelled = True
+		for callback in self.cancel_callbacks:
+			try:
+				callback()
+			except Exception:
+				pass
+
+	def raiseIfCancelled(self):
+		if self.cancelled:
+			raise DownloadCancelled(str(self.key))
+
+	def claimRange(self, chunk_size:int):
+		'''
+		Returns (offset, length) of the next range to fetch, or None when there's nothing left to claim
+		'''
+		with self.range_condition:
+			if self.closing or self.cancelled:
+				return(None)
+			if self.returned:
+				offset, length = self.returned.pop(0)
+			elif self.next_offset < self.total_bytes:
+				offset = self.next_offset
+				length = min(chunk_size, self.total_bytes - offset)
+				self.next_offset += length
+			else:
+				return(None)
+			self.claimed[offset] = length
+			return(offset, length)
+
+	def rangeDone(self, offset:int):
+		'''
+		The range at offset has been handed to the disk writer
+		'''
+		with self.range_condition:
+			self.claimed.pop(offset, None)
+
+	def returnRange(self, offset:int):
+		'''
+		A claimed range couldn't be fetched - put it back so someone else picks it up
+		'''
+		with self.range_condition:
+			length = self.claimed.pop(offset, None)
+			if length:
+				self.returned.append((offset, length))
+			self.range_condition.notify_all()
+
+	def safeOffset(self) -> int:
+		'''
+		Everything below this offset has been handed to disk - where a retry can resume from
+		'''
+		with self.range_condition:
+			pending = list(self.claimed.keys()) + [r[0] for r in self.returned]
+			if pending:
+				return(min(pending))
+			return(self.next_offset)
+
+	def remainingBytes(self) -> int:
+		'''
+		Bytes not yet claimed by anyone
+		'''
+		return(max(0, self.total_bytes - self.next_offset))
+
+	def addHelper(self) -> bool:
+		'''
+		Attach a helper thread. False if the owner is finishing up or there's nothing left to split.
+		'''
+		with self.range_condition:
+			if self.closing or self.cancelled or self.handle is None or self.etag is None or self.next_offset >= self.total_bytes:
+				return(False)
+			self.helpers += 1
+			return(True)
+
+	def helperDone(self):
+		with self.range_condition:
+			self.helpers -= 1
+			self.range_condition.notify_all()
+
+	def waitHelpers(self, close=False) -> bool:
+		'''
+		Block until no helpers are attached. close=True stops any new claims first.
+		Returns True if helpers gave ranges back that still need fetching.
+		'''
+		with self.range_condition:
+			if close:
+				self.closing = True
+			while self.helpers > 0:
+				self.range_condition.wait(1)
+			return(len(self.returned) > 0)
+
+class ProgressTracker():
+	'''
+	Registry of JobProgress for every in-flight download plus the resume points of jobs that were cancelled part way.
+
+	e.g.
+		from lib import wr_transfer_progress as wrtp
+		progress_tracker = wrtp.ProgressTracker('blob_downloads', requeue_callback=requeueDownload)
+		blob_service = wazure.BlobService(connect_str, disk_writer=disk_writer, progress_tracker=progress_tracker)
+
+	requeue_callback(job_args) is called by the DOWNLOAD thread once a cancelled job has flushed and let go of its file,
+	so the retry can never race the old attempt on the same file.
+	'''
+	def __init__(self, name: str, requeue_callback=None, debug=False):
+		self.name = name
+		self.debug = debug
+		self.requeue_callback = requeue_callback
+		self.requeued_count = 0 # cancelled jobs put back on the queue
+		self.jobs = {} # key -> JobProgress
+		self.resume_offsets = {} # key -> (bytes already safely on disk from a cancelled attempt, etag of the blob they're from) - popped when the attempt restarts, so only cancelled downloads waiting to go again are in here
+		self.jobs_lock = threading.Lock()
+
+	def register(self, key, total_bytes:int, job_args=()) -> 'JobProgress':
+		with self.jobs_lock:
+			start_offset, etag = self.resume_offsets.pop(key, (0, None))
+			job = JobProgress(key, total_bytes, start_offset, job_args, etag)
+			self.jobs[key] = job
+			return(job)
+
+	def finish(self, job:'JobProgress', resume_offset=0):
+		'''
+		Drop a job from the in-flight registry. A cancelled job passes how far it got safely so the next attempt resumes there.
+		Only with the etag those bytes came from - without it the next attempt couldn't tell the blob hadn't changed, so it starts over.
+		'''
+		with self.jobs_lock:
+			if self.jobs.get(job.key) is job:
+				del self.jobs[job.key]
+			if resume_offset > 0 and job.etag:
+				self.resume_offsets[job.key] = (resume_offset, job.etag)
+
+	def requeue(self, job:'JobProgress', resume_offset=0):
+		'''
+		Finish a cancelled job and put it back on the queue, resuming from resume_offset
+		'''
+		self.finish(job, resume_offset)
+		self.requeued_count += 1
+		if self.requeue_callback:
+			self.requeue_callback(job.job_args)
+
+	def resumePoints(self) -> list:
+		'''
+		[ [<container>, <blob_name>, <bytes safely on disk>, <etag>], ... ] of cancelled jobs not yet resumed - for a checkpoint file
+		'''
+		with self.jobs_lock:
+			return([[key[0], key[1], offset, etag] for key, (offset, etag) in self.resume_offsets.items() if isinstance(key, tuple) and len(key) == 2])
+
+	def loadResumePoints(self, resume_points:list):
+		'''
+		Takes resumePoints() back, i.e. from the last run's checkpoint, so those downloads pick up where they stopped.
+		Points without an etag (checkpoints from before they were saved) are dropped - those downloads start over.
+		'''
+		with self.jobs_lock:
+			for resume_point in resume_points:
+				if len(resume_point) < 4 or not resume_point[3]:
+					continue
+				container_name, blob_name, offset, etag = resume_point[:4]
+				if int(offset) > 0:
+					self.resume_offsets[(str(container_name), str(blob_name))] = (int(offset), str(etag))
+
+	def inFlight(self) -> list:
+		with self.jobs_lock:
+			return(list(self.jobs.values()))
+
+	def bytesInFlight(self) -> int:
+		'''
+		Bytes received so far this attempt across all in-flight jobs
+		'''
+		return(sum(j.bytes_done - j.start_offset for j in self.inFlight()))
+
+class StallWatchdog():
+	'''
+	Every check_interval_sec, any in-flight job with no byte progress for stall_window_sec is cancelled.
+	The downloader stops at the next chunk boundary (or when its socket read times out), flushes what it has,
+	records a resume point and requeues itself through the tracker's requeue_callback so the retry picks up from there.
+
+	e.g.
+		watchdog = wrtp.StallWatchdog('download_stalls', progress_tracker, 300)
+		threading.Thread(target=watchdog.start, name='stall_watchdog', daemon=True).start()
+	'''
+	def __init__(self, name: str, progress_tracker:'ProgressTracker', stall_window_sec:int, check_interval_sec=0, debug=False):
+		self.name = name
+		self.debug = debug
+		self.progress_tracker = progress_tracker
+		self.stall_window_sec = stall_window_sec
+		if check_interval_sec <= 0:
+			check_interval_sec = max(1, min(30, int(stall_window_sec / 4)))
+		self.check_interval_sec = check_interval_sec
+		self.stalled_count = 0 # total jobs cancelled as stalled
+		self.stopped = False
+		self.log_file = log.LogFile('wrtp_' + self.name + '.log', log_folder='./logs/', remove_old_logs=True, log_level=3, log_retention_days=10)
+
+	def checkOnce(self) -> int:
+		'''
+		Returns how many stalled jobs were cancelled this pass
+		'''
+		cancelled = 0
+		for job in self.progress_tracker.inFlight():
+			if job.cancelled or job.idleSeconds() < self.stall_window_sec:
+				continue
+			cancelled += 1
+			self.stalled_count += 1
+			print("- WRTP(" + str(sys._getframe().f_lineno) +"): " + self.name + " no progress for " + str(int(job.idleSeconds())) + " sec, cancelling and requeueing: " + str(job.key) + " -")
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " no progress for " + str(int(job.idleSeconds())) + " sec at byte " + str(job.bytes_done) + "/" + str(job.total_bytes) + ", cancelling and requeueing: " + str(job.key)])
+			job.cancel()
+		return(cancelled)
+
+	def start(self):
+		'''
+		Run in its own thread - loops until stop()
+		'''
+		if self.stall_window_sec <= 0:
+			return
+		while not self.stopped:
+			time.sleep(self.check_interval_sec)
+			self.checkOnce()
+
+	def stop(self):
+		self.stopped = True
+
+class TailAccelerator():
+	'''
+	Once the download queue has nothing left waiting, its idle slots would sit there while the last few huge journals
+	crawl along on one connection each. Every poll_interval_sec this lends each idle slot to the in-flight download with
+	the most bytes still unclaimed (min_remaining_mb or more), as a helper thread pulling ranges of the same blob into the same file.
+
+	Each helper holds a slot lent by the queue (queue.lendSlot()), so jobs that turn up later (stall requeues, rehydrated
+	blobs, the next listing page) wait for it instead of running on top of it.
+	helper_function(job, keep_going) does the fetching, i.e. wr_azure_lib.BlobService.helpDownload. The helper slot on the job is
+	already taken (job.addHelper()) when it's called and released here after it returns. It should stop after the range
+	it's on once keep_going() is False - jobs are waiting for the slot, or the queue's threads were turned down.
+
+	e.g.
+		tail_accelerator = wrtp.TailAccelerator('download_tail', progress_tracker, wrq_download, blob_service.helpDownload, min_remaining_mb=64)
+		threading.Thread(target=tail_accelerator.start, name='tail_accelerator', daemon=True).start()
+	'''
+	def __init__(self, name: str, progress_tracker:'ProgressTracker', queue, helper_function, min_remaining_mb=64, chunk_size_mb=4, poll_interval_sec=5, debug=False):
+		self.name = name
+		self.debug = debug
+		self.progress_tracker = progress_tracker
+		self.queue = queue # anything with threads_at_once, hasWaiting(), jobs_active, slots_lent and lendSlot() / returnSlot(), i.e. wrq.Queue
+		self.helper_function = helper_function
+		self.min_remaining_bytes = int(min_remaining_mb * 1024 * 1024)
+		self.chunk_size = int(chunk_size_mb * 1024 * 1024)
+		self.poll_interval_sec = poll_interval_sec
+		self.helpers_active = 0
+		self.helpers_started = 0 # total helpers lent out
+		self.helped_bytes = 0 # total bytes pulled by helpers
+		self.helpers_lock = threading.Lock()
+		self.stopped = False
+		self.log_file = log.LogFile('wrtp_' + self.name + '.log', log_folder='./logs/', remove_old_logs=True, log_level=3, log_retention_days=10)
+
+	def idleSlots(self) -> int:
+		return(self.queue.threads_at_once - len(self.queue.jobs_active) - self.queue.slots_lent)
+
+	def keepGoing(self) -> bool:
+		return(not self.stopped and not self.queue.hasWaiting() and len(self.queue.jobs_active) + self.queue.slots_lent <= self.queue.threads_at_once)
+
+	def runHelper(self, job:'JobProgress'):
+		helped = 0
+		try:
+			helped = self.helper_function(job, self.keepGoing)
+		except Exception as ex:
+			print("- WRTP(" + str(sys._getframe().f_lineno) +"): " + self.name + " Exception: tail helper failed on " + str(job.key) + " -")
+			print(ex)
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " tail helper failed on " + str(job.key) + " - " + str(ex)])
+		finally:
+			job.helperDone()
+			self.queue.returnSlot()
+			with self.helpers_lock:
+				self.helpers_active -= 1
+				self.helped_bytes += helped or 0
+
+	def checkOnce(self) -> int:
+		'''
+		Returns how many helpers were started this pass
+		'''
+		if self.queue.hasWaiting():
+			return(0)
+		idle_slots = self.idleSlots()
+		if idle_slots <= 0:
+			return(0)
+		candidates = [j for j in self.progress_tracker.inFlight() if j.remainingBytes() >= self.min_remaining_bytes]
+		started = 0
+		while idle_slots > 0 and candidates:
+			# most unclaimed bytes first, and no more helpers than it has chunks left to share
+			candidates.sort(key=lambda j: j.remainingBytes() / (j.helpers + 1), reverse=True)
+			job = candidates[0]
+			if job.helpers + 1 >= job.remainingBytes() / self.chunk_size:
+				candidates.remove(job)
+				continue
+			if not self.queue.lendSlot():
+				break
+			if not job.addHelper():
+				self.queue.returnSlot()
+				candidates.remove(job)
+				continue
+			with self.helpers_lock:
+				self.helpers_active += 1
+				self.helpers_started += 1
+			idle_slots -= 1
+			started += 1
+			threading.Thread(target=self.runHelper, name=self.name + '_helper_' + str(self.helpers_started), args=(job,), daemon=True).start()
+			print("- WRTP(" + str(sys._getframe().f_lineno) +"): " + self.name + " lending an idle slot to " + str(job.key) + ", " + str(round(job.remainingBytes() / 1024.0**2, 1)) + "MB left -")
+			self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " lending an idle slot to " + str(job.key) + ", " + str(round(job.remainingBytes() / 1024.0**2, 1)) + "MB left, helpers on it: " + str(job.helpers)])
+		return(started)
+
+	def status(self) -> str:
+		return(str(self.helpers_active) + " active | " + str(self.helpers_started) + " lent | " + str(round(self.helped_bytes / 1024.0**2, 1)) + "MB pulled")
+
+	def start(self):
+		'''
+		Run in its own thread - loops until stop()
+		'''
+		if self.min_remaining_bytes <= 0:
+			return
+		while not self.stopped:
+			time.sleep(self.poll_interval_sec)
+			self.checkOnce()
+
+	def stop(self):
+		self.stopped = True
+
+class ThroughputMeter():
+	'''
+	Byte weighted throughput and ETA for a queue of transfers that range from 0 bytes to tens of GB, where counting jobs says nothing.
+	Every sample_interval_sec it reads bytes moved = completed_bytes_function() (finished jobs) + in_flight_bytes_function()
+	(bytes received so far by running jobs, from the per chunk progress hooks), and smooths the rate with an exponentially
+	weighted moving average over roughly smoothing_sec. ETA = bytes still to move / that rate.
+	The status line goes to the log every log_interval_sec.
+
+	e.g.
+		throughput_meter = wrtp.ThroughputMeter('download_throughput', lambda: wrq_download.jobs_completed.total_bytes, progress_tracker.bytesInFlight)
+		throughput_meter.addTotal(sum(int(i[1]) for i in master_bucket_download_list))
+		threading.Thread(target=throughput_meter.start, name='throughput_meter', daemon=True).start()
+	'''
+	def __init__(self, name: str, completed_bytes_function, in_flight_bytes_function=None, total_bytes=0, smoothing_sec=30, sample_interval_sec=2, log_interval_sec=60, debug=False):
+		self.name = name
+		self.debug = debug
+		self.completed_bytes_function = completed_bytes_function
+		self.in_flight_bytes_function = in_flight_bytes_function
+		self.total_bytes = total_bytes # everything planned - addTotal() as more is queued
+		self.smoothing_sec = max(1, smoothing_sec)
+		self.sample_interval_sec = max(1, sample_interval_sec)
+		self.log_interval_sec = log_interval_sec
+		self.rate_bytes = 0.0 # smoothed bytes / sec
+		self.last_sample_time = 0.0
+		self.last_moved_bytes = 0
+		self.completed_bytes = 0
+		self.in_flight_bytes = 0
+		self.stopped = False
+		self.log_file = log.LogFile('wrtp_' + self.name + '.log', log_folder='./logs/', remove_old_logs=True, log_level=3, log_retention_days=10)
+
+	def addTotal(self, nbytes:int):
+		self.total_bytes += int(nbytes)
+
+	def sample(self) -> float:
+		'''
+		Takes one reading and returns the smoothed rate in MB/s
+		'''
+		now = time.monotonic()
+		self.completed_bytes = int(self.completed_bytes_function())
+		self.in_flight_bytes = 0
+		if self.in_flight_bytes_function:
+			self.in_flight_bytes = int(self.in_flight_bytes_function())
+		moved_bytes = self.completed_bytes + self.in_flight_bytes
+		if self.last_sample_time > 0 and now > self.last_sample_time:
+			elapsed = now - self.last_sample_time
+			current_rate = max(0, moved_bytes - self.last_moved_bytes) / elapsed # a cancelled job's bytes drop out of in flight, that's not negative speed
+			alpha = 1 - math.exp(-elapsed / self.smoothing_sec)
+			self.rate_bytes = self.rate_bytes + alpha * (current_rate - self.rate_bytes)
+		self.last_sample_time = now
+		self.last_moved_bytes = moved_bytes
+		return(self.mbps())
+
+	def mbps(self) -> float:
+		return(round(self.rate_bytes / 1024.0**2, 2))
+
+	def remainingBytes(self) -> int:
+		return(max(0, self.total_bytes - self.completed_bytes - self.in_flight_bytes))
+
+	def etaSeconds(self) -> int:
+		'''
+		-1 while there's no throughput to go on yet
+		'''
+		if self.remainingBytes() <= 0:
+			return(0)
+		if self.rate_bytes <= 0:
+			return(-1)
+		return(int(self.remainingBytes() / self.rate_bytes))
+
+	def etaString(self) -> str:
+		eta_sec = self.etaSeconds()
+		if eta_sec < 0:
+			return('unknown')
+		return(str(datetime.timedelta(seconds=eta_sec)))
+
+	def status(self) -> str:
+		return(str(self.mbps()) + " MB/s | " + str(round((self.completed_bytes + self.in_flight_bytes) / 1024.0**3, 2)) + " / " + str(round(self.total_bytes / 1024.0**3, 2)) + " GB | in flight " + str(round(self.in_flight_bytes / 1024.0**2, 1)) + " MB | ETA " + self.etaString())
+
+	def start(self):
+		'''
+		Run in its own thread - loops until stop()
+		'''
+		next_log = time.monotonic() + self.log_interval_sec
+		while not self.stopped:
+			self.sample()
+			if self.log_interval_sec > 0 and time.monotonic() >= next_log:
+				next_log = time.monotonic() + self.log_interval_sec
+				self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " " + self.status()])
+				if self.debug:
+					print("- WRTP(" + str(sys._getframe().f_lineno) +"): " + self.name + " " + self.status() + " -")
+			time.sleep(self.sample_interval_sec)
+
+	def stop(self):
+		self.stopped = True
+		self.log_file.writeLinesToFile(["(" + str(sys._getframe().f_lineno) + ") " + self.name + " stopped at " + self.status()])
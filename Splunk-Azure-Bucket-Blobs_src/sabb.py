@@ -5,12 +5,20 @@
 ##############################################################################################################
 
 ### Imports ###########################################
-import datetime, time, threading, sys, os, pandas
+import datetime, time, threading, sys, os, pandas, concurrent.futures, signal, json
 
 from lib import wr_arguments as arguments
 from lib import wr_thread_queue as wrq
 from lib import wr_logging as log
 from lib import wr_azure_lib as wazure
+from lib import wr_disk_writer as wrdw
+from lib import wr_transfer_limits as wrtl
+from lib import wr_splunk_wapi as wapi
+from lib import wr_splunk_throttle as wrst
+from lib import wr_transfer_progress as wrtp
+from lib import wr_bucket_thawer as wrbt
+from lib import wr_pipeline as wrp
+from lib import wr_control as wrctl
 from lib import wr_splunk_bucket_distributor as buckets
 from lib import wr_common as wrc
 
@@ -52,10 +60,63 @@ if arguments.args.test_amount > 0:
 	print("- SABB(" + str(sys._getframe().f_lineno) +"): TEST RUN - Limited number of items will be fetch, amount: " + (main_report_csv) + " -")
 	print("- SABB(" + str(sys._getframe().f_lineno) +"): ################################################################### -")
 
+# global cap on downloaded-but-unwritten bytes shared by all download threads
+memory_budget = wrtl.MemoryBudget('download_buffers', budget_mb=arguments.args.memory_budget_mb, debug=arguments.args.debug_modules)
+
+# per-device disk writer pool - download threads hand their buffers over to this
+disk_writer = wrdw.DiskWriter('blob_writer', threads_per_device=arguments.args.disk_write_threads, memory_budget=memory_budget, write_mode=arguments.args.write_mode, debug=arguments.args.debug_modules)
+
+# shared download bandwidth cap - also what the splunk load throttle turns up and down
+bandwidth_limiter = wrtl.BandwidthLimiter('download_bandwidth', rate_mbps=arguments.args.bandwidth_limit_mbps, debug=arguments.args.debug_modules)
+
+# download order - blobs in the -pi indexes go first, in the order listed. Retries / rehydrated blobs jump the queue
+def blobIndexName(blob_name:str) -> str:
+	'''
+	Index folder of a bucket's blob, i.e. 'cisco' for 'cisco/frozendb/db_1_2_3/rawdata/journal.gz'. '' if it's not in a bucket folder
+	'''
+	blob_path_parts = str(blob_name).replace('\\', '/').split('/')
+	for i, part in enumerate(blob_path_parts[:-1]):
+		if i >= 2 and (part.startswith('db_') or part.startswith('rb_')):
+			return(blob_path_parts[i - 2])
+	return('')
+
+priority_overrides = {} # index name -> priority, set on the fly through the control port (sabbctl.py priority)
+def downloadPriority(item:list) -> int:
+	index_name = blobIndexName(item[0])
+	if index_name in priority_overrides:
+		return(priority_overrides[index_name])
+	if index_name in arguments.args.priority_indexes:
+		return(arguments.args.priority_indexes.index(index_name))
+	return(len(arguments.args.priority_indexes))
+
+# per-download byte progress - the stall watchdog cancels downloads that stop moving and they requeue themselves through this
+def requeueDownload(job_args:list):
+	wrq_download.add(blob_job_function, [list(job_args)], priority=-1)
+progress_tracker = wrtp.ProgressTracker('blob_downloads', requeue_callback=requeueDownload, debug=arguments.args.debug_modules)
+stall_watchdog = wrtp.StallWatchdog('download_stalls', progress_tracker, arguments.args.stall_window_sec, debug=arguments.args.debug_modules)
+
 # service class for Azure (wazure)
-blob_service = wazure.BlobService((arguments.args.connect_string)) # used to make requests to Azure Blobs
+blob_service = wazure.BlobService((arguments.args.connect_string), disk_writer=disk_writer, bandwidth_limiter=bandwidth_limiter, progress_tracker=progress_tracker,
+								  max_connections_per_account=max(20, arguments.args.thread_count * max(2, arguments.args.range_window)), max_concurrent_per_account=arguments.args.account_concurrency,
+								  secondary_share=arguments.args.secondary_read_share, secondary_max_lag_sec=arguments.args.secondary_max_lag_sec,
+								  copy_to=arguments.args.copy_to, range_window=arguments.args.range_window) # used to make requests to Azure Blobs
+# what each wrq_download job runs - a download, or in copy mode (-ct) a server side copy to the other account
+if arguments.args.copy_to:
+	blob_job_function = blob_service.copyBlobByName
+else:
+	blob_job_function = blob_service.downloadBlobByName
 log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"):Blob interactive service class created: blob_service"])
 master_bucket_download_list = []
+blob_content_keys = {} # (container, blob_name) -> (content_md5, size) from the listing, used by the dedupe stage
+dedupe_links = {} # (container, blob_name) actually downloaded -> [ [blob_name, size, container, dl_root], ... ] copies to clone from it
+deduped_linked = 0 # copies cloned so far
+blob_archive_status = {} # (container, blob_name) -> archive_status ('' or rehydrate-pending-to-*) for blobs listed in the Archive tier
+
+# report status - sqlite (-sdb) with the CSV written out from it at exit, or the CSV itself
+if arguments.args.status_db:
+	report_store_class = log.StatusStore
+else:
+	report_store_class = log.CSVFile
 
 # bucket sorter "bucketeer" class
 if not arguments.args.standalone:
@@ -70,10 +131,10 @@ if not arguments.args.standalone:
 											 skip_to_csv_load=arguments.args.skip_to_csv_load,
 											 debug=arguments.args.debug_modules)
 	# create list handler
-	log_csv = log.CSVFile(main_report_csv + "_" + azure_bucket_sorter.my_guid + ".csv", log_folder='./csv_lists/', remove_old_logs=False, log_retention_days=20, prefix_date=False, debug=arguments.args.debug_modules)
+	log_csv = report_store_class(main_report_csv + "_" + azure_bucket_sorter.my_guid + ".csv", log_folder='./csv_lists/', remove_old_logs=False, log_retention_days=20, prefix_date=False, debug=arguments.args.debug_modules)
 else:
-	log_csv = log.CSVFile(main_report_csv + ".csv", log_folder='./csv_lists/', remove_old_logs=False, log_retention_days=20, prefix_date=False, debug=arguments.args.debug_modules)
-	if os.path.exists(log_csv.log_path):
+	log_csv = report_store_class(main_report_csv + ".csv", log_folder='./csv_lists/', remove_old_logs=False, log_retention_days=20, prefix_date=False, debug=arguments.args.debug_modules)
+	if log_csv.doesLogFileExist():
 		csv_already_exists = True
 	else:
 		csv_already_exists = False
@@ -87,6 +148,30 @@ log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"):Bucket So
 if arguments.args.skip_to_csv_load:
 	print("- SABB(" + str(sys._getframe().f_lineno) +"): Skipping Azure scrape and loading list from CSV directly! -")
 	log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Skipping download and loading list from CSV directly!"])
+# streaming plan (-sp) - standalone only, the cluster plan needs every blob listed before Bucketeer can share it out
+stream_pipeline = arguments.args.stream_pipeline and arguments.args.standalone and not arguments.args.write_out_full_list_only and not arguments.args.skip_to_csv_load
+if arguments.args.stream_pipeline and not stream_pipeline:
+	print("- SABB(" + str(sys._getframe().f_lineno) +"): -sp only streams standalone runs that list from azure, building the whole list first instead. -")
+	log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): -sp only streams standalone runs that list from azure, building the whole list first instead."])
+elif stream_pipeline and (arguments.args.dedupe or arguments.args.thaw):
+	print("- SABB(" + str(sys._getframe().f_lineno) +"): -sp is on, -dd / -th need the whole list up front so they're OFF for this run. -")
+	log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): -sp is on, -dd / -th need the whole list up front so they're OFF for this run."])
+# resume checkpoint - left by a signal drain (drainAndExit), read once and removed
+draining = False
+checkpoint_path = log_csv.log_path + '.checkpoint.json'
+resume_checkpoint = {}
+if os.path.exists(checkpoint_path):
+	try:
+		with open(checkpoint_path) as checkpoint_file:
+			resume_checkpoint = json.load(checkpoint_file)
+		os.remove(checkpoint_path)
+		progress_tracker.loadResumePoints(resume_checkpoint.get('resume_offsets', []))
+		print("- SABB(" + str(sys._getframe().f_lineno) +"): Resuming from the checkpoint saved " + str(resume_checkpoint.get('saved')) + " - " + str(len(resume_checkpoint.get('resume_offsets', []))) + " partial downloads pick up where they stopped. -")
+		log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Resuming from the checkpoint saved " + str(resume_checkpoint.get('saved')) + " - " + str(len(resume_checkpoint.get('resume_offsets', []))) + " partial downloads pick up where they stopped."])
+	except Exception as ex:
+		resume_checkpoint = {}
+		print("- SABB(" + str(sys._getframe().f_lineno) +"): Couldn't read the checkpoint, ignoring it: " + checkpoint_path + " -")
+		log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Couldn't read the checkpoint, ignoring it: " + checkpoint_path + " - " + str(ex)])
 
 ########################################### ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 # create handler classes
@@ -99,13 +184,81 @@ if arguments.args.skip_to_csv_load:
 ########################################### 
 # download / csv updater / log writer queues
 if not arguments.args.write_out_full_list_only:
-	wrq_download = wrq.Queue('blob_downloader', (arguments.args.thread_count), debug=arguments.args.debug_modules) # downloads blobs from Azure
+	wrq_download = wrq.Queue('blob_downloader', (arguments.args.thread_count), job_bytes_function=lambda job: job.result[1] if job.result else 0, priority_aging_sec=arguments.args.priority_aging_sec, debug=arguments.args.debug_modules) # downloads blobs from Azure
+	download_cursor = wrq_download.jobs_completed.cursor() # hands each finished download job to updateCompletedWRQDownloadJobs once
+	# fair share (-fs) - indexes / containers take turns at the download slots, by bytes, -fsw weights
+	if not arguments.args.fair_share == 'Off':
+		fair_share_weights = {}
+		for share_weight in arguments.args.fair_share_weights:
+			try:
+				share_name, weight = share_weight.rsplit('=', 1)
+				fair_share_weights[share_name] = float(weight)
+			except ValueError:
+				print("- SABB(" + str(sys._getframe().f_lineno) +"): Ignoring -fsw " + share_weight + ", it should be name=weight -")
+				log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Ignoring -fsw " + share_weight + ", it should be name=weight"])
+		if arguments.args.fair_share == 'index':
+			fair_share_function = lambda args: blobIndexName(args[0])
+		else:
+			fair_share_function = lambda args: str(args[2])
+		wrq_download.setFairShare(fair_share_function, weights=fair_share_weights, quantum=64*1024**2, cost_function=lambda args: int(args[1]))
 	wrq_csv_report = wrq.Queue('parent_csv_reporter', 1, debug=arguments.args.debug_modules) # queues csv writes to master status report
 else:
 	print("- SABB(" + str(sys._getframe().f_lineno) +"): No DOWNLOAD queue created as Writing out Download List only (WOFLO) is on: -")
 wrq_logging = wrq.Queue('parent_logging', 1, debug=arguments.args.debug_modules) # queues log writes to avoid "file already open" type errors
 
-list_index = 0 # starting point for checking finished job queue when updating CSV
+# local splunkd load throttle - scales wrq_download threads and bandwidth with splunkd's cpu / indexing queue pressure
+splunk_load_throttle = None
+if arguments.args.splunk_load_throttle and not arguments.args.write_out_full_list_only:
+	if not arguments.args.splunk_username or not arguments.args.splunk_password:
+		print("- SABB(" + str(sys._getframe().f_lineno) +"): Splunk load throttle needs -spu and -spw, running WITHOUT it. -")
+		log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Splunk load throttle needs -spu and -spw, running WITHOUT it."])
+	else:
+		local_splunk_service = wapi.SplunkService('https://127.0.0.1', arguments.args.local_splunk_port, arguments.args.splunk_username, arguments.args.splunk_password)
+		splunk_load_throttle = wrst.SplunkLoadThrottle('splunk_load', local_splunk_service, wrq_download,
+														max_threads=arguments.args.thread_count,
+														bandwidth_limiter=bandwidth_limiter,
+														max_bandwidth_mbps=arguments.args.bandwidth_limit_mbps,
+														cpu_high_pct=arguments.args.splunk_load_cpu_pct,
+														cpu_low_pct=arguments.args.splunk_load_cpu_pct / 2,
+														queue_high_pct=arguments.args.splunk_load_queue_pct,
+														queue_low_pct=arguments.args.splunk_load_queue_pct / 2,
+														poll_interval_sec=arguments.args.splunk_load_poll_sec,
+														debug=arguments.args.debug_modules)
+		log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"):Splunk load throttle created: splunk_load_throttle"])
+
+# tail accelerator - once nothing is waiting, idle download slots help the biggest downloads still running
+tail_accelerator = None
+if not arguments.args.write_out_full_list_only:
+	tail_accelerator = wrtp.TailAccelerator('download_tail', progress_tracker, wrq_download, blob_service.helpDownload, min_remaining_mb=arguments.args.tail_split_mb, debug=arguments.args.debug_modules)
+
+# byte weighted throughput / ETA - finished downloads' bytes plus what's been received of the running ones
+throughput_meter = None
+if not arguments.args.write_out_full_list_only:
+	throughput_meter = wrtp.ThroughputMeter('download_throughput', lambda: wrq_download.jobs_completed.total_bytes, progress_tracker.bytesInFlight, log_interval_sec=arguments.args.throughput_log_sec, debug=arguments.args.debug_modules)
+
+# archive tier - rehydrates archived blobs in bulk and queues each download as soon as it's readable
+def rehydratedDownload(item:list):
+	requeueDownload(item)
+	wrq_csv_report.add(log_csv.updateCellsByHeader, [[[('File_Name', str(item[0]), 'Container', str(item[2]), 'Rehydrated', currentDate(include_time=True))]]])
+def rehydrateFailed(item:list):
+	wrq_csv_report.add(log_csv.updateCellsByHeader, [[[('File_Name', str(item[0]), 'Container', str(item[2]), 'Rehydrated', 'FAILED')]]])
+archive_rehydrator = None
+if not arguments.args.rehydrate_tier == 'Off' and not arguments.args.write_out_full_list_only:
+	archive_rehydrator = wazure.ArchiveRehydrator('rehydrate', blob_service, rehydratedDownload, target_tier=arguments.args.rehydrate_tier,
+												priority=arguments.args.rehydrate_priority, keep_alive_queue=wrq_download, failed_callback=rehydrateFailed, debug=arguments.args.debug_modules)
+
+# thaw / rebuild - each bucket goes into its index's thaweddb and is rebuilt as soon as its last file is down
+def thawResult(bucket_files:list, status:str):
+	wrq_csv_report.add(log_csv.updateCellsByHeader, [[[('File_Name', str(i[0]), 'Container', str(i[2]), 'Thaw_Status', status) for i in bucket_files]]])
+bucket_thawer = None
+if arguments.args.thaw and not arguments.args.write_out_full_list_only and not arguments.args.copy_to and not stream_pipeline:
+	bucket_thawer = wrbt.BucketThawer('thaw', arguments.args.splunk_home, thaw_path_template=arguments.args.thaw_path, rebuild_command_template=arguments.args.thaw_rebuild_cmd,
+									thaw_concurrency=arguments.args.thaw_concurrency, result_callback=thawResult, debug=arguments.args.debug_modules)
+
+# RA-GRS - keeps an eye on geo replication lag so secondary reads only happen while the secondary is close enough behind
+replication_monitor = None
+if arguments.args.secondary_read_share > 0 and not arguments.args.write_out_full_list_only:
+	replication_monitor = wazure.ReplicationMonitor('ragrs', blob_service, 60)
 
 # Print Console Info
 if arguments.args.detailed_output:
@@ -307,6 +460,11 @@ def makeBlobDownloadList(container_names_to_search_list=[],
 								print("- SABB(" + str(sys._getframe().f_lineno) +"): Skipping BLOB based on EXCLUDE list: " + blob['name'] + " -")
 							continue
 					tmp_list = [ str(blob['name']), int(blob['size']), str(container['name']), str(dest_download_loc_root) ]
+					content_key = blobContentKey(blob)
+					if content_key:
+						blob_content_keys[(str(container['name']), str(blob['name']))] = content_key
+					if wazure.tierIsArchive(blob.get('blob_tier')):
+						blob_archive_status[(str(container['name']), str(blob['name']))] = str(blob.get('archive_status') or '')
 					if arguments.args.list_create_output:
 						print("- SABB(" + str(sys._getframe().f_lineno) +"): This blob is being added to the list: " + blob['name'] + " -")
 
@@ -342,6 +500,8 @@ def makeBlobDownloadList(container_names_to_search_list=[],
 				print("- SABB(" + str(sys._getframe().f_lineno) +"): Received master download list from Bucketeer. Thanks! -")
 				log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Received master download list from Bucketeer. Thanks! -"])
 				master_bucket_download_list_full = azure_bucket_sorter.this_peer_download_list # has columns we dont need later but do now
+				if arguments.args.status_db:
+					log_csv.importCSV() # Bucketeer just wrote this peer's csv, it's the list to go by
 				if not arguments.args.write_out_full_list_only:
 					print("- SABB(" + str(sys._getframe().f_lineno) +"): Check master list for any standalone buckets and appending this GUID to them. -")
 					log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Check master list for any standalone buckets and appending this GUID to them. -"])
@@ -376,6 +536,31 @@ def makeBlobDownloadList(container_names_to_search_list=[],
 # General helper functions for processing and checking
 ########################################### 
 # compare a byte size to a file byte size
+# copy mode - same check against what landed on the destination account
+def jobWasRequeued(completed_job:'wrq.CompletedJob') -> bool:
+	'''
+	True if the download was cancelled (stalled) and put back on the queue - another attempt is coming, it didn't fail
+	'''
+	result = completed_job.result
+	return(bool(result) and len(result) > 2 and result[2] == 'requeued')
+
+def compareJobResultSize(completed_job:'wrq.CompletedJob'):
+	'''
+	Returns a set, (True/False, expected_size_mb, downloaded / copied size mb)
+	From the (success, bytes) the download / copy job returned - no need to stat the file again
+	'''
+	expected_size = int(completed_job.args[1])
+	job_success, job_size = False, 0
+	if completed_job.result:
+		job_success, job_size = completed_job.result[0], int(completed_job.result[1])
+	if job_success and job_size == expected_size:
+		return(True, expected_size/1024.0**2, job_size/1024.0**2)
+	if jobWasRequeued(completed_job):
+		print("- SABB(" + str(sys._getframe().f_lineno) +"): File Download: REQUEUED (stalled, resumes) - " + str(completed_job.args[2]) + "/" + str(completed_job.args[0]) + " -")
+		return(False, expected_size/1024.0**2, job_size/1024.0**2)
+	print("- SABB(" + str(sys._getframe().f_lineno) +"): File Download: FAILED - " + str(completed_job.args[2]) + "/" + str(completed_job.args[0]) + " " + str(completed_job.error or '') + " -")
+	return(False, expected_size/1024.0**2, job_size/1024.0**2)
+
 def compareDownloadSize(expected_size:int, full_path_to_file:str):
 	'''
 	Returns a set, (True/False, expected_size_mb, downloaded_size mb)
@@ -407,6 +592,168 @@ def updateDownloadedCSVSuccess(blob_name):
 	if not update_cell:
 		print("- SABB(" + str(sys._getframe().f_lineno) +"): "+ blob_name +" appeared to finish, but couldn't find cell in CSV to update -")
 
+def exportStatusCSV() -> int:
+	'''
+	With -sdb, writes the report CSV out from the status db. Returns the row count, -1 if it failed (the db still has everything)
+	'''
+	if not arguments.args.status_db:
+		return(0)
+	try:
+		row_count = log_csv.exportCSV()
+	except Exception as ex:
+		print("- SABB(" + str(sys._getframe().f_lineno) +"): Couldn't write the CSV out from " + log_csv.db_path + ", it still has the status: " + str(ex) + " -")
+		log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Couldn't write the CSV out from " + log_csv.db_path + " - " + str(ex)])
+		return(-1)
+	print("- SABB(" + str(sys._getframe().f_lineno) +"): Report CSV written out from the status db: " + log_csv.log_path + " (" + str(row_count) + " rows) -")
+	log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Report CSV written out from the status db: " + log_csv.log_path + " (" + str(row_count) + " rows)"])
+	return(row_count)
+
+# content_md5 + size of a listed blob - None if azure has no md5 for it (large block uploads often never set one)
+def blobContentKey(blob:dict):
+	try:
+		content_md5 = blob['content_settings']['content_md5']
+	except Exception:
+		return(None)
+	if not content_md5:
+		return(None)
+	if isinstance(content_md5, (bytes, bytearray)):
+		content_md5 = content_md5.hex()
+	return(str(content_md5), int(blob['size']))
+
+# dedupe stage - one download per distinct content, the rest get cloned from it afterwards
+def dedupeDownloadList(download_list:list) -> list:
+	'''
+	Keeps the first blob of each content_md5 + size, every other copy (other containers, rb_ replicas frozen by several peers etc)
+	is parked in dedupe_links against it and cloned from it once it's downloaded - see linkDedupedCopies()
+	Records Deduped_From in the status report straight away so the mapping is there even if the run is cut short.
+	Returns the list to actually download
+	'''
+	first_by_content = {}
+	keep_list = []
+	csv_updates = []
+	for item in download_list:
+		content_key = blob_content_keys.get((str(item[2]), str(item[0])))
+		if not content_key:
+			keep_list.append(item)
+			continue
+		if content_key not in first_by_content:
+			first_by_content[content_key] = item
+			keep_list.append(item)
+			continue
+		primary = first_by_content[content_key]
+		dedupe_links.setdefault((str(primary[2]), str(primary[0])), []).append(item)
+		csv_updates.append(('File_Name', str(item[0]), 'Container', str(item[2]), 'Deduped_From', str(primary[2]) + '/' + str(primary[0])))
+	if csv_updates:
+		print("- SABB(" + str(sys._getframe().f_lineno) +"): Dedupe - " + str(len(csv_updates)) + " blobs are copies of others on the list, they'll be linked instead of downloaded. -")
+		log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Dedupe - " + str(len(csv_updates)) + " blobs are copies of others on the list, they'll be linked instead of downloaded."])
+		wrq_csv_report.add(log_csv.updateCellsByHeader, [[csv_updates]])
+	return(keep_list)
+
+# clone a finished download to every other destination with the same content
+def linkDedupedCopies(blob_name:str, container_name:str, downloaded_path:str) -> list:
+	'''
+	Returns csv cell updates for the copies (SUCCESS, size, how they were linked)
+	'''
+	global deduped_linked
+	csv_updates = []
+	for item in dedupe_links.pop((container_name, blob_name), []):
+		dest_path = str(item[3]) + str(item[2]) + '/' + str(item[0])
+		try:
+			link_type = wrc.cloneFile(downloaded_path, dest_path, allow_hardlink=False) # a hard link would share later in place changes (rebuild, fsck) with the copy
+		except Exception as ex:
+			print("- SABB(" + str(sys._getframe().f_lineno) +"): Exception: Dedupe link FAILED - " + dest_path + " -")
+			print(ex)
+			wrq_logging.add(log_file.writeLinesToFile, [[['Dedupe link FAILED - ' + downloaded_path + ' -> ' + dest_path + ' - ' + str(ex)]]])
+			continue
+		deduped_linked += 1
+		file_verify = compareDownloadSize(int(item[1]), dest_path)
+		if file_verify[0]:
+			csv_updates.append(('File_Name', str(item[0]), 'Container', str(item[2]), 'Download_Complete', "SUCCESS"))
+			csv_updates.append(('File_Name', str(item[0]), 'Container', str(item[2]), 'Downloaded_File_Size_MB', str(file_verify[2])))
+			if bucket_thawer:
+				bucket_thawer.fileDone(str(item[2]), str(item[0]))
+		csv_updates.append(('File_Name', str(item[0]), 'Container', str(item[2]), 'Dedupe_Link', link_type))
+	return(csv_updates)
+
+# the download the copies were waiting on failed - download one of them in its place
+def requeueDedupedCopies(blob_name:str, container_name:str) -> list:
+	'''
+	The first parked copy is queued as a download and the rest are parked on it instead.
+	Returns csv cell updates pointing Deduped_From at the new one
+	'''
+	copies = dedupe_links.pop((container_name, blob_name), [])
+	if not copies:
+		return([])
+	new_primary = copies[0]
+	csv_updates = [('File_Name', str(new_primary[0]), 'Container', str(new_primary[2]), 'Deduped_From', '')]
+	if copies[1:]:
+		dedupe_links[(str(new_primary[2]), str(new_primary[0]))] = copies[1:]
+		for item in copies[1:]:
+			csv_updates.append(('File_Name', str(item[0]), 'Container', str(item[2]), 'Deduped_From', str(new_primary[2]) + '/' + str(new_primary[0])))
+	if throughput_meter:
+		throughput_meter.addTotal(int(new_primary[1]))
+	wrq_download.add(blob_job_function, [list(new_primary)], priority=-1)
+	print("- SABB(" + str(sys._getframe().f_lineno) +"): Dedupe - " + container_name + "/" + blob_name + " failed, downloading its copy " + str(new_primary[2]) + "/" + str(new_primary[0]) + " instead (" + str(len(copies) - 1) + " more copies wait on it). -")
+	wrq_logging.add(log_file.writeLinesToFile, [[['Dedupe - ' + container_name + '/' + blob_name + ' failed, downloading its copy ' + str(new_primary[2]) + '/' + str(new_primary[0]) + ' instead (' + str(len(copies) - 1) + ' more copies wait on it)']]])
+	return(csv_updates)
+
+# startup reconciliation - files already sitting in the download location (lost / other peer's CSV) aren't downloaded again
+def reconcileLocalInventory(download_list:list, inventories=None, queue_csv_update=False) -> tuple:
+	'''
+	Scans each download root once (wrc.scanTree) and matches every item's <root><container>/<blob name> on size,
+	and with -rcm also md5 against the listing's content_md5 (size only when azure has no md5 for it).
+	Files with holes (a download cut short after later ranges were written) never match.
+	Matches are marked SUCCESS in the CSV in one go. Returns (list still to download, list already present)
+	inventories - {root: scanTree} already scanned, for reconciling one batch at a time (-sp). Roots not in it are scanned and added.
+	queue_csv_update=True sends the CSV update through wrq_csv_report - for when the report writer is already running
+	'''
+	if inventories is None:
+		inventories = {}
+	for root in set(str(i[3]) for i in download_list):
+		if root in inventories:
+			continue
+		print("- SABB(" + str(sys._getframe().f_lineno) +"): Reconcile - scanning for files already downloaded under: " + root + " -")
+		inventories[root] = wrc.scanTree(root, threads=max(4, arguments.args.thread_count))
+	candidates = []
+	remaining_list = []
+	for item in download_list:
+		found = inventories[str(item[3])].get(str(item[2]) + '/' + str(item[0]))
+		if found and int(found[0]) == int(item[1]) and found[1] >= int(found[0]) - 4096:
+			candidates.append(item)
+		else:
+			remaining_list.append(item)
+	def md5Matches(item) -> bool:
+		content_key = blob_content_keys.get((str(item[2]), str(item[0])))
+		if not content_key:
+			return(True)
+		root = str(item[3])
+		if not root.endswith('/'):
+			root = root + '/'
+		try:
+			return(wrc.fileMD5(root + str(item[2]) + '/' + str(item[0])) == content_key[0])
+		except Exception:
+			return(False)
+	present_list = candidates
+	if arguments.args.reconcile_md5 and candidates:
+		print("- SABB(" + str(sys._getframe().f_lineno) +"): Reconcile - checking md5 of " + str(len(candidates)) + " files that match on size -")
+		with concurrent.futures.ThreadPoolExecutor(max_workers=max(4, arguments.args.thread_count)) as md5_pool:
+			md5_results = list(md5_pool.map(md5Matches, candidates))
+		present_list = [item for item, matched in zip(candidates, md5_results) if matched]
+		remaining_list += [item for item, matched in zip(candidates, md5_results) if not matched]
+	if present_list:
+		csv_updates = {}
+		for item in present_list:
+			csv_updates[(str(item[0]), str(item[2]))] = {'Download_Complete': "SUCCESS", 'Downloaded_File_Size_MB': str(int(item[1])/1024.0**2)}
+		if queue_csv_update:
+			wrq_csv_report.add(log_csv.updateRowsByKeys, [[['File_Name', 'Container'], csv_updates]])
+		else:
+			log_csv.updateRowsByKeys(['File_Name', 'Container'], csv_updates)
+	if queue_csv_update and not present_list:
+		return(remaining_list, present_list)
+	print("- SABB(" + str(sys._getframe().f_lineno) +"): Reconcile - " + str(len(present_list)) + " files already downloaded and marked SUCCESS, " + str(len(remaining_list)) + " left to download. -")
+	log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Reconcile - " + str(len(present_list)) + " files already downloaded and marked SUCCESS, " + str(len(remaining_list)) + " left to download."])
+	return(remaining_list, present_list)
+
 	# fun icon for show only
 def spinner(counter):
 	chars = ['|', '/', '--', '\\', '|', '/', '--', '\\']
@@ -421,61 +768,202 @@ def spinner(counter):
 
 
 
+########################################### 
+# STREAMING PLAN (-sp) - list -> filter -> plan -> download as one pipeline, each blob queued as soon as it's listed
+########################################### 
+download_pipeline = None
+streamed_download_count = 0 # downloads the pipeline has queued so far - the % complete is against this while it's running
+stream_csv_status = {} # (Container, File_Name) -> Download_Complete of the CSV at start, read once so planning never re-reads the CSV. Popped as each blob is planned (it's listed once), so it only shrinks
+stream_local_inventories = {} # download root -> wrc.scanTree(), for -rc. Scanned once, by the first batch that needs it
+
+def streamFilterBlob(listed:tuple) -> list:
+	'''
+	filter stage - (container_name, blob dict) from blob_service.iterBlobsByContainers through the container / blob include and exclude lists.
+	Passes on ( [ <blob_name>, <blob_size>, <container_name>, <download_dest> ], archive_status or None if it's not archived )
+	'''
+	container_name, blob = listed
+	if arguments.args.container_search_list and not blob_service.isInList(container_name, arguments.args.container_search_list, arguments.args.container_search_list_type, False):
+		return([])
+	if arguments.args.container_ignore_list and blob_service.isInList(container_name, arguments.args.container_ignore_list, arguments.args.container_ignore_list_type, False):
+		return([])
+	if arguments.args.blob_search_list and not blob_service.isInList(blob['name'], arguments.args.blob_search_list, arguments.args.blob_search_list_type, False):
+		return([])
+	if arguments.args.blob_ignore_list and blob_service.isInList(blob['name'], arguments.args.blob_ignore_list, arguments.args.blob_ignore_list_type, False):
+		return([])
+	item = [ str(blob['name']), int(blob['size']), str(container_name), str(dest_root) ]
+	if arguments.args.reconcile_md5:
+		content_key = blobContentKey(blob)
+		if content_key:
+			blob_content_keys[(item[2], item[0])] = content_key # only until the plan stage has reconciled it
+	archive_status = None
+	if wazure.tierIsArchive(blob.get('blob_tier')):
+		archive_status = str(blob.get('archive_status') or '')
+	return([(item, archive_status)])
+
+def streamPlanBatch(filtered:list) -> list:
+	'''
+	plan stage, a batch at a time - drops blobs the CSV already has as SUCCESS, appends rows for new ones, reconciles against the
+	download location (-rc) and hands archived blobs to the rehydrator. Passes on the items to download.
+	CSV writes go through wrq_csv_report so they're in line with the completion updates - a row is always there before its download can finish.
+	'''
+	new_rows = []
+	plan_list = []
+	archived = {}
+	for item, archive_status in filtered:
+		download_status = stream_csv_status.pop((item[2], item[0]), None)
+		if download_status == 'SUCCESS':
+			blob_content_keys.pop((item[2], item[0]), None)
+			continue
+		if download_status is None:
+			new_rows.append([ item[0], item[1], item[2], item[3], (item[1]/1024.0**2) ]) # filename, size, container, dl loc, expected size in mb
+		if archive_status is not None:
+			archived[(item[2], item[0])] = archive_status
+		plan_list.append(item)
+	if new_rows:
+		wrq_csv_report.add(log_csv.writeLinesToCSV, [[new_rows, ['File_Name', 'Expected_File_Size_bytes', 'Container', 'Downloaded_To', 'Expected_File_Size_MB', 'Download_Complete', 'Downloaded_File_Size_MB']]])
+	if arguments.args.reconcile and not arguments.args.copy_to and not resume_checkpoint.get('clean') and plan_list:
+		plan_list, reconciled_list = reconcileLocalInventory(plan_list, stream_local_inventories, queue_csv_update=True)
+	for item in plan_list:
+		blob_content_keys.pop((item[2], item[0]), None)
+	if archived:
+		archived_list = [i for i in plan_list if (i[2], i[0]) in archived]
+		if archive_rehydrator:
+			plan_list = [i for i in plan_list if not (i[2], i[0]) in archived]
+			archive_rehydrator.add([i for i in archived_list if not archived[(i[2], i[0])]])
+			archive_rehydrator.add([i for i in archived_list if archived[(i[2], i[0])]], already_requested=True)
+		elif archived_list:
+			log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): WARNING " + str(len(archived_list)) + " blobs are in the Archive tier and -rht is Off, these downloads will fail."])
+	return(plan_list)
+
+def streamQueueDownload(item:list) -> list:
+	'''
+	download stage - waits for room in wrq_download (at most -spb waiting) and queues the download. The end of the pipeline,
+	verify / report carry on from wrq_download's completed jobs as before (reportCompletedDownloads)
+	'''
+	global streamed_download_count
+	if not wrq_download.waitForRoom(arguments.args.stream_pipeline_buffer):
+		return([])
+	throughput_meter.addTotal(int(item[1]))
+	streamed_download_count += 1
+	wrq_download.add(blob_job_function, [item], priority_function=downloadPriority)
+	return([])
+
+def startStreamPipeline():
+	'''
+	Builds and starts download_pipeline - one listing source per storage account, so they list in parallel
+	'''
+	global download_pipeline
+	global stream_csv_status
+	if csv_already_exists:
+		try:
+			df = log_csv.readDataFrame(['File_Name', 'Container', 'Download_Complete'])
+			stream_csv_status = dict(zip(zip(df.Container.astype(str), df.File_Name.astype(str)), df.Download_Complete.fillna('').astype(str)))
+			del df
+		except Exception as ex:
+			print("- SABB(" + str(sys._getframe().f_lineno) +"): Couldn't read the CSV, every listed blob will be added to it again: " + str(ex) + " -")
+			log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Couldn't read the CSV, every listed blob will be added to it again: " + str(ex)])
+	buffer_size = arguments.args.stream_pipeline_buffer
+	download_pipeline = wrp.Pipeline('download_plan', debug=arguments.args.debug_modules)
+	download_pipeline.addStage('filter', streamFilterBlob, threads=2, max_waiting=buffer_size)
+	download_pipeline.addStage('plan', streamPlanBatch, max_waiting=buffer_size, batch_size=max(1, min(500, buffer_size)), batch_wait_sec=2)
+	download_pipeline.addStage('download', streamQueueDownload, max_waiting=buffer_size)
+	if archive_rehydrator:
+		archive_rehydrator.expecting_more = True
+	download_pipeline.start([blob_service.iterBlobsByContainers(arguments.args.container_search_list, arguments.args.blob_search_list, arguments.args.test_amount, account=account) for account in blob_service.accounts])
+
+def runStreamPipeline():
+	'''
+	Run in its own thread - holds wrq_download's inactive timeout off until the last blob is through download_pipeline
+	'''
+	global stream_csv_status
+	while download_pipeline.running():
+		wrq_download.inactive_timeout_counter = wrq_download.inactive_queue_timeout_sec
+		time.sleep(1)
+	if archive_rehydrator:
+		archive_rehydrator.expecting_more = False
+	stream_csv_status = {}
+	stream_local_inventories.clear()
+	print("- SABB(" + str(sys._getframe().f_lineno) +"): Listing and planning done, " + str(streamed_download_count) + " downloads queued: " + download_pipeline.status() + " -")
+	log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Listing and planning done, " + str(streamed_download_count) + " downloads queued: " + download_pipeline.status()])
+########################################### ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+# STREAMING PLAN (-sp) - list -> filter -> plan -> download as one pipeline, each blob queued as soon as it's listed
+########################################### 
+
+
+
 ########################################### 
 # THREAD Monitors download jobs and adds updates to log/csv queues
 ########################################### 
+def reportCompletedDownloads():
+	'''
+	Verifies each download job finished since the last call (from its result) and queues the CSV / log updates for them
+	Returns how many it found
+	'''
+	completed_jobs = download_cursor.read()
+	if completed_jobs:
+		tmp_log_lines = []
+		tmp_log_lines_jobs = []
+		if arguments.args.detailed_output:
+			print("\n")
+			print("- SABB(" + str(sys._getframe().f_lineno) +"): Checking for latest completed download jobs -")
+		tmp_log_lines.append('Checking for latest completed download jobs')
+		for jc in completed_jobs:
+			if arguments.args.detailed_output:
+				print("   - Found newly completed download job: " + str(jc.name))
+			tmp_log_lines.append('Found newly completed download job: ' + str(jc.name))
+		tmp_log_dl_list = []
+		tmp_csv_dl_list = []
+		for j in completed_jobs:
+			if arguments.args.detailed_output:
+				print("   - Adding newly completed download job to status report: " + str(j.name))
+			tmp_log_lines_jobs.append('Adding newly completed download job to status report: ' + str(j.name) )
+			command_args_list = list(j.args)
+			file_verify = compareJobResultSize(j)
+			if file_verify[0]:
+				tmp_csv_dl_list.append(('File_Name', str(command_args_list[0]), 'Container', str(command_args_list[2]), 'Download_Complete', "SUCCESS"))
+				tmp_csv_dl_list.append(('File_Name', str(command_args_list[0]), 'Container', str(command_args_list[2]), 'Expected_File_Size_MB', str(file_verify[1]) ))
+				tmp_csv_dl_list.append(('File_Name', str(command_args_list[0]), 'Container', str(command_args_list[2]), 'Downloaded_File_Size_MB', str(file_verify[2]) ))
+			#	wrq_csv_report.add(log_csv.updateCellByHeader, [['File_Name', str(command_args_list[0]), 'Download_Complete', "SUCCESS"]])
+			#	wrq_csv_report.add(log_csv.updateCellByHeader, [['File_Name', str(command_args_list[0]), 'Downloaded_File_Size_MB', str(file_verify[1])]])
+				tmp_log_dl_list.append('File Download: SUCCESS - ' + str(command_args_list[3]) + str(command_args_list[2]) + '/' + str(command_args_list[0]) )
+				if (str(command_args_list[2]), str(command_args_list[0])) in dedupe_links:
+					tmp_csv_dl_list += linkDedupedCopies(str(command_args_list[0]), str(command_args_list[2]), str(command_args_list[3]) + str(command_args_list[2]) + '/' + str(command_args_list[0]))
+				if bucket_thawer:
+					bucket_thawer.fileDone(str(command_args_list[2]), str(command_args_list[0]))
+			elif jobWasRequeued(j):
+				# stalled and cancelled - it's back on the queue and resumes, its csv row is filled in by the attempt that finishes
+				tmp_log_dl_list.append('File Download: REQUEUED (stalled, resumes) - ' + str(command_args_list[3]) + str(command_args_list[2]) + '/' + str(command_args_list[0]) )
+			else:
+				tmp_log_dl_list.append('File Download: FAILED - ' + str(command_args_list[3]) + str(command_args_list[2]) + '/' + str(command_args_list[0]) + ' ' + str(j.error or j.result) )
+				if (str(command_args_list[2]), str(command_args_list[0])) in dedupe_links:
+					tmp_csv_dl_list += requeueDedupedCopies(str(command_args_list[0]), str(command_args_list[2]))
+			# 0 = blob name - 1 = bytes size - 2 = container - 3 = downloaded to path
+		if run_me:
+			wrq_csv_report.add(log_csv.updateCellsByHeader,[[(tmp_csv_dl_list)]])
+			wrq_logging.add(log_file.writeLinesToFile, [[(tmp_log_lines)]])
+			wrq_logging.add(log_file.writeLinesToFile, [[(tmp_log_lines_jobs), 3]])
+			wrq_logging.add(log_file.writeLinesToFile, [[(tmp_log_dl_list), 3]])
+	return(len(completed_jobs))
+
 def updateCompletedWRQDownloadJobs():
 	'''
 	Get a list of rows to be added to the master file
+	Fed by download_cursor - wakes as soon as a download finishes instead of every 10 sec, then reports everything finished by then.
+	At most one batch per report_interval_sec: a batch is one transaction in the status db, but a rewrite of the whole CSV without it
 	'''
-	
-	global list_index
 	global run_me
+	report_interval_sec = 1 if arguments.args.status_db else 10
+	last_report = 0
 	while run_me:
-		time.sleep(10)
+		download_cursor.wait(10)
+		time.sleep(max(0, last_report + report_interval_sec - time.monotonic()))
+		last_report = time.monotonic()
 		if wrq_download.inactive_timeout_counter <= 0:
 			break
 		if not run_me:
 			break
 		try:
-			if len(wrq_download.jobs_completed) > 0:
-				last_index = len(wrq_download.jobs_completed)
-				tmp_log_lines = []
-				tmp_log_lines_jobs = []
-				if arguments.args.detailed_output:
-					print("\n")
-					print("- SABB(" + str(sys._getframe().f_lineno) +"): Checking for latest completed download jobs -")
-				tmp_log_lines.append('Checking for latest completed download jobs')
-				for jc in wrq_download.jobs_completed[list_index:last_index]:
-					if arguments.args.detailed_output:
-						print("   - Found newly completed download job: " + str(jc[0].name))
-					tmp_log_lines.append('Found newly completed download job: ' + str(jc[0].name))
-				tmp_log_dl_list = []
-				tmp_csv_dl_list = []
-				if not last_index == list_index:
-					for j in wrq_download.jobs_completed[list_index:last_index]:
-						if arguments.args.detailed_output:
-							print("   - Adding newly completed download job to status report: " + str(j[0].name))
-						tmp_log_lines_jobs.append('Adding newly completed download job to status report: ' + str(j[0].name) )
-						command_args_list = j[1].replace("'","").replace('"',"").replace("[","").replace("]","").replace(" ","")
-						command_args_list = list(command_args_list.split(","))
-						file_verify = compareDownloadSize( int(command_args_list[1]), str(command_args_list[3]) + str(command_args_list[2]) + '/' + str(command_args_list[0]) )
-						if file_verify[0]:
-							tmp_csv_dl_list.append(('File_Name', str(command_args_list[0]), 'Download_Complete', "SUCCESS"))
-							tmp_csv_dl_list.append(('File_Name', str(command_args_list[0]), 'Expected_File_Size_MB', str(file_verify[1]) ))
-							tmp_csv_dl_list.append(('File_Name', str(command_args_list[0]), 'Downloaded_File_Size_MB', str(file_verify[2]) ))
-						#	wrq_csv_report.add(log_csv.updateCellByHeader, [['File_Name', str(command_args_list[0]), 'Download_Complete', "SUCCESS"]])
-						#	wrq_csv_report.add(log_csv.updateCellByHeader, [['File_Name', str(command_args_list[0]), 'Downloaded_File_Size_MB', str(file_verify[1])]])
-							tmp_log_dl_list.append('File Download: SUCCESS - ' + str(command_args_list[3]) + str(command_args_list[2]) + '/' + str(command_args_list[0]) )
-						else:
-							tmp_log_dl_list.append('File Download: FAILED - ' + str(command_args_list[3]) + str(command_args_list[2]) + '/' + str(command_args_list[0]) )
-						# 0 = blob name - 1 = bytes size - 2 = container - 3 = downloaded to path
-					if run_me:
-						wrq_csv_report.add(log_csv.updateCellsByHeader,[[(tmp_csv_dl_list)]])
-						wrq_logging.add(log_file.writeLinesToFile, [[(tmp_log_lines)]])
-						wrq_logging.add(log_file.writeLinesToFile, [[(tmp_log_lines_jobs), 3]])
-						wrq_logging.add(log_file.writeLinesToFile, [[(tmp_log_dl_list), 3]])
-					list_index = last_index
+			reportCompletedDownloads()
 		except Exception as ex:
 			print("- SABB(" + str(sys._getframe().f_lineno) +"): Exception: -")
 			print(ex)
@@ -489,6 +977,151 @@ def updateCompletedWRQDownloadJobs():
 ########################################### 
 
 
+########################################### 
+# SIGNALS Ctrl-C / SIGTERM - drain the queues, flush the report and leave a checkpoint to resume from
+########################################### 
+def drainAndExit(signal_number, frame):
+	'''
+	Stops new downloads starting and gives the running ones -dds seconds to finish. Any still going are cancelled - they
+	flush what they have and leave a resume point. Then the finished ones are verified into the CSV, the CSV / log queues
+	are flushed and the resume points go in the checkpoint the next start reads. A second signal exits straight away.
+	'''
+	global run_me
+	global draining
+	if draining:
+		print("- SABB(" + str(sys._getframe().f_lineno) +"): Second signal, exiting without finishing the drain. -")
+		os._exit(1)
+	draining = True
+	if download_pipeline:
+		download_pipeline.stop()
+	print("- SABB(" + str(sys._getframe().f_lineno) +"): Signal " + str(signal_number) + " received - no new downloads, waiting up to " + str(arguments.args.drain_deadline_sec) + " sec for " + str(len(wrq_download.jobs_active)) + " running ones. -")
+	log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Signal " + str(signal_number) + " received - draining. Running downloads: " + str(len(wrq_download.jobs_active))])
+	stall_watchdog.stop()
+	tail_accelerator.stop()
+	if splunk_load_throttle:
+		splunk_load_throttle.stop()
+	if archive_rehydrator:
+		archive_rehydrator.stop()
+	if replication_monitor:
+		replication_monitor.stop()
+	if not wrq_download.drain(arguments.args.drain_deadline_sec):
+		cancelled = progress_tracker.inFlight()
+		print("- SABB(" + str(sys._getframe().f_lineno) +"): Deadline reached, checkpointing " + str(len(cancelled)) + " downloads still running. -")
+		log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Deadline reached, checkpointing " + str(len(cancelled)) + " downloads still running."])
+		for job in cancelled:
+			job.cancel()
+		if not wrq_download.drain(60):
+			log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): " + str(len(wrq_download.jobs_active)) + " downloads didn't stop in time, they'll start over next run."])
+	if bucket_thawer:
+		bucket_thawer.stop()
+	reportCompletedDownloads()
+	report_flushed = wrq_csv_report.drain(300, finish_waiting=True)
+	exportStatusCSV()
+	wrq_logging.drain(60, finish_waiting=True)
+	throughput_meter.stop()
+	resume_points = progress_tracker.resumePoints()
+	wrc.writeJSONAtomic(checkpoint_path, {'saved': currentDate(include_time=True), 'signal': int(signal_number), 'clean': report_flushed,
+										'report_csv': log_csv.log_path, 'resume_offsets': resume_points})
+	print("- SABB(" + str(sys._getframe().f_lineno) +"): Drained. " + str(len(resume_points)) + " partial downloads checkpointed to: " + checkpoint_path + " -")
+	log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Drained. Report flushed: " + str(report_flushed) + ". " + str(len(resume_points)) + " partial downloads checkpointed to: " + checkpoint_path])
+	if control_server:
+		control_server.stop()
+	run_me = False
+	sabb_op_timer.stop()
+	sys.exit(0)
+########################################### ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+# SIGNALS Ctrl-C / SIGTERM - drain the queues, flush the report and leave a checkpoint to resume from
+########################################### 
+
+
+########################################### 
+# CONTROL (-ctl) - live changes to the run from sabbctl.py, see lib/wr_control.py
+########################################### 
+control_server = None
+
+def controlStatus(body:dict) -> dict:
+	control_status = {'downloads_active': len(wrq_download.jobs_active), 'downloads_waiting': len(wrq_download.jobs_waiting), 'downloads_completed': len(wrq_download.jobs_completed),
+					'threads': wrq_download.threads_at_once, 'paused': wrq_download.paused, 'draining': draining,
+					'bandwidth_limit_mbps': bandwidth_limiter.rateMBps(), 'download_rate_mbps': bandwidth_limiter.observedMBps(),
+					'throughput_mbps': throughput_meter.mbps(), 'remaining_gb': round(throughput_meter.remainingBytes() / 1024.0**3, 2), 'eta': throughput_meter.etaString(),
+					'job_times': wrq_download.jobs_completed.stats(), 'stalled_requeued': stall_watchdog.stalled_count, 'priority_overrides': priority_overrides,
+					'csv_jobs_waiting': len(wrq_csv_report.jobs_waiting)}
+	if download_pipeline:
+		control_status['stream_plan'] = download_pipeline.status()
+	if wrq_download.fair_share is not None:
+		control_status['fair_share_waiting'] = wrq_download.fair_share.waitingByShare()
+		control_status['fair_share_weights'] = wrq_download.fair_share.weights
+	if splunk_load_throttle:
+		control_status['splunk_load_throttle'] = splunk_load_throttle.status()
+	if archive_rehydrator:
+		control_status['archive_rehydration'] = archive_rehydrator.status()
+	if bucket_thawer:
+		control_status['thaw'] = bucket_thawer.status()
+	return(control_status)
+
+def controlThreads(body:dict) -> dict:
+	new_threads = max(1, int(body['threads']))
+	wrq_download.increaseThreadsTo(new_threads)
+	if splunk_load_throttle:
+		splunk_load_throttle.max_threads = new_threads # the throttle still backs off under load, but only steps back up to this
+	return({'threads': wrq_download.threads_at_once})
+
+def controlBandwidth(body:dict) -> dict:
+	new_rate = max(0.0, float(body['mbps']))
+	bandwidth_limiter.setRate(new_rate)
+	if splunk_load_throttle:
+		splunk_load_throttle.max_bandwidth_mbps = new_rate
+	return({'bandwidth_limit_mbps': bandwidth_limiter.rateMBps()})
+
+def controlPriority(body:dict) -> dict:
+	'''
+	New priority for an index - downloads already waiting are moved, ones not queued yet get it from downloadPriority()
+	'''
+	index_name = str(body['index'])
+	new_priority = int(body['priority'])
+	priority_overrides[index_name] = new_priority
+	changed = wrq_download.reprioritize(lambda args: blobIndexName(args[0]) == index_name, new_priority)
+	return({'index': index_name, 'priority': new_priority, 'waiting_changed': changed})
+
+def controlWeight(body:dict) -> dict:
+	'''
+	New -fs weight for an index / container, used from its next turn
+	'''
+	if wrq_download.fair_share is None:
+		raise ValueError("fair share is off, start with -fs index or -fs container")
+	share_name = str(body['share'])
+	with wrq_download.job_condition:
+		wrq_download.fair_share.setWeight(share_name, max(0.001, float(body['weight'])))
+	return({'share': share_name, 'weight': wrq_download.fair_share.weight(share_name)})
+
+def controlPause(body:dict) -> dict:
+	if not wrq_download.paused:
+		wrq_download.pause(block=False)
+	return({'paused': wrq_download.paused, 'downloads_active': len(wrq_download.jobs_active)})
+
+def controlResume(body:dict) -> dict:
+	wrq_download.resume()
+	return({'paused': wrq_download.paused})
+
+def controlDrain(body:dict) -> dict:
+	'''
+	Same as Ctrl-C - the signal goes to the main thread (drainAndExit) once this has answered
+	'''
+	threading.Timer(0.5, signal.raise_signal, [signal.SIGTERM]).start()
+	return({'draining': True, 'drain_deadline_sec': arguments.args.drain_deadline_sec, 'checkpoint': checkpoint_path})
+
+def controlExport(body:dict) -> dict:
+	if not arguments.args.status_db:
+		raise ValueError("-sdb is off, the CSV is updated as it goes: " + log_csv.log_path)
+	row_count = exportStatusCSV()
+	if row_count < 0:
+		raise ValueError("export failed, see the log - the status db still has everything: " + log_csv.db_path)
+	return({'exported': log_csv.log_path, 'rows': row_count, 'csv_jobs_waiting': len(wrq_csv_report.jobs_waiting)})
+########################################### ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+# CONTROL (-ctl) - live changes to the run from sabbctl.py, see lib/wr_control.py
+########################################### 
+
+
 ########################################### ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 # MAIN Script lock - Last function to run in main thread and last to exit - Updates Console, exit's when time to
 ########################################### 
@@ -497,7 +1130,10 @@ def timeAndCompletionChecker():
 	global run_me
 	start_length_of_download_list = len(master_bucket_download_list)
 	while run_me:
-			if len(wrq_download.jobs_active) <= 0 and len(wrq_logging.jobs_active) <= 0 and len(wrq_download.jobs_completed) > 0 and len(wrq_csv_report.jobs_active) <= 0:
+			if download_pipeline:
+				start_length_of_download_list = max(1, streamed_download_count)
+			# the last downloads are verified (reportCompletedDownloads) before the thawer is checked, so their buckets are already handed to it
+			if not (download_pipeline and download_pipeline.running()) and not wrq_download.hasWaiting() and len(wrq_download.jobs_active) <= 0 and len(wrq_logging.jobs_active) <= 0 and len(wrq_download.jobs_completed) > 0 and len(wrq_csv_report.jobs_active) <= 0 and not (archive_rehydrator and archive_rehydrator.waiting() > 0) and reportCompletedDownloads() <= 0 and not (bucket_thawer and bucket_thawer.busy()):
 				run_me = False # THIS STOPS THE LAST CSV REPORTER LOOP! DONT DELETE
 			if arguments.args.detailed_output:
 				time.sleep(3)
@@ -506,7 +1142,7 @@ def timeAndCompletionChecker():
 				time.sleep(1)
 			check_time = currentDate(raw_or_str=True)
 			elapsed_time = check_time - start_time
-			completed_downloads = len(wrq_download.jobs_completed)
+			completed_downloads = len(wrq_download.jobs_completed) - progress_tracker.requeued_count # cancelled attempts finish as jobs too
 			percent_complete = round( float( completed_downloads / start_length_of_download_list ) * 100, 2 )
 			bar_amount = int( (22 / 100) * percent_complete )
 			bar_chars = '>' * bar_amount
@@ -531,12 +1167,33 @@ def timeAndCompletionChecker():
 			print("- Completed: " + str(percent_complete) + "%")
 			print("\n")
 			print("WRQ_Downloads------------")
-			print("- Downloads Active: " + str(len(wrq_download.jobs_active)))
+			print("- Downloads Active: " + str(len(wrq_download.jobs_active)) + (" (PAUSED - sabbctl.py resume)" if wrq_download.paused else ""))
 			print("- Downloads Completed: " + str(len(wrq_download.jobs_completed)))
 			print("- Downloads Waiting: " + str(len(wrq_download.jobs_waiting)))
 			print("- Average Download Time(min): " + str( round(wrq_download.average_job_time, 2) ) )
-			print("- Estimated Finish Time(min): " + str( round(wrq_download.estimated_finish_time, 2) ) )
-			print("- Estimated Finish Time(hr): " + str( round(wrq_download.estimated_finish_time/60, 2) ) )
+			print("- Download Job Times: " + wrq_download.jobs_completed.summary())
+			if download_pipeline:
+				print("- Stream Plan: " + download_pipeline.status())
+			if wrq_download.fair_share is not None:
+				print("- Fair Share (" + arguments.args.fair_share + "): " + wrq_download.fair_share.status())
+			print("- Throughput(MB/s, smoothed): " + str(throughput_meter.mbps()) + " (in flight: " + str(round(throughput_meter.in_flight_bytes / 1024.0**2, 1)) + " MB)")
+			print("- Remaining(GB): " + str(round(throughput_meter.remainingBytes() / 1024.0**3, 2)) + " / " + str(round(throughput_meter.total_bytes / 1024.0**3, 2)))
+			print("- Estimated Finish Time (by bytes): " + throughput_meter.etaString())
+			print("- Buffered In-Flight(MB): " + str(memory_budget.usedMB()) + " / " + str(memory_budget.budgetMB()) + " (peak: " + str(memory_budget.peakMB()) + ")")
+			print("- Download Rate(MB/s): " + str(bandwidth_limiter.observedMBps()) + " (limit: " + str(bandwidth_limiter.rateMBps()) + ", 0 = none)")
+			if splunk_load_throttle:
+				print("- Splunk Load Throttle: " + splunk_load_throttle.status())
+			print("- Downloads Stalled (requeued): " + str(stall_watchdog.stalled_count) + " (no progress for " + str(arguments.args.stall_window_sec) + " sec, 0 = off)")
+			print("- Tail Helpers: " + tail_accelerator.status())
+			if len(blob_service.accounts) > 1:
+				print("- Active GETs per Account: " + blob_service.accountStatus())
+			if replication_monitor:
+				print("- RA-GRS Secondary: " + blob_service.secondaryStatus())
+			if archive_rehydrator and (archive_rehydrator.waiting() > 0 or archive_rehydrator.ready_count > 0):
+				print("- Archive Rehydration: " + archive_rehydrator.status())
+			if bucket_thawer:
+				print("- Thaw / Rebuild (buckets): " + bucket_thawer.status())
+			print("- Deduped Copies (linked / waiting on download): " + str(deduped_linked) + " / " + str(sum(len(v) for v in list(dedupe_links.values()))))
 			print("-------------------------")
 			print("\n")
 			print("WRQ_Logging--------------")
@@ -561,7 +1218,7 @@ def timeAndCompletionChecker():
 			if arguments.args.detailed_output:
 				print("\n")
 
-			if len(wrq_download.jobs_active) > 0 or len(wrq_logging.jobs_active) > 0 or len(wrq_csv_report.jobs_active) > 0:
+			if len(wrq_download.jobs_active) > 0 or len(wrq_logging.jobs_active) > 0 or len(wrq_csv_report.jobs_active) > 0 or (bucket_thawer and bucket_thawer.busy()) or (download_pipeline and download_pipeline.running()) or wrq_download.hasWaiting():
 				# do log write to log less often
 				counter += 1
 				if counter > 7:
@@ -569,6 +1226,23 @@ def timeAndCompletionChecker():
 					tmp_log_lines = []
 					tmp_log_lines.append("Elapsed Time: " + str(elapsed_time))
 					tmp_log_lines.append("Percent Completed: " + str(percent_complete) + "%")
+					tmp_log_lines.append("Download Throughput: " + throughput_meter.status())
+					if download_pipeline:
+						tmp_log_lines.append("Stream Plan: " + download_pipeline.status())
+					if wrq_download.fair_share is not None:
+						tmp_log_lines.append("Fair Share (" + arguments.args.fair_share + "): " + wrq_download.fair_share.status(top=50))
+					tmp_log_lines.append("Buffered In-Flight(MB): " + str(memory_budget.usedMB()) + " / " + str(memory_budget.budgetMB()) + " (peak: " + str(memory_budget.peakMB()) + ", budget waits: " + str(memory_budget.waits) + ")")
+					if splunk_load_throttle:
+						tmp_log_lines.append("Splunk Load Throttle: " + splunk_load_throttle.status())
+					tmp_log_lines.append("Downloads Stalled (requeued): " + str(stall_watchdog.stalled_count))
+					tmp_log_lines.append("Tail Helpers: " + tail_accelerator.status())
+					if replication_monitor:
+						tmp_log_lines.append("RA-GRS Secondary: " + blob_service.secondaryStatus())
+					if archive_rehydrator and (archive_rehydrator.waiting() > 0 or archive_rehydrator.ready_count > 0):
+						tmp_log_lines.append("Archive Rehydration: " + archive_rehydrator.status())
+					if bucket_thawer:
+						tmp_log_lines.append("Thaw / Rebuild (buckets): " + bucket_thawer.status())
+					tmp_log_lines.append("Deduped Copies (linked / waiting on download): " + str(deduped_linked) + " / " + str(sum(len(v) for v in list(dedupe_links.values()))))
 					wrq_logging.add(log_file.writeLinesToFile, [[(tmp_log_lines)]])
 			else:
 				print("- SABB(" + str(sys._getframe().f_lineno) +"): Queues are empty. -")
@@ -579,6 +1253,19 @@ def timeAndCompletionChecker():
 				else:
 					print("- SABB(" + str(sys._getframe().f_lineno) +"): Exiting Threads Gracefully. -")
 					log_file.writeLinesToFile(['Exiting Threads Gracefully.'])
+					if splunk_load_throttle:
+						splunk_load_throttle.stop()
+					stall_watchdog.stop()
+					tail_accelerator.stop()
+					throughput_meter.stop()
+					if replication_monitor:
+						replication_monitor.stop()
+					if archive_rehydrator:
+						archive_rehydrator.stop()
+					if bucket_thawer:
+						bucket_thawer.stop()
+					if control_server:
+						control_server.stop()
 					wrq_csv_report.stop()
 					wrq_download.stop()
 					wrq_logging.stop()
@@ -586,11 +1273,13 @@ def timeAndCompletionChecker():
 					thread_blob_download_parent.join()
 					thread_csv_report_parent.join()
 					thread_update_completed.join()
+					exportStatusCSV()
 					print("- SABB(" + str(sys._getframe().f_lineno) +"): Exiting. -")
 					print("- SABB(" + str(sys._getframe().f_lineno) +"): Goodbye. -")
 					sabb_op_timer.stop()
 					break
 	else:
+		exportStatusCSV()
 		print("- SABB(" + str(sys._getframe().f_lineno) +"): Goodbye. -")
 		#thread_update_status.join()
 		sabb_op_timer.stop()
@@ -610,20 +1299,29 @@ if __name__ == "__main__":
 	
 	## Download prep
 	# get blobs into a list for download
-	makeBlobDownloadList(dest_download_loc_root=arguments.args.dest_download_loc_root, 
-						container_names_to_search_list=arguments.args.container_search_list,
-						container_names_search_list_equals_or_contains=arguments.args.container_search_list_type,
-						blob_names_to_search_list=arguments.args.blob_search_list,
-						blob_names_search_list_equals_or_contains=arguments.args.blob_search_list_type,
-						container_names_to_ignore_list=arguments.args.container_ignore_list,
-						container_names_ignore_list_equals_or_contains=arguments.args.container_ignore_list_type,
-						blob_names_to_ignore_list=arguments.args.blob_ignore_list,
-						blob_names_ignore_list_equals_or_contains=arguments.args.blob_ignore_list_type)
+	if arguments.args.copy_to:
+		dest_root = blob_service.copyDestRoot()
+	else:
+		dest_root = arguments.args.dest_download_loc_root
+	if stream_pipeline:
+		print("- SABB(" + str(sys._getframe().f_lineno) +"): Streaming the download plan (-sp) - blobs are filtered, planned and queued as they're listed. -")
+		log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Streaming the download plan (-sp) - blobs are filtered, planned and queued as they're listed."])
+		startStreamPipeline()
+	else:
+		makeBlobDownloadList(dest_download_loc_root=dest_root, 
+							container_names_to_search_list=arguments.args.container_search_list,
+							container_names_search_list_equals_or_contains=arguments.args.container_search_list_type,
+							blob_names_to_search_list=arguments.args.blob_search_list,
+							blob_names_search_list_equals_or_contains=arguments.args.blob_search_list_type,
+							container_names_to_ignore_list=arguments.args.container_ignore_list,
+							container_names_ignore_list_equals_or_contains=arguments.args.container_ignore_list_type,
+							blob_names_to_ignore_list=arguments.args.blob_ignore_list,
+							blob_names_ignore_list_equals_or_contains=arguments.args.blob_ignore_list_type)
 	
 	########################################### 
 	# Standalone CSV write out of new items and read back for list download
 	########################################### 
-	if arguments.args.standalone:
+	if arguments.args.standalone and not stream_pipeline:
 		# make or update csv if lines found that weren't on it, otherwise just create list from csv
 		if master_bucket_download_list:
 			print("\n\n\n#######################################################################################")
@@ -635,13 +1333,14 @@ if __name__ == "__main__":
 			master_bucket_download_list = []
 			# write updated CSV list out
 			log_csv.writeLinesToCSV( (tmp_list), ['File_Name', 'Expected_File_Size_bytes', 'Container', 'Downloaded_To', 'Expected_File_Size_MB', 'Download_Complete', 'Downloaded_File_Size_MB'])
+			exportStatusCSV() # so the new plan is in the CSV straight away (and for -woflo)
 		try:
 			# remove already downloaded from csv list and bring in the delta for new download processing
 			print("- SABB(" + str(sys._getframe().f_lineno) +"): Removing all downloaded items and uneeded columns before passing back list. -")
 			log_file.writeLinesToFile([str(sys._getframe().f_lineno) + "): Removing all downloaded items before passing back list. "])
-			df = pandas.read_csv(log_csv.log_path, engine='python')
+			df = log_csv.readDataFrame()
 			df = df[df.Download_Complete != 'SUCCESS']
-			df.drop(['Expected_File_Size_MB', 'Download_Complete', 'Downloaded_File_Size_MB'], inplace=True, axis=1, errors='ignore')
+			df.drop(['Expected_File_Size_MB', 'Download_Complete', 'Downloaded_File_Size_MB', 'Deduped_From', 'Dedupe_Link', 'Rehydrated', 'Thaw_Status'], inplace=True, axis=1, errors='ignore')
 			# remove headers now
 			df = df.iloc[1:]
 			print("- SABB(" + str(sys._getframe().f_lineno) +"): Done. -")
@@ -670,7 +1369,7 @@ if __name__ == "__main__":
 	########################################### 
 
 	# exit if no blobs found to dl
-	if not master_bucket_download_list:
+	if not master_bucket_download_list and not stream_pipeline:
 		print("- SABB(" + str(sys._getframe().f_lineno) +"): No Blobs found for download, exiting. -")
 		log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): No Blobs found for download, exiting."])
 		sabb_op_timer.stop()
@@ -680,16 +1379,48 @@ if __name__ == "__main__":
 	########################################### 
 	# WOFLO - Write out list only - No Downloading Option done here
 	########################################### 
-	if not arguments.args.write_out_full_list_only:
-		wrq_download.add(blob_service.downloadBlobByName, master_bucket_download_list, start_after_add=False)
+	if stream_pipeline:
+		print("- SABB(" + str(sys._getframe().f_lineno) +"): Downloads are added to wrq_download by download_pipeline as they're planned -")
+	elif not arguments.args.write_out_full_list_only:
+		reconciled_list = []
+		if resume_checkpoint.get('clean'):
+			print("- SABB(" + str(sys._getframe().f_lineno) +"): Last run drained cleanly, its CSV is up to date - skipping reconcile. -")
+		elif arguments.args.reconcile and not arguments.args.copy_to:
+			master_bucket_download_list, reconciled_list = reconcileLocalInventory(master_bucket_download_list)
+		if bucket_thawer:
+			bucket_thawer.addBuckets(master_bucket_download_list + reconciled_list)
+			for i in reconciled_list:
+				bucket_thawer.fileDone(str(i[2]), str(i[0]))
+		if arguments.args.dedupe and not arguments.args.copy_to:
+			master_bucket_download_list = dedupeDownloadList(master_bucket_download_list)
+		# spread the queue over every storage account rather than one account after the other
+		master_bucket_download_list = blob_service.interleaveByAccount(master_bucket_download_list)
+		ready_download_list = master_bucket_download_list
+		if blob_archive_status:
+			archived_list = [i for i in master_bucket_download_list if (str(i[2]), str(i[0])) in blob_archive_status]
+			if archive_rehydrator and archived_list:
+				ready_download_list = [i for i in master_bucket_download_list if not (str(i[2]), str(i[0])) in blob_archive_status]
+				archive_rehydrator.add([i for i in archived_list if not blob_archive_status[(str(i[2]), str(i[0]))]])
+				archive_rehydrator.add([i for i in archived_list if blob_archive_status[(str(i[2]), str(i[0]))]], already_requested=True)
+				print("- SABB(" + str(sys._getframe().f_lineno) +"): " + str(len(archived_list)) + " blobs are in the Archive tier, rehydrating to " + arguments.args.rehydrate_tier + " - each is downloaded once it's back. -")
+				log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): " + str(len(archived_list)) + " blobs are in the Archive tier, rehydrating to " + arguments.args.rehydrate_tier + " - each is downloaded once it's back."])
+			elif archived_list:
+				print("- SABB(" + str(sys._getframe().f_lineno) +"): WARNING " + str(len(archived_list)) + " blobs are in the Archive tier and -rht is Off, these downloads will fail. -")
+				log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): WARNING " + str(len(archived_list)) + " blobs are in the Archive tier and -rht is Off, these downloads will fail."])
+		if arguments.args.priority_indexes:
+			print("- SABB(" + str(sys._getframe().f_lineno) +"): Downloading these indexes first, in order: " + ", ".join(arguments.args.priority_indexes) + " -")
+			log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): Downloading these indexes first, in order: " + ", ".join(arguments.args.priority_indexes)])
+		throughput_meter.addTotal(sum(int(i[1]) for i in master_bucket_download_list))
+		wrq_download.add(blob_job_function, ready_download_list, start_after_add=False, priority_function=downloadPriority)
 		print("- SABB(" + str(sys._getframe().f_lineno) +"): Adding download job list to download queue: wrq_download -")
 	else:
 		print("\n\n\n#######################################################################################")
 		print("- SABB(" + str(sys._getframe().f_lineno) +"): Writing download job list to CSV - NO ACTUAL DOWNLOADS WILL HAPPEN -")
 		print("#######################################################################################\n\n\n")
 		time.sleep(10)
-	print("- SABB(" + str(sys._getframe().f_lineno) +"): " + str(len(master_bucket_download_list)) +" is number of items in the list -")
-	log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): " + str(len(master_bucket_download_list)) + " is number of items in the list to download."])
+	if not stream_pipeline:
+		print("- SABB(" + str(sys._getframe().f_lineno) +"): " + str(len(master_bucket_download_list)) +" is number of items in the list -")
+		log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"): " + str(len(master_bucket_download_list)) + " is number of items in the list to download."])
 
 	if not arguments.args.write_out_full_list_only:
 		if not arguments.args.standalone:
@@ -791,8 +1522,77 @@ if __name__ == "__main__":
 		log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"):Starting: thread_update_completed"])
 		thread_update_completed.start()
 
+		# thread_splunk_load_throttle
+		if splunk_load_throttle:
+			print("Starting: thread_splunk_load_throttle")
+			log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"):Starting: thread_splunk_load_throttle"])
+			thread_splunk_load_throttle = threading.Thread(target=splunk_load_throttle.start, name='splunk_load_throttle', args=())
+			thread_splunk_load_throttle.daemon = True
+			thread_splunk_load_throttle.start()
+
+		# thread_stall_watchdog
+		if arguments.args.stall_window_sec > 0:
+			print("Starting: thread_stall_watchdog")
+			log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"):Starting: thread_stall_watchdog"])
+			thread_stall_watchdog = threading.Thread(target=stall_watchdog.start, name='stall_watchdog', args=())
+			thread_stall_watchdog.daemon = True
+			thread_stall_watchdog.start()
+
+		# thread_tail_accelerator
+		if arguments.args.tail_split_mb > 0:
+			print("Starting: thread_tail_accelerator")
+			log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"):Starting: thread_tail_accelerator"])
+			thread_tail_accelerator = threading.Thread(target=tail_accelerator.start, name='tail_accelerator', args=())
+			thread_tail_accelerator.daemon = True
+			thread_tail_accelerator.start()
+
+		# thread_throughput_meter
+		print("Starting: thread_throughput_meter")
+		log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"):Starting: thread_throughput_meter"])
+		thread_throughput_meter = threading.Thread(target=throughput_meter.start, name='throughput_meter', args=())
+		thread_throughput_meter.daemon = True
+		thread_throughput_meter.start()
+
+		# thread_replication_monitor
+		if replication_monitor:
+			print("Starting: thread_replication_monitor")
+			log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"):Starting: thread_replication_monitor"])
+			thread_replication_monitor = threading.Thread(target=replication_monitor.start, name='replication_monitor', args=())
+			thread_replication_monitor.daemon = True
+			thread_replication_monitor.start()
+
+		# thread_bucket_thawer
+		if bucket_thawer:
+			print("Starting: thread_bucket_thawer")
+			log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"):Starting: thread_bucket_thawer"])
+			thread_bucket_thawer = threading.Thread(target=bucket_thawer.start, name='bucket_thawer', args=())
+			thread_bucket_thawer.daemon = True
+			thread_bucket_thawer.start()
+
+		# thread_stream_pipeline
+		if download_pipeline:
+			print("Starting: thread_stream_pipeline")
+			log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"):Starting: thread_stream_pipeline"])
+			thread_stream_pipeline = threading.Thread(target=runStreamPipeline, name='stream_pipeline', args=())
+			thread_stream_pipeline.daemon = True
+			thread_stream_pipeline.start()
+
+		# thread_archive_rehydrator
+		if archive_rehydrator and (archive_rehydrator.waiting() > 0 or archive_rehydrator.expecting_more):
+			print("Starting: thread_archive_rehydrator")
+			log_file.writeLinesToFile(["SABB(" + str(sys._getframe().f_lineno) +"):Starting: thread_archive_rehydrator"])
+			thread_archive_rehydrator = threading.Thread(target=archive_rehydrator.start, name='archive_rehydrator', args=())
+			thread_archive_rehydrator.daemon = True
+			thread_archive_rehydrator.start()
+
 	time.sleep(5) # let everyone breathe before the madness
 	if not arguments.args.write_out_full_list_only:
+		signal.signal(signal.SIGINT, drainAndExit)
+		signal.signal(signal.SIGTERM, drainAndExit)
+		if arguments.args.control_port > 0:
+			control_server = wrctl.ControlServer('sabb_control', arguments.args.control_port, {'status': controlStatus, 'threads': controlThreads, 'bandwidth': controlBandwidth,
+												'priority': controlPriority, 'weight': controlWeight, 'pause': controlPause, 'resume': controlResume, 'drain': controlDrain, 'export': controlExport}, debug=arguments.args.debug_modules)
+			control_server.start()
 		timeAndCompletionChecker() # this is a loop that runs for the entirety of the operation
 	########################################### ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 	# START LOCAL threads. Kick off the queues where the jobs are added - those queues run their x amount of threads each - threads used so main can still run
@@ -19,7 +19,38 @@ python3 sabb.py \
     -dm True \
     -woflo False \
     -scsv False \
-    -ta 0
+    -ta 0 \
+    -dwt 2 \
+    -mbm 512 \
+    -wm buffered \
+    -bw 0 \
+    -slt False \
+    -sw 300 \
+    -tsm 64 \
+    -rw 4 \
+    -dd False \
+    -apc 0 \
+    -srs 0 \
+    -srl 900 \
+    -rht Hot \
+    -rhp Standard \
+    -ct "" \
+    -th False \
+    -thp "{splunk_home}var/lib/splunk/{index}/thaweddb/" \
+    -trc "{splunk_home}bin/splunk rebuild {bucket_path} {index}" \
+    -thc 2 \
+    -rc False \
+    -rcm False \
+    -pi \
+    -pas 0 \
+    -tpl 60 \
+    -dds 120 \
+    -sp False \
+    -spb 1000 \
+    -ctl 0 \
+    -fs Off \
+    -fsw \
+    -sdb True
 
 
 # SEE README FOR ARG DETAILS - THIS SH file is for running the compiled AIO(all in one) version
@@ -27,7 +58,7 @@ python3 sabb.py \
 # \  = indicates cmd continues on next line in bash
 # do = detailed output (console only, doesn't affect logging)
 # lco = list_create_output - gives more feedback during the list creation portion
-# cs = Azure Connection String
+# cs = Azure Connection String - or several, space separated and each in quotes, to restore from more than one storage account at once
 # dl = destination download root (where the blobs will download to)
 # tc = thread count - how many downloads to have active at once
 # sa = stand alone - True if running this on a non-clustered environment to get all downloads to one idx, otherwise False and run a copy of this on EACH IDX
@@ -48,4 +79,39 @@ python3 sabb.py \
 # dm = debug_modules - Will enable deep level debug on all the modules that make up the script. Enable if getting errors, to help dev pinpoint
 # woflo = write_out_full_list_only - True will write out the entire list for all peers to a single CSV and do nothing else. Should set -dm to False when using this unless you have errors
 # scsv = skip_to_csv_load - If True, it won't attempt to download latest. Will resume from CSV directly
-# ta = test_amount - Throw a number in here and azure scrape will stop in each container at this number (lets you test quickly before running on full amount)
\ No newline at end of file
+# ta = test_amount - Throw a number in here and azure scrape will stop in each container at this number (lets you test quickly before running on full amount)
+# dwt = disk_write_threads - writer threads PER destination disk. Download threads hand buffers to these so raising tc doesn't thrash the disk. 0 = write inline on the download thread
+# mbm = memory_budget_mb - global cap in MB on downloaded-but-not-yet-written data across all download threads. 0 = unlimited
+# wm = write_mode - buffered (default), dontneed (drop restored data from page cache as it's written - use on live indexers) or direct (O_DIRECT where aligned)
+# bw = bandwidth_limit_mbps - cap on combined download rate in MB/s. 0 = unlimited
+# slt = splunk_load_throttle - True polls the local splunkd (uses spu/spw) and backs threads/bandwidth off when its cpu or indexing queues are busy
+# lsp = local_splunk_port - local splunkd management port for slt, default 8089
+# slti = splunk_load_poll_sec - seconds between slt checks, default 30
+# sltc = splunk_load_cpu_pct - cpu percent that triggers slt back off, default 80 (scales back up under half)
+# sltq = splunk_load_queue_pct - fullest indexing queue percent that triggers slt back off, default 70 (scales back up under half)
+# sw = stall_window_sec - seconds a download can receive nothing before it's cancelled and requeued (resumes from where it got to). 0 = off
+# tsm = tail_split_mb - once nothing is waiting, idle threads help in-flight downloads with at least this many MB left by pulling ranges of the same blob. 0 = off
+# rw = range_window - ranged GETs in flight per download (4MB each), 1 = one at a time
+# dd = dedupe - True downloads each distinct content (content_md5 + size) once and reflinks (or copies) the other copies from it, recorded as Deduped_From in the csv
+# apc = account_concurrency - max concurrent GETs against any one storage account when -cs is given several connection strings (space separated, each quoted). 0 = no cap beyond tc
+# srs = percent of downloads read from the RA-GRS secondary endpoint (0 off)
+# srl = max geo replication lag (sec) before secondary reads stop
+# rht = Archive tier blobs get rehydrated to this tier (Hot/Cool) and downloaded when ready, Off to skip
+# rhp = rehydration priority Standard/High
+# ct = copy_to - connection string of another storage account to copy blobs to server side instead of downloading, blank to download
+# th = thaw - move each finished bucket into thaweddb and rebuild it while the rest download
+# thp = thaw path template
+# trc = rebuild command template run on each thawed bucket
+# thc = buckets to thaw / rebuild at once
+# rc = reconcile - files already in the download location (path + size) are marked SUCCESS instead of downloaded again. Size only, so off by default - add -rcm to check md5 too
+# rcm = reconcile md5 - also check md5 of files found by -rc
+# pi = priority indexes - index names downloaded first, in order (space separated)
+# pas = priority aging sec - seconds of waiting each -pi step is worth, 0 = strict order
+# tpl = throughput log sec - how often MB/s, bytes remaining and ETA are logged
+# dds = drain deadline sec - on Ctrl-C / SIGTERM, how long running downloads get before they're checkpointed
+# sp = stream pipeline - standalone only, list / filter / plan / download each blob as it's listed instead of building the whole plan first
+# spb = stream pipeline buffer - with -sp, most blobs waiting between stages and in the download queue (memory cap)
+# ctl = control port - 127.0.0.1 port for live control with sabbctl.py (status, threads, bandwidth, priority, pause / resume / drain), 0 = off
+# fs = fair share - index / container / Off, downloads take turns between indexes (or containers) by bytes
+# fsw = fair share weights - with -fs, name=weight pairs, i.e. cisco=4 _internal=0.5, others are 1
+# sdb = status db - True keeps report status in csv_lists/<report>.csv.db (sqlite), the CSV is written from it at exit / sabbctl.py export
\ No newline at end of file
@@ -0,0 +1,68 @@
+##############################################################################################################
+# Contact: Will Rivendell
+# 	E1: wrivendell@splunk.com
+# 	E2: contact@willrivendell.com
+#
+#   Talks to a running sabb.py started with -ctl <port> (lib/wr_control.py). Run from the same folder as sabb.py
+#   i.e:
+#       python3 sabbctl.py status
+#       python3 sabbctl.py threads 40
+#       python3 sabbctl.py bandwidth 200          (MB/s, 0 = unlimited)
+#       python3 sabbctl.py priority cisco -1      (index's buckets, waiting and still to come, lower runs sooner)
+#       python3 sabbctl.py weight cisco 4         (-fs fair share weight)
+#       python3 sabbctl.py pause / resume / drain
+#       python3 sabbctl.py export                 (-sdb, write the report CSV out from the status db now)
+##############################################################################################################
+
+### Imports ###########################################
+import argparse, json, sys, urllib.request, urllib.error
+
+### FUNCTIONS ###########################################
+
+def sendCommand(control_file:str, command:str, body:dict) -> tuple:
+	'''
+	(http status, response dict) from the running sabb.py whose port / token are in control_file
+	'''
+	with open(control_file) as f:
+		control = json.load(f)
+	request = urllib.request.Request('http://127.0.0.1:' + str(control['port']) + '/' + command, data=json.dumps(body).encode('utf-8'),
+									headers={'Content-Type': 'application/json', 'X-Control-Token': control['token']}, method='POST')
+	try:
+		with urllib.request.urlopen(request, timeout=30) as response:
+			return(response.status, json.loads(response.read().decode('utf-8')))
+	except urllib.error.HTTPError as ex:
+		return(ex.code, json.loads(ex.read().decode('utf-8') or '{}'))
+
+def Arguments():
+	parser = argparse.ArgumentParser(description="Query and change a running sabb.py (started with -ctl)")
+	parser.add_argument("-cf", "--control_file", default='./logs/sabb_control.json', help="Port / token file the running sabb.py wrote.")
+	commands = parser.add_subparsers(dest='command', required=True)
+	commands.add_parser('status', help="Queue, thread, bandwidth and throughput status.")
+	threads_parser = commands.add_parser('threads', help="Set the download thread count.")
+	threads_parser.add_argument('threads', type=int)
+	bandwidth_parser = commands.add_parser('bandwidth', help="Set the download bandwidth limit in MB/s, 0 for unlimited.")
+	bandwidth_parser.add_argument('mbps', type=float)
+	priority_parser = commands.add_parser('priority', help="Set the priority of an index's downloads - lower runs sooner, -pi indexes are 0, 1, 2 ... everything else after them.")
+	priority_parser.add_argument('index')
+	priority_parser.add_argument('priority', type=int)
+	weight_parser = commands.add_parser('weight', help="With -fs, set an index's (or container's) fair share weight - 2 gets twice the bytes of a 1.")
+	weight_parser.add_argument('share')
+	weight_parser.add_argument('weight', type=float)
+	commands.add_parser('pause', help="No new downloads start, running ones finish. Nothing is lost - resume carries on.")
+	commands.add_parser('resume', help="Undo pause.")
+	commands.add_parser('drain', help="Same as Ctrl-C / SIGTERM - drains, checkpoints and exits. The next start resumes.")
+	commands.add_parser('export', help="With -sdb, write the report CSV out from the status db now (it's otherwise written at exit).")
+	return(parser.parse_args())
+
+### RUNTIME ###########################################
+if __name__ == "__main__":
+	args = Arguments()
+	body = {k: v for k, v in vars(args).items() if not k in ('command', 'control_file')}
+	try:
+		status, response = sendCommand(args.control_file, args.command, body)
+	except (OSError, ValueError) as ex:
+		print("- SABBCTL: Couldn't reach sabb.py - is it running with -ctl, from this folder? (" + str(ex) + ") -")
+		sys.exit(2)
+	print(json.dumps(response, indent=2, default=str))
+	if not status == 200:
+		sys.exit(1)
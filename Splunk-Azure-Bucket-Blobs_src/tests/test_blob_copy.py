@@ -0,0 +1,187 @@
+##############################################################################################################
+# Drives wr_azure_lib.BlobService copy mode (-ct) against a stub Blob endpoint (local http server) - no azure / azurite needed
+#   python3 -m unittest discover -s tests     (from the folder sabb.py is in)
+##############################################################################################################
+
+### Imports
+import os, sys, base64, shutil, tempfile, threading, unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import wr_azure_lib as wazure
+from lib import wr_logging as log
+from lib import wr_thread_queue as wrq
+
+ACCOUNT_KEY = base64.b64encode(b'stub-account-key').decode('ascii')
+HEADER = ['File_Name', 'Expected_File_Size_bytes', 'Container', 'Downloaded_To', 'Expected_File_Size_MB', 'Download_Complete', 'Downloaded_File_Size_MB']
+
+### Stubs ###########################################
+
+class StubBlobEndpoint(BaseHTTPRequestHandler):
+	'''
+	Just enough of the Blob REST api for copy mode, for account 'dst':
+		container properties / create, start copy (Copy Blob), blob properties (HEAD) and abort copy
+	copy_plans[blob] = copy status the HEADs hand out in turn (the last one repeats), 'error' answers that HEAD with a 403
+	'''
+	containers = set()
+	copy_plans = {}
+	blob_sizes = {}
+	requests = []
+	lock = threading.Lock()
+
+	def reply(self, status:int, headers={}):
+		self.send_response(status)
+		self.send_header('x-ms-request-id', 'stub')
+		self.send_header('x-ms-version', '2021-08-06')
+		self.send_header('ETag', '"0x1"')
+		self.send_header('Last-Modified', 'Mon, 01 Jan 2024 00:00:00 GMT')
+		for name, value in headers.items():
+			self.send_header(name, value)
+		if not 'Content-Length' in headers:
+			self.send_header('Content-Length', '0')
+		self.end_headers()
+
+	def target(self) -> tuple:
+		url = urlparse(self.path)
+		parts = url.path.lstrip('/').split('/', 2) + ['', '']
+		return(parts[1], parts[2], parse_qs(url.query))
+
+	def do_GET(self):
+		container_name, blob_name, query = self.target()
+		with StubBlobEndpoint.lock:
+			StubBlobEndpoint.requests.append(('GET', container_name, blob_name, query))
+			found = container_name in StubBlobEndpoint.containers
+		if query.get('restype') == ['container'] and found:
+			self.reply(200)
+		else:
+			self.reply(404, {'x-ms-error-code': 'ContainerNotFound'})
+
+	def do_PUT(self):
+		container_name, blob_name, query = self.target()
+		with StubBlobEndpoint.lock:
+			StubBlobEndpoint.requests.append(('PUT', container_name, blob_name, query, self.headers.get('x-ms-copy-source', '')))
+			if query.get('restype') == ['container']:
+				StubBlobEndpoint.containers.add(container_name)
+				self.reply(201)
+			elif query.get('comp') == ['copy']:
+				StubBlobEndpoint.copy_plans[blob_name] = ['aborted']
+				self.reply(204)
+			else:
+				self.reply(202, {'x-ms-copy-id': 'copy-' + blob_name, 'x-ms-copy-status': StubBlobEndpoint.copy_plans[blob_name][0]})
+
+	def do_HEAD(self):
+		container_name, blob_name, query = self.target()
+		with StubBlobEndpoint.lock:
+			StubBlobEndpoint.requests.append(('HEAD', container_name, blob_name, query))
+			plan = StubBlobEndpoint.copy_plans[blob_name]
+			copy_status = plan.pop(0) if len(plan) > 1 else plan[0]
+		if copy_status == 'error':
+			self.reply(403, {'x-ms-error-code': 'AuthorizationFailure'})
+			return
+		self.reply(200, {'Content-Length': str(StubBlobEndpoint.blob_sizes.get(blob_name, 0)), 'x-ms-blob-type': 'BlockBlob',
+						'x-ms-copy-id': 'copy-' + blob_name, 'x-ms-copy-status': copy_status})
+
+	def log_message(self, format, *args):
+		pass
+
+### Tests ###########################################
+
+class TestBlobCopy(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.http_server = ThreadingHTTPServer(('127.0.0.1', 0), StubBlobEndpoint)
+		threading.Thread(target=cls.http_server.serve_forever, daemon=True).start()
+		cls.endpoint = 'http://127.0.0.1:' + str(cls.http_server.server_address[1])
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.http_server.shutdown()
+		cls.http_server.server_close()
+
+	def setUp(self):
+		self.start_dir = os.getcwd()
+		self.work_dir = tempfile.mkdtemp()
+		os.chdir(self.work_dir) # ./logs/ goes here
+		StubBlobEndpoint.containers = set()
+		StubBlobEndpoint.copy_plans = {}
+		StubBlobEndpoint.blob_sizes = {}
+		StubBlobEndpoint.requests = []
+		self.blob_service = wazure.BlobService(self.connectString('src'), copy_to=self.connectString('dst'), copy_poll_max_sec=1)
+		self.sleep_patch = mock.patch.object(wazure, 'sleep') # no real waits between status polls
+		self.sleep_patch.start()
+
+	def tearDown(self):
+		self.sleep_patch.stop()
+		os.chdir(self.start_dir)
+		shutil.rmtree(self.work_dir, ignore_errors=True)
+
+	def connectString(self, account_name:str) -> str:
+		return('DefaultEndpointsProtocol=http;AccountName=' + account_name + ';AccountKey=' + ACCOUNT_KEY + ';BlobEndpoint=' + self.endpoint + '/' + account_name + ';')
+
+	def requestsFor(self, method:str) -> list:
+		return([r for r in StubBlobEndpoint.requests if r[0] == method])
+
+	def test_success_with_size_check(self):
+		StubBlobEndpoint.copy_plans = {'db/a.tsidx': ['pending', 'pending', 'success'], 'db/b.tsidx': ['success']}
+		StubBlobEndpoint.blob_sizes = {'db/a.tsidx': 11, 'db/b.tsidx': 9}
+		self.assertEqual(self.blob_service.copyBlobByName('db/a.tsidx', 11, 'cont'), (True, 11))
+		self.assertEqual(self.blob_service.copyBlobByName('db/b.tsidx', 10, 'cont'), (False, 9)) # copied, but not the size listed
+		self.assertEqual(StubBlobEndpoint.containers, {'cont'})
+		self.assertEqual(len([r for r in self.requestsFor('PUT') if r[3].get('restype')]), 1) # created once, then remembered
+		copy_source = self.requestsFor('PUT')[1][4]
+		self.assertTrue(copy_source.startswith(self.endpoint + '/src/cont/db/a.tsidx?'))
+		self.assertIn('sig=', copy_source) # read SAS from the source account's key
+		self.assertEqual(len(self.requestsFor('HEAD')), 5) # a: 3 status polls + its size, b: done when started, just its size
+
+	def test_failed_copy(self):
+		StubBlobEndpoint.containers = {'cont'}
+		StubBlobEndpoint.copy_plans = {'db/a.tsidx': ['pending', 'failed']}
+		self.assertEqual(self.blob_service.copyBlobByName('db/a.tsidx', 11, 'cont'), (False, 0))
+		self.assertFalse([r for r in self.requestsFor('PUT') if r[3].get('comp')]) # finished (failed) - nothing to abort
+
+	def test_pending_copy_aborted_when_polling_fails(self):
+		StubBlobEndpoint.containers = {'cont'}
+		StubBlobEndpoint.copy_plans = {'db/a.tsidx': ['pending', 'pending', 'error']}
+		self.assertEqual(self.blob_service.copyBlobByName('db/a.tsidx', 11, 'cont'), (False, 0))
+		aborts = [r for r in self.requestsFor('PUT') if r[3].get('comp') == ['copy']]
+		self.assertEqual(len(aborts), 1)
+		self.assertEqual(aborts[0][3].get('copyid'), ['copy-db/a.tsidx'])
+		self.assertEqual(StubBlobEndpoint.copy_plans['db/a.tsidx'], ['aborted'])
+
+	def test_report_row_from_copy_job(self):
+		'''
+		The copy job goes through the download queue like sabb's, and its row is filled in from the job's args and result
+		'''
+		StubBlobEndpoint.copy_plans = {'db/a.tsidx': ['success'], 'db/b.tsidx': ['failed']}
+		StubBlobEndpoint.blob_sizes = {'db/a.tsidx': 2 * 1024**2}
+		dest_root = self.blob_service.copyDestRoot()
+		self.assertEqual(dest_root, 'azure://dst/')
+		items = [['db/a.tsidx', 2 * 1024**2, 'cont', dest_root], ['db/b.tsidx', 10, 'cont', dest_root]]
+		store = log.StatusStore('report.csv', log_folder='./csv_lists/', prefix_date=False)
+		store.writeLinesToCSV([item + [item[1] / 1024.0**2, '', 0] for item in items], HEADER)
+		queue = wrq.Queue('test_copy', 2, job_bytes_function=lambda job: job.result[1] if job.result else 0)
+		cursor = queue.jobs_completed.cursor()
+		queue.add(self.blob_service.copyBlobByName, items)
+		threading.Thread(target=queue.start, daemon=True).start()
+		completed_jobs = []
+		while len(completed_jobs) < 2 and cursor.wait(10):
+			completed_jobs += cursor.read()
+		with queue.job_condition:
+			queue.workers_exit = True
+			queue.job_condition.notify_all()
+		updates = []
+		for job in completed_jobs:
+			if job.result[0] and int(job.result[1]) == int(job.args[1]):
+				updates.append(('File_Name', job.args[0], 'Container', job.args[2], 'Download_Complete', 'SUCCESS'))
+				updates.append(('File_Name', job.args[0], 'Container', job.args[2], 'Downloaded_File_Size_MB', str(job.result[1] / 1024.0**2)))
+		store.updateCellsByHeader(updates)
+		df = store.readDataFrame(['File_Name', 'Downloaded_To', 'Download_Complete', 'Downloaded_File_Size_MB'])
+		store.close()
+		self.assertEqual(df.values.tolist(), [['db/a.tsidx', 'azure://dst/', 'SUCCESS', '2.0'], ['db/b.tsidx', 'azure://dst/', '', 0]])
+		self.assertEqual(queue.jobs_completed.total_bytes, 2 * 1024**2)
+
+if __name__ == "__main__":
+	unittest.main()
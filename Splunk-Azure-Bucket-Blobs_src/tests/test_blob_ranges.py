@@ -0,0 +1,122 @@
+##############################################################################################################
+# Drives wr_azure_lib.BlobService ranged downloads (disk_writer on) against a stub Blob endpoint - no azure / azurite needed
+#   python3 -m unittest discover -s tests     (from the folder sabb.py is in)
+##############################################################################################################
+
+### Imports
+import os, sys, time, base64, hashlib, shutil, tempfile, threading, unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import wr_azure_lib as wazure
+from lib import wr_disk_writer as wrdw
+from lib import wr_transfer_progress as wrtp
+
+ACCOUNT_KEY = base64.b64encode(b'stub-account-key').decode('ascii')
+BLOB_DATA = bytes(range(256)) * 4096 # 1 MB
+CHUNK_SIZE_MB = 1 / 16 # 64 KB ranges - 16 of them
+
+### Stubs ###########################################
+
+class StubBlobEndpoint(BaseHTTPRequestHandler):
+	'''
+	Ranged GETs (x-ms-range) of BLOB_DATA for any blob, each held delay_sec, counting how many are in flight at once
+	'''
+	delay_sec = 0.05
+	in_flight = 0
+	most_in_flight = 0
+	gets = 0
+	lock = threading.Lock()
+
+	def do_GET(self):
+		with StubBlobEndpoint.lock:
+			StubBlobEndpoint.gets += 1
+			StubBlobEndpoint.in_flight += 1
+			StubBlobEndpoint.most_in_flight = max(StubBlobEndpoint.most_in_flight, StubBlobEndpoint.in_flight)
+		try:
+			time.sleep(StubBlobEndpoint.delay_sec)
+			byte_range = (self.headers.get('x-ms-range') or self.headers.get('Range') or 'bytes=0-').split('=', 1)[1]
+			start, end = byte_range.split('-')
+			start = int(start)
+			end = min(int(end or len(BLOB_DATA) - 1), len(BLOB_DATA) - 1)
+			body = BLOB_DATA[start:end + 1]
+			self.send_response(206)
+			self.send_header('x-ms-request-id', 'stub')
+			self.send_header('x-ms-version', '2021-08-06')
+			self.send_header('x-ms-blob-type', 'BlockBlob')
+			self.send_header('ETag', '"0x1"')
+			self.send_header('Last-Modified', 'Mon, 01 Jan 2024 00:00:00 GMT')
+			self.send_header('Content-Range', 'bytes ' + str(start) + '-' + str(end) + '/' + str(len(BLOB_DATA)))
+			self.send_header('Content-MD5', base64.b64encode(hashlib.md5(body).digest()).decode('ascii'))
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+		finally:
+			with StubBlobEndpoint.lock:
+				StubBlobEndpoint.in_flight -= 1
+
+	def log_message(self, format, *args):
+		pass
+
+### Tests ###########################################
+
+class TestBlobRanges(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.http_server = ThreadingHTTPServer(('127.0.0.1', 0), StubBlobEndpoint)
+		threading.Thread(target=cls.http_server.serve_forever, daemon=True).start()
+		cls.connect_str = ('DefaultEndpointsProtocol=http;AccountName=src;AccountKey=' + ACCOUNT_KEY + ';BlobEndpoint=http://127.0.0.1:'
+							+ str(cls.http_server.server_address[1]) + '/src;')
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.http_server.shutdown()
+		cls.http_server.server_close()
+
+	def setUp(self):
+		self.start_dir = os.getcwd()
+		self.work_dir = tempfile.mkdtemp()
+		os.chdir(self.work_dir) # ./logs/ goes here
+		StubBlobEndpoint.in_flight = 0
+		StubBlobEndpoint.most_in_flight = 0
+		StubBlobEndpoint.gets = 0
+
+	def tearDown(self):
+		os.chdir(self.start_dir)
+		shutil.rmtree(self.work_dir, ignore_errors=True)
+
+	def download(self, range_window:int, progress_tracker=None) -> tuple:
+		'''
+		Returns (job result, seconds taken)
+		'''
+		blob_service = wazure.BlobService(self.connect_str, disk_writer=wrdw.DiskWriter('test_writer'), chunk_size_mb=CHUNK_SIZE_MB,
+										progress_tracker=progress_tracker, range_window=range_window)
+		started = time.monotonic()
+		result = blob_service.downloadBlobByName('db/journal.zst', len(BLOB_DATA), 'cont', self.work_dir + '/downloads/')
+		return(result, time.monotonic() - started)
+
+	def assertDownloaded(self, result:tuple):
+		self.assertEqual(result, (True, len(BLOB_DATA)))
+		with open(self.work_dir + '/downloads/cont/db/journal.zst', 'rb') as f:
+			self.assertEqual(f.read(), BLOB_DATA)
+		self.assertEqual(StubBlobEndpoint.gets, 16)
+
+	def test_ranges_in_flight_per_download(self):
+		result, window_seconds = self.download(4, wrtp.ProgressTracker('test_progress'))
+		self.assertDownloaded(result)
+		self.assertEqual(StubBlobEndpoint.most_in_flight, 4)
+		StubBlobEndpoint.most_in_flight = 0
+		StubBlobEndpoint.gets = 0
+		result, serial_seconds = self.download(1, wrtp.ProgressTracker('test_progress'))
+		self.assertDownloaded(result)
+		self.assertEqual(StubBlobEndpoint.most_in_flight, 1)
+		self.assertLess(window_seconds * 2, serial_seconds) # 16 x delay_sec one at a time, about a quarter of that 4 at once
+
+	def test_window_without_progress_tracker(self):
+		result, window_seconds = self.download(4)
+		self.assertDownloaded(result)
+		self.assertEqual(StubBlobEndpoint.most_in_flight, 4)
+
+if __name__ == "__main__":
+	unittest.main()
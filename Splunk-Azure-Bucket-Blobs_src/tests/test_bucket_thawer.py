@@ -0,0 +1,94 @@
+##############################################################################################################
+# Drives wr_bucket_thawer.BucketThawer with a stub script standing in for 'splunk rebuild' (-trc) - no splunk needed
+#   python3 -m unittest discover -s tests     (from the folder sabb.py is in)
+##############################################################################################################
+
+### Imports
+import os, sys, time, shlex, shutil, tempfile, threading, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import wr_bucket_thawer as wrbt
+
+### Stubs ###########################################
+
+# writes its args into the bucket it was given and exits with the code asked for
+STUB_REBUILD = '''import sys
+with open(sys.argv[1] + '/rebuilt_by_stub', 'w') as f:
+	f.write(' '.join(sys.argv[1:]))
+sys.exit(int(sys.argv[3]))
+'''
+
+BUCKET_FILES = ['main/db/db_1700000100_1700000000_7/rawdata/journal.zst', 'main/db/db_1700000100_1700000000_7/1700000100-1700000000.tsidx']
+
+### Tests ###########################################
+
+class TestBucketThawer(unittest.TestCase):
+	def setUp(self):
+		self.start_dir = os.getcwd()
+		self.work_dir = tempfile.mkdtemp()
+		os.chdir(self.work_dir) # ./logs/ goes here
+		self.download_root = self.work_dir + '/downloads/'
+		self.stub_path = self.work_dir + '/stub_rebuild.py'
+		with open(self.stub_path, 'w') as f:
+			f.write(STUB_REBUILD)
+		self.results = []
+		self.thawer = None
+
+	def tearDown(self):
+		if self.thawer:
+			self.thawer.stop()
+		os.chdir(self.start_dir)
+		shutil.rmtree(self.work_dir, ignore_errors=True)
+
+	def startThawer(self, exit_code=0):
+		rebuild_command = shlex.quote(sys.executable) + ' ' + shlex.quote(self.stub_path) + ' {bucket_path} {index} ' + str(exit_code)
+		self.thawer = wrbt.BucketThawer('test_thaw', self.work_dir + '/splunk/', thaw_path_template='{splunk_home}var/lib/splunk/{index}/thaweddb/',
+										rebuild_command_template=rebuild_command, thaw_concurrency=1, result_callback=lambda files, status: self.results.append(status))
+		items = []
+		for blob_name in BUCKET_FILES:
+			os.makedirs(os.path.dirname(self.download_root + 'cont/' + blob_name), exist_ok=True)
+			with open(self.download_root + 'cont/' + blob_name, 'w') as f:
+				f.write('data')
+			items.append([blob_name, 4, 'cont', self.download_root])
+		self.thawer.addBuckets(items)
+		threading.Thread(target=self.thawer.start, daemon=True).start()
+
+	def waitUntilIdle(self, timeout_sec=30):
+		started = time.monotonic()
+		while self.thawer.busy() and time.monotonic() - started < timeout_sec:
+			time.sleep(0.1)
+
+	def test_busy_from_last_file_until_rebuilt(self):
+		self.startThawer()
+		self.thawer.fileDone('cont', BUCKET_FILES[0])
+		self.assertFalse(self.thawer.busy()) # still a file to come
+		self.thawer.fileDone('cont', BUCKET_FILES[1])
+		self.assertTrue(self.thawer.busy()) # complete but maybe not picked up by the queue yet
+		self.waitUntilIdle()
+		self.assertFalse(self.thawer.busy())
+		self.assertEqual(self.results, ['REBUILT'])
+		thawed_bucket = self.work_dir + '/splunk/var/lib/splunk/main/thaweddb/db_1700000100_1700000000_7'
+		with open(thawed_bucket + '/rebuilt_by_stub') as f:
+			self.assertEqual(f.read(), thawed_bucket + ' main 0')
+		self.assertTrue(os.path.exists(thawed_bucket + '/rawdata/journal.zst'))
+		self.assertFalse(os.path.exists(self.download_root + 'cont/main/db/db_1700000100_1700000000_7'))
+
+	def test_rebuild_exit_code_is_failure(self):
+		self.startThawer(exit_code=3)
+		for blob_name in BUCKET_FILES:
+			self.thawer.fileDone('cont', blob_name)
+		self.waitUntilIdle()
+		self.assertEqual(self.results, ['REBUILD_FAILED'])
+		self.assertEqual(self.thawer.failed_count, 1)
+
+	def test_already_thawed_is_left_alone(self):
+		os.makedirs(self.work_dir + '/splunk/var/lib/splunk/main/thaweddb/db_1700000100_1700000000_7')
+		self.startThawer()
+		for blob_name in BUCKET_FILES:
+			self.thawer.fileDone('cont', blob_name)
+		self.waitUntilIdle()
+		self.assertEqual(self.results, ['THAW_FAILED'])
+		self.assertTrue(os.path.exists(self.download_root + 'cont/' + BUCKET_FILES[0]))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,116 @@
+##############################################################################################################
+# Drives wr_splunk_throttle.SplunkLoadThrottle against a stub splunkd (local http server) - no splunk needed
+#   python3 -m unittest discover -s tests     (from the folder sabb.py is in)
+##############################################################################################################
+
+### Imports
+import os, sys, json, time, shutil, tempfile, threading, unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import wr_splunk_wapi as wapi
+from lib import wr_splunk_throttle as wrst
+
+### Stubs ###########################################
+
+class StubSplunkd(BaseHTTPRequestHandler):
+	cpu_pct = 10.0
+	queue_fill_pct = 10.0
+	delay_sec = 0
+
+	def do_GET(self):
+		time.sleep(StubSplunkd.delay_sec)
+		if self.path.startswith('/services/server/status/resource-usage/hostwide'):
+			body = {'entry': [{'content': {'cpu_system_pct': StubSplunkd.cpu_pct / 2, 'cpu_user_pct': StubSplunkd.cpu_pct / 2, 'mem': 100, 'mem_used': 50}}]}
+		elif self.path.startswith('/services/server/introspection/queues'):
+			body = {'entry': [{'name': 'indexqueue', 'content': {'current_size_bytes': StubSplunkd.queue_fill_pct, 'max_size_bytes': 100}}]}
+		else:
+			self.send_response(404)
+			self.end_headers()
+			return
+		body_bytes = json.dumps(body).encode('utf-8')
+		try:
+			self.send_response(200)
+			self.send_header('Content-Type', 'application/json')
+			self.send_header('Content-Length', str(len(body_bytes)))
+			self.end_headers()
+			self.wfile.write(body_bytes)
+		except OSError:
+			pass # the client gave up (timeout test)
+
+	def log_message(self, format, *args):
+		pass
+
+class StubQueue():
+	def __init__(self, threads_at_once):
+		self.threads_at_once = threads_at_once
+
+	def increaseThreadsTo(self, threads):
+		self.threads_at_once = threads
+
+### Tests ###########################################
+
+class TestSplunkLoadThrottle(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.start_dir = os.getcwd()
+		cls.work_dir = tempfile.mkdtemp()
+		os.chdir(cls.work_dir) # ./logs/ goes here
+		cls.http_server = ThreadingHTTPServer(('127.0.0.1', 0), StubSplunkd)
+		cls.http_server.daemon_threads = True
+		threading.Thread(target=cls.http_server.serve_forever, daemon=True).start()
+		cls.splunk_service = wapi.SplunkService('http://127.0.0.1', cls.http_server.server_address[1], 'admin', 'changeme')
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.http_server.shutdown()
+		cls.http_server.server_close()
+		os.chdir(cls.start_dir)
+		shutil.rmtree(cls.work_dir, ignore_errors=True)
+
+	def setUp(self):
+		StubSplunkd.cpu_pct = 10.0
+		StubSplunkd.queue_fill_pct = 10.0
+		StubSplunkd.delay_sec = 0
+		self.queue = StubQueue(20)
+		self.throttle = wrst.SplunkLoadThrottle('test_load', self.splunk_service, self.queue, max_threads=20, request_timeout_sec=1)
+
+	def test_busy_cpu_halves_threads(self):
+		StubSplunkd.cpu_pct = 95.0
+		self.assertEqual(self.throttle.checkPressure(), 'high')
+		self.throttle.adjust('high')
+		self.assertEqual(self.queue.threads_at_once, 10)
+
+	def test_full_queue_is_pressure(self):
+		StubSplunkd.queue_fill_pct = 90.0
+		self.assertEqual(self.throttle.pollOnce(), 'high')
+		self.assertEqual(self.queue.threads_at_once, 10)
+
+	def test_idle_steps_back_up(self):
+		self.queue.threads_at_once = 5
+		self.assertEqual(self.throttle.pollOnce(), 'low')
+		self.assertEqual(self.queue.threads_at_once, 10)
+		for x in range(5):
+			self.throttle.pollOnce()
+		self.assertEqual(self.queue.threads_at_once, 20)
+
+	def test_in_between_leaves_threads(self):
+		StubSplunkd.cpu_pct = 65.0
+		self.assertEqual(self.throttle.pollOnce(), 'normal')
+		self.assertEqual(self.queue.threads_at_once, 20)
+
+	def test_wedged_splunkd_is_busy(self):
+		StubSplunkd.delay_sec = 3
+		started = time.monotonic()
+		self.assertEqual(self.throttle.pollOnce(), 'high')
+		self.assertLess(time.monotonic() - started, 2.5)
+		self.assertEqual(self.queue.threads_at_once, 10)
+
+	def test_unreachable_splunkd_leaves_limits(self):
+		throttle = wrst.SplunkLoadThrottle('test_down', wapi.SplunkService('http://127.0.0.1', 1, 'admin', 'changeme'), self.queue, max_threads=20, request_timeout_sec=1)
+		self.assertEqual(throttle.pollOnce(), 'unknown')
+		self.assertEqual(self.queue.threads_at_once, 20)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,82 @@
+##############################################################################################################
+# wr_logging.StatusStore - when a csv changed outside the store is (and isn't) taken into the db
+#   python3 -m unittest discover -s tests     (from the folder sabb.py is in)
+##############################################################################################################
+
+### Imports
+import os, sys, csv, time, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import wr_logging as log
+
+HEADER = ['File_Name', 'Expected_File_Size_bytes', 'Container', 'Downloaded_To', 'Expected_File_Size_MB', 'Download_Complete', 'Downloaded_File_Size_MB']
+
+### Tests ###########################################
+
+class TestStatusStore(unittest.TestCase):
+	def setUp(self):
+		self.start_dir = os.getcwd()
+		self.work_dir = tempfile.mkdtemp()
+		os.chdir(self.work_dir)
+		self.store = None
+
+	def tearDown(self):
+		if self.store:
+			self.store.close()
+		os.chdir(self.start_dir)
+		shutil.rmtree(self.work_dir, ignore_errors=True)
+
+	def openStore(self) -> 'log.StatusStore':
+		self.store = log.StatusStore('report.csv', log_folder='./csv_lists/', prefix_date=False)
+		return(self.store)
+
+	def writeCSV(self, rows:list):
+		time.sleep(0.01) # a new mtime
+		with open('./csv_lists/report.csv', 'w', newline='') as f:
+			writer = csv.writer(f)
+			writer.writerow(HEADER)
+			writer.writerows(rows)
+
+	def downloadComplete(self, store:'log.StatusStore', blob_name:str) -> str:
+		return(store.getValueByHeaders('File_Name', blob_name, 'Download_Complete')[1][0])
+
+	def test_csv_from_before_the_db_is_imported(self):
+		os.makedirs('./csv_lists/')
+		self.writeCSV([['a.tsidx', 10, 'c1', '/d/', 0, 'SUCCESS', 0], ['b.tsidx', 10, 'c1', '/d/', 0, '', 0]])
+		store = self.openStore()
+		self.assertEqual(self.downloadComplete(store, 'a.tsidx'), 'SUCCESS')
+		self.assertEqual(len(store.readDataFrame()), 2)
+
+	def test_outside_change_keeps_the_db(self):
+		store = self.openStore()
+		store.writeLinesToCSV([['a.tsidx', 10, 'c1', '/d/', 0, '', 0]], HEADER)
+		store.updateCellsByHeader([('File_Name', 'a.tsidx', 'Container', 'c1', 'Download_Complete', 'SUCCESS')])
+		store.exportCSV()
+		self.writeCSV([['a.tsidx', 10, 'c1', '/d/', 0, '', 0], ['z.tsidx', 10, 'c1', '/d/', 0, '', 0]])
+		self.assertEqual(self.downloadComplete(store, 'a.tsidx'), 'SUCCESS')
+		self.assertEqual(len(store.readDataFrame()), 1)
+		store.exportCSV() # the db goes back out over the changed csv
+		with open('./csv_lists/report.csv') as f:
+			self.assertNotIn('z.tsidx', f.read())
+
+	def test_import_keeps_status_the_csv_left_blank(self):
+		store = self.openStore()
+		store.writeLinesToCSV([['a.tsidx', 10, 'c1', '/d/', 0, '', 0], ['a.tsidx', 10, 'c2', '/d/', 0, '', 0]], HEADER)
+		store.exportCSV()
+		store.updateCellsByHeader([('File_Name', 'a.tsidx', 'Container', 'c2', 'Download_Complete', 'SUCCESS')])
+		self.writeCSV([['a.tsidx', 10, 'c1', '/d/', 0, '', 0], ['a.tsidx', 10, 'c2', '/d/', 0, '', 0], ['b.tsidx', 10, 'c1', '/d/', 0, '', 0]])
+		store.importCSV()
+		df = store.readDataFrame(['File_Name', 'Container', 'Download_Complete'])
+		self.assertEqual(df.values.tolist(), [['a.tsidx', 'c1', ''], ['a.tsidx', 'c2', 'SUCCESS'], ['b.tsidx', 'c1', '']])
+
+	def test_all_digit_container_still_matches(self):
+		os.makedirs('./csv_lists/')
+		self.writeCSV([['a.tsidx', 10, '2023', '/d/', 0, '', 0], ['a.tsidx', 10, '0012', '/d/', 0, '', 0]])
+		store = self.openStore()
+		self.assertEqual(store.updateRowsByKeys(['File_Name', 'Container'], {('a.tsidx', '2023'): {'Download_Complete': 'SUCCESS'}}), 1)
+		self.assertTrue(store.updateCellsByHeader([('File_Name', 'a.tsidx', 'Container', '0012', 'Downloaded_File_Size_MB', '1.5')]))
+		df = store.readDataFrame(['Container', 'Download_Complete', 'Downloaded_File_Size_MB'])
+		self.assertEqual(df.values.tolist(), [['2023', 'SUCCESS', 0], ['0012', '', '1.5']])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,408 @@
+##############################################################################################################
+# wr_thread_queue - Queue, FairShare, JobHistory / JobCursor with plain python jobs
+#   python3 -m unittest discover -s tests     (from the folder sabb.py is in)
+##############################################################################################################
+
+### Imports
+import os, sys, time, shutil, tempfile, threading, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import wr_thread_queue as wrq
+
+### Helpers ###########################################
+
+def waitFor(condition, timeout_sec=10) -> bool:
+	started = time.monotonic()
+	while not condition():
+		if time.monotonic() - started > timeout_sec:
+			return(False)
+		time.sleep(0.01)
+	return(True)
+
+class QueueTestCase(unittest.TestCase):
+	def setUp(self):
+		self.start_dir = os.getcwd()
+		self.work_dir = tempfile.mkdtemp()
+		os.chdir(self.work_dir) # ./logs/ goes here
+		self.queues = []
+
+	def tearDown(self):
+		for queue in self.queues:
+			with queue.job_condition:
+				queue.workers_exit = True
+				queue.job_condition.notify_all()
+		os.chdir(self.start_dir)
+		shutil.rmtree(self.work_dir, ignore_errors=True)
+
+	def makeQueue(self, threads_at_once=1, **kwargs) -> 'wrq.Queue':
+		queue = wrq.Queue('test_' + str(len(self.queues)), threads_at_once, **kwargs)
+		self.queues.append(queue)
+		return(queue)
+
+	def startQueue(self, queue:'wrq.Queue'):
+		threading.Thread(target=queue.start, daemon=True).start()
+		waitFor(lambda: queue.worker_count >= queue.threads_at_once)
+
+	def runOrder(self, queue:'wrq.Queue') -> list:
+		'''
+		Starts a paused queue of order.append jobs with one worker and returns the order they ran in
+		'''
+		queue.paused = False
+		self.startQueue(queue)
+		waitFor(lambda: not queue.hasWaiting() and len(queue.jobs_active) == 0)
+		return(self.order)
+
+class BlockingJobsTestCase(QueueTestCase):
+	'''
+	Jobs that hold their slot until self.release is set, counting how many run at once
+	'''
+	def setUp(self):
+		QueueTestCase.setUp(self)
+		self.release = threading.Event()
+		self.count_lock = threading.Lock()
+		self.running = 0
+		self.most_running = 0
+		self.done = []
+
+	def tearDown(self):
+		self.release.set()
+		QueueTestCase.tearDown(self)
+
+	def blockingJob(self, name:str):
+		with self.count_lock:
+			self.running += 1
+			self.most_running = max(self.most_running, self.running)
+		self.release.wait(10)
+		with self.count_lock:
+			self.running -= 1
+			self.done.append(name)
+
+	def jobArgs(self, count:int, first=0) -> list:
+		return([['j' + str(x)] for x in range(first, first + count)])
+
+### Fair share ###########################################
+
+class TestFairShare(QueueTestCase):
+	def setUp(self):
+		QueueTestCase.setUp(self)
+		self.order = []
+
+	def test_add_to_empty_fair_share_queue(self):
+		queue = self.makeQueue()
+		fair_share = queue.setFairShare(lambda args: args[0][0])
+		self.assertEqual(len(fair_share), 0)
+		queue.add(self.order.append, [['a1'], ['b1']])
+		self.assertEqual(len(queue.jobs_waiting), 2)
+		self.assertIs(queue.jobs_waiting, fair_share)
+		self.startQueue(queue)
+		self.assertTrue(waitFor(lambda: len(self.order) == 2))
+
+	def test_shares_take_turns(self):
+		queue = self.makeQueue()
+		queue.paused = True
+		queue.setFairShare(lambda args: args[0][0])
+		queue.add(self.order.append, [['a1'], ['a2'], ['a3'], ['b1'], ['b2']])
+		self.assertEqual(self.runOrder(queue), ['a1', 'b1', 'a2', 'b2', 'a3'])
+
+	def test_aged_job_keeps_its_share_in(self):
+		queue = self.makeQueue(priority_aging_sec=0.2)
+		queue.paused = True
+		queue.setFairShare(lambda args: args[0][-1])
+		queue.add(self.order.append, [['old-p1-a']], priority=1)
+		time.sleep(0.3) # aged past a priority 0 job added now
+		queue.add(self.order.append, [['b0-b'], ['b1-b'], ['b2-b'], ['b3-b']])
+		queue.add(self.order.append, [['new-p0-a']])
+		self.assertEqual(self.runOrder(queue), ['old-p1-a', 'b0-b', 'new-p0-a', 'b1-b', 'b2-b', 'b3-b'])
+
+	def test_better_priority_share_goes_first(self):
+		queue = self.makeQueue()
+		queue.paused = True
+		queue.setFairShare(lambda args: args[0][0])
+		queue.add(self.order.append, [['a1'], ['a2']])
+		queue.add(self.order.append, [['b1'], ['b2']], priority=-1)
+		self.assertEqual(self.runOrder(queue), ['b1', 'b2', 'a1', 'a2'])
+
+### Worker pool ###########################################
+
+class TestWorkerPool(BlockingJobsTestCase):
+	def test_pool_runs_threads_at_once(self):
+		queue = self.makeQueue(3)
+		queue.add(self.blockingJob, self.jobArgs(6))
+		self.startQueue(queue)
+		self.assertTrue(waitFor(lambda: self.running == 3))
+		time.sleep(0.1)
+		self.assertEqual(self.running, 3)
+		self.assertEqual(queue.worker_count, 3)
+		self.assertEqual(len(queue.jobs_waiting), 3)
+		self.release.set()
+		self.assertTrue(waitFor(lambda: len(self.done) == 6))
+		self.assertEqual(self.most_running, 3)
+
+	def test_live_resize(self):
+		queue = self.makeQueue(2)
+		queue.add(self.blockingJob, self.jobArgs(6))
+		self.startQueue(queue)
+		self.assertTrue(waitFor(lambda: self.running == 2))
+		queue.increaseThreadsTo(4)
+		self.assertTrue(waitFor(lambda: self.running == 4)) # the new workers take waiting jobs straight away
+		self.assertEqual(queue.worker_count, 4)
+		queue.increaseThreadsTo(1)
+		self.release.set()
+		self.assertTrue(waitFor(lambda: len(self.done) == 6))
+		self.assertTrue(waitFor(lambda: queue.worker_count == 1)) # extra workers leave once their job is done
+		self.most_running = 0
+		queue.add(self.blockingJob, self.jobArgs(3, 6))
+		self.assertTrue(waitFor(lambda: len(self.done) == 9))
+		self.assertEqual(self.most_running, 1)
+
+	def test_pause_and_resume(self):
+		queue = self.makeQueue(2)
+		queue.add(self.blockingJob, self.jobArgs(3))
+		self.startQueue(queue)
+		self.assertTrue(waitFor(lambda: self.running == 2))
+		queue.pause(block=False)
+		self.release.set()
+		self.assertTrue(waitFor(lambda: len(self.done) == 2))
+		time.sleep(0.2)
+		self.assertEqual(len(self.done), 2) # active jobs finished, nothing new taken
+		self.assertTrue(queue.hasWaiting())
+		self.assertTrue(queue.resume())
+		self.assertTrue(waitFor(lambda: len(self.done) == 3))
+		self.assertFalse(queue.resume())
+
+	def test_inactive_timeout_ends_the_queue(self):
+		queue = self.makeQueue(2, inactive_queue_timeout_sec=1)
+		self.release.set()
+		queue.add(self.blockingJob, self.jobArgs(2))
+		queue_thread = threading.Thread(target=queue.start, daemon=True)
+		queue_thread.start()
+		queue_thread.join(10)
+		self.assertFalse(queue_thread.is_alive())
+		self.assertEqual(sorted(self.done), ['j0', 'j1'])
+		self.assertTrue(waitFor(lambda: queue.worker_count == 0))
+
+	def test_stop_drops_waiting_jobs(self):
+		queue = self.makeQueue(1)
+		queue.add(self.blockingJob, self.jobArgs(3))
+		queue_thread = threading.Thread(target=queue.start, daemon=True)
+		queue_thread.start()
+		self.assertTrue(waitFor(lambda: self.running == 1))
+		queue.stop()
+		self.assertTrue(waitFor(lambda: not queue.hasWaiting()))
+		self.release.set() # the active job is waited for
+		queue_thread.join(10)
+		self.assertFalse(queue_thread.is_alive())
+		self.assertEqual(self.done, ['j0'])
+		self.assertTrue(waitFor(lambda: queue.worker_count == 0))
+
+### Job sources ###########################################
+
+class TestJobSources(BlockingJobsTestCase):
+	def setUp(self):
+		BlockingJobsTestCase.setUp(self)
+		self.pulled = 0
+
+	def source(self, count:int):
+		'''
+		Generator of job args that records how far it's been read
+		'''
+		for args in self.jobArgs(count):
+			self.pulled += 1
+			yield args
+
+	def test_source_pulled_as_slots_free(self):
+		queue = self.makeQueue(2)
+		queue.add(self.blockingJob, self.source(5))
+		self.assertEqual(self.pulled, 0) # nothing read until a worker has room
+		self.assertTrue(queue.hasWaiting())
+		self.assertEqual(len(queue.jobs_waiting), 0)
+		self.startQueue(queue)
+		self.assertTrue(waitFor(lambda: self.running == 2))
+		time.sleep(0.1)
+		self.assertEqual(self.pulled, 2)
+		self.release.set()
+		self.assertTrue(waitFor(lambda: len(self.done) == 5))
+		self.assertEqual(self.pulled, 5)
+		self.assertFalse(queue.hasWaiting())
+		self.assertEqual(self.most_running, 2)
+
+	def test_waiting_jobs_go_before_sources(self):
+		queue = self.makeQueue(1)
+		queue.paused = True
+		self.release.set()
+		queue.add(self.blockingJob, self.source(2))
+		queue.add(self.blockingJob, [['listed']])
+		queue.paused = False
+		self.startQueue(queue)
+		self.assertTrue(waitFor(lambda: len(self.done) == 3))
+		self.assertEqual(self.done, ['listed', 'j0', 'j1'])
+
+	def test_clear_jobs_drops_unread_source(self):
+		queue = self.makeQueue(1)
+		queue.add(self.blockingJob, self.source(5))
+		self.startQueue(queue)
+		self.assertTrue(waitFor(lambda: self.running == 1))
+		queue.clearJobs(wait_for_complete=True) # don't wait on the running job
+		self.assertEqual(len(queue.job_sources), 0)
+		self.assertFalse(queue.hasWaiting())
+		self.release.set()
+		self.assertTrue(waitFor(lambda: len(self.done) == 1))
+		time.sleep(0.1)
+		self.assertEqual(self.done, ['j0'])
+		self.assertEqual(self.pulled, 1) # the rest of the generator was never read
+
+### Job history ###########################################
+
+def completedJob(name:str, seconds=1.0, job_bytes=0) -> 'wrq.CompletedJob':
+	return(wrq.CompletedJob(wrq.Job(print, [name], name), seconds, job_bytes))
+
+class TestJobHistory(unittest.TestCase):
+	def test_ring_buffer_keeps_the_last_records(self):
+		history = wrq.JobHistory(3)
+		for x in range(5):
+			history.append(completedJob('j' + str(x)))
+		self.assertEqual(len(history), 5)
+		self.assertEqual([c.name for c in history], ['j2', 'j3', 'j4'])
+		self.assertEqual([c.name for c in history.recent(2)], ['j3', 'j4'])
+
+	def test_totals_are_all_time(self):
+		history = wrq.JobHistory(2)
+		for x in range(1, 5):
+			history.append(completedJob('j' + str(x), seconds=x, job_bytes=x * 100))
+		self.assertEqual(history.total_bytes, 1000)
+		self.assertEqual(history.total_seconds, 10)
+		self.assertEqual(history.meanSeconds(), 2.5) # evicted jobs still count
+		self.assertEqual(history.stats()['count'], 4)
+		history.clear()
+		self.assertEqual((len(history), history.total_bytes, history.meanSeconds()), (0, 0, 0.0))
+
+	def test_percentiles_of_the_ring(self):
+		history = wrq.JobHistory(100)
+		self.assertEqual(history.percentileSeconds(50), 0.0)
+		for x in [1000] + list(range(100, 0, -1)): # the 1000 is pushed out
+			history.append(completedJob('j' + str(x), seconds=x))
+		self.assertEqual(history.percentileSeconds(50), 50)
+		self.assertEqual(history.percentileSeconds(95), 95)
+		self.assertEqual(history.percentileSeconds(99), 99)
+		self.assertEqual(history.percentileSeconds(100), 100)
+		self.assertEqual(history.percentileSeconds(0.5), 1)
+		job_stats = history.stats()
+		self.assertEqual((job_stats['p50_sec'], job_stats['p95_sec'], job_stats['p99_sec']), (50, 95, 99))
+
+	def test_cursor_gets_completions_from_when_it_was_made(self):
+		history = wrq.JobHistory(10)
+		history.append(completedJob('before'))
+		cursor = history.cursor()
+		self.assertFalse(cursor.wait(0))
+		history.append(completedJob('after_1'))
+		history.append(completedJob('after_2'))
+		self.assertTrue(cursor.wait(0))
+		self.assertEqual(cursor.pending(), 2)
+		self.assertEqual([c.name for c in cursor.read(max_records=1)], ['after_1'])
+		self.assertTrue(cursor.wait(0)) # still one unread
+		self.assertEqual([c.name for c in cursor.read()], ['after_2'])
+		self.assertFalse(cursor.wait(0))
+		self.assertEqual(cursor.read(), [])
+		cursor.close()
+		history.append(completedJob('closed'))
+		self.assertEqual(cursor.pending(), 0)
+
+	def test_cursor_reads_each_once_across_concurrent_appends(self):
+		history = wrq.JobHistory(10) # far smaller than what goes through it
+		cursor = history.cursor()
+		writers, per_writer = 4, 500
+		read = []
+
+		def writer(writer_name:str):
+			for x in range(per_writer):
+				history.append(completedJob(writer_name + '_' + str(x)))
+
+		def reader():
+			while len(read) < writers * per_writer:
+				if cursor.wait(5):
+					read.extend(c.name for c in cursor.read(max_records=7))
+
+		threads = [threading.Thread(target=writer, args=('w' + str(x),)) for x in range(writers)]
+		reader_thread = threading.Thread(target=reader, daemon=True)
+		reader_thread.start()
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		reader_thread.join(10)
+		self.assertFalse(reader_thread.is_alive())
+		self.assertEqual(len(read), writers * per_writer)
+		self.assertEqual(len(set(read)), writers * per_writer)
+		for x in range(writers): # and each writer's in the order it appended them
+			writer_names = [name for name in read if name.startswith('w' + str(x) + '_')]
+			self.assertEqual(writer_names, ['w' + str(x) + '_' + str(y) for y in range(per_writer)])
+		self.assertEqual(len(history), writers * per_writer)
+		self.assertEqual(cursor.pending(), 0)
+
+### Priority ###########################################
+
+class TestPriority(QueueTestCase):
+	def setUp(self):
+		QueueTestCase.setUp(self)
+		self.order = []
+
+	def test_lower_priority_runs_first(self):
+		queue = self.makeQueue()
+		queue.paused = True
+		queue.add(self.order.append, [['a1'], ['a2']])
+		queue.add(self.order.append, [['c']], priority=1)
+		queue.add(self.order.append, [['b']], priority=-1)
+		queue.add(self.order.append, [['p-2'], ['p5']], priority_function=lambda args: int(args[0][1:]))
+		self.assertEqual(self.runOrder(queue), ['p-2', 'b', 'a1', 'a2', 'c', 'p5'])
+
+	def test_sort_key(self):
+		queue = self.makeQueue()
+		job = queue.makeJob(print, ['x'], priority=2)
+		self.assertEqual(queue.sortKey(job), 2)
+		aging_queue = self.makeQueue(priority_aging_sec=30)
+		job = aging_queue.makeJob(print, ['x'], priority=2)
+		self.assertEqual(aging_queue.sortKey(job), 60 + job.enqueue_time) # each priority step is 30 seconds of waiting
+
+	def test_aging_lets_old_jobs_through(self):
+		for priority_aging_sec, expected_order in [(0, ['new-p0', 'old-p1']), (0.2, ['old-p1', 'new-p0'])]:
+			self.order = []
+			queue = self.makeQueue(priority_aging_sec=priority_aging_sec)
+			queue.paused = True
+			queue.add(self.order.append, [['old-p1']], priority=1)
+			time.sleep(0.3) # longer than one priority step
+			queue.add(self.order.append, [['new-p0']])
+			self.assertEqual(self.runOrder(queue), expected_order)
+
+	def test_reprioritize_rebuilds_the_heap(self):
+		queue = self.makeQueue()
+		queue.paused = True
+		queue.add(self.order.append, [['x1'], ['x2'], ['x3'], ['x4']])
+		self.assertEqual(queue.reprioritize(lambda args: args[0] in ('x3', 'x4'), -1), 2)
+		self.assertEqual(queue.reprioritize(lambda args: args[0] == 'x3', -1), 0) # already there
+		self.assertEqual(queue.reprioritize(lambda args: args[0].missing, 5), 0) # match_function errors don't match
+		self.assertEqual(len(queue.jobs_waiting), 4)
+		self.assertEqual(self.runOrder(queue), ['x3', 'x4', 'x1', 'x2'])
+
+	def test_reprioritize_keeps_the_aging(self):
+		queue = self.makeQueue(priority_aging_sec=10)
+		queue.paused = True
+		queue.add(self.order.append, [['x1'], ['x2']])
+		job = queue.jobs_waiting[0][2]
+		queue.reprioritize(lambda args: args[0] == 'x2', 1)
+		entries = sorted(queue.jobs_waiting)
+		self.assertEqual([entry[2].args[0] for entry in entries], ['x1', 'x2'])
+		self.assertEqual(entries[1][0], 10 + entries[1][2].enqueue_time) # new priority, same time waited
+		self.assertEqual(entries[0][0], job.enqueue_time)
+
+	def test_reprioritize_rebuilds_the_fair_share(self):
+		queue = self.makeQueue()
+		queue.paused = True
+		fair_share = queue.setFairShare(lambda args: args[0][0])
+		queue.add(self.order.append, [['a1'], ['a2'], ['b1'], ['b2']])
+		self.assertEqual(queue.reprioritize(lambda args: args[0].startswith('b'), -1), 2)
+		self.assertIs(queue.jobs_waiting, fair_share)
+		self.assertEqual(fair_share.waitingByShare(), {'a': 2, 'b': 2})
+		self.assertEqual(self.runOrder(queue), ['b1', 'b2', 'a1', 'a2'])
+
+if __name__ == "__main__":
+	unittest.main()